@@ -3,7 +3,8 @@
 
 import sys
 sys.path.append("./")
-from POP3D_Reader import Trial
+from POP3D_Reader import Dataset3DPOP, VideoReader, ImageDecode, AnnotationShards
+from POP3D_Reader.Sampler import StratifiedSampler
 import os
 import cv2
 import numpy as np
@@ -12,140 +13,78 @@ import pandas as pd
 import random
 from tqdm import tqdm
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 random.seed(10)
 
 
-def GetInstancePerTrial(MetaDataDir,DatasetDir,TrainNum,ValRatio,TestRatio):
+def GetInstancePerTrial(MetaDataDir,DatasetDir,TrainNum,ValRatio,TestRatio, Catalog=None, Sampler=None, Seed=10):
     """
-    Given number of training images, determine how many images to sample for each trial
-    * Assume equal number of images for each individual num (1,2,5,10)
-    """
-    Metadf = pd.read_csv(MetaDataDir,dtype=str)
-    #Types of individual number:
-    IndividualNumType = sorted(list(set(Metadf["IndividualNum"].to_list())))
-    NumPerType = math.ceil(TrainNum/len(IndividualNumType))
-    print("Number of images per individual number types: %i" %(NumPerType))
-    TotalNumToSampleDict = {"Train":NumPerType,"Val":NumPerType*ValRatio,"Test":NumPerType*TestRatio}
-    
-    
-    ##Prepare out dicts
-    TrainImgtoSampleDict = {}
-    ValImgtoSampleDict = {}
-    TestImgtoSampleDict = {}
-    ImgtoSampleDicts = {"Train":TrainImgtoSampleDict,"Val":ValImgtoSampleDict,"Test":TestImgtoSampleDict}
-    
-    ##ImageSampled:
-    TrainImgSampled = {'1':0,'2':0,'5':0,'10':0}
-    ValImgSampled ={'1':0,'2':0,'5':0,'10':0}
-    TestImgSampled = {'1':0,'2':0,'5':0,'10':0}
-    ImgSampledDict = {"Train":TrainImgSampled,"Val":ValImgSampled,"Test":TestImgSampled}
-    
-    Types = ["Train", "Val","Test"]
-    
-    for IndNum in IndividualNumType:
-        #Subset df for this ind number
-        IndDF = Metadf.loc[Metadf["IndividualNum"] == IndNum]
-        ImgtoSampleTrain = math.ceil(NumPerType/len(IndDF))
-        ImgtoSampleVal = math.ceil(ImgtoSampleTrain*ValRatio)
-        ImgtoSampleTest = math.ceil(ImgtoSampleTrain*TestRatio)
-        
-        #Number of images to sample for each type:
-        TypeNums = {"Train":ImgtoSampleTrain,"Val":ImgtoSampleVal,"Test":ImgtoSampleTest}
-
-        TotalNumCounter = {"Train":0, "Val":0, "Test":0} #Counter to keep track of total frames sampled for certain type
-        print("Calculating %s Individuals:"%IndNum)
-        for index, row in tqdm(IndDF.iterrows()):
-            PigeonTrial = Trial.Trial(DatasetDir,row["Sequence"])
-            for Type in Types:            
-                PigeonTrial.load3DPopTrainingSet(Filter = True, Type = Type)
-                #Find frames where all camera views no NA
-                FramesList = []
-                for camObj in PigeonTrial.camObjects:
-                    FramesList.append(camObj.Keypoint2D.dropna(axis=0)["frame"].to_list())
-                NoNAFrameList = sorted(list(set(FramesList[0]) & set(FramesList[1]) & set(FramesList[2])& set(FramesList[3])))
-                
-                # if IndNum == "10":
-                #     import ipdb;ipdb.set_trace()
-                
-                if IndNum == "10" and row["Sequence"] == "59": #if 10 just sample all
-                    #Sample all:
-                    # ImgtoSampleDicts[Type].update({int(row["Sequence"]):len(NoNAFrameList)})
-                    # TotalNumCounter[Type] += len(NoNAFrameList)
-                    # ImgSampledDict[Type][IndNum] += len(NoNAFrameList)
-                    
-                    ##Smaple till enough:
-                    # import ipdb;ipdb.set_trace()
-                    SampleValue = (TotalNumToSampleDict[Type]- TotalNumCounter[Type])
-                    ImgtoSampleDicts[Type].update({int(row["Sequence"]):(SampleValue)})
-                    TotalNumCounter[Type] +=SampleValue
-                    ImgSampledDict[Type][IndNum] +=SampleValue
-                    continue
-
-                
-                if len(NoNAFrameList) > TypeNums[Type]: #if have plenty frames to sample from
-                    ImgtoSampleDicts[Type].update({int(row["Sequence"]):TypeNums[Type]})
-                    TotalNumCounter[Type]+=TypeNums[Type]
-                    ImgSampledDict[Type][IndNum] += TypeNums[Type]
-                    
-                elif TotalNumCounter[Type] + len(NoNAFrameList) > TotalNumToSampleDict[Type]: #if after this trial can have enough, dont sample all, just get enough
-                    SampleValue = (TotalNumToSampleDict[Type]- TotalNumCounter[Type])
-                    ImgtoSampleDicts[Type].update({int(row["Sequence"]):(SampleValue)})
-                    TotalNumCounter[Type] +=SampleValue
-                    ImgSampledDict[Type][IndNum] +=SampleValue
+    Given number of training images, sample frames to save for each trial, to be passed to SampleImages
+    * Assume equal number of images for each individual num (1,2,5,10), see Sampler.StratifiedSampler
+    Catalog: Dataset3DPOP catalog, created from MetaDataDir if not given
+    Sampler: StratifiedSampler, created from Catalog if not given
+    Seed: seed of sampler, if it is created here
 
-                else: #Else just sample all
-                    ImgtoSampleDicts[Type].update({int(row["Sequence"]):len(NoNAFrameList)})
-                    TotalNumCounter[Type] += len(NoNAFrameList)
-                    ImgSampledDict[Type][IndNum] += len(NoNAFrameList)
-
-    for Type in Types:                
-        print(Type)  
-        print("Approx Image to sample: %s"%(TotalNumToSampleDict[Type]))
-        print("Total Images: %s"%ImgSampledDict[Type])
-                    
-                    
-    # import ipdb;ipdb.set_trace()
-    return ImgtoSampleDicts
+    returns {Type: {Sequence: sorted list of frames}}, see StratifiedSampler.Sample
+    """
+    if Sampler is None:
+        if Catalog is None:
+            Catalog = Dataset3DPOP.Dataset3DPOP(DatasetDir, MetaDataPath=MetaDataDir)
+        Sampler = StratifiedSampler(Catalog, Seed = Seed)
+    return Sampler.Sample(TrainNum, ValRatio, TestRatio)
     
-def SaveImages(PigeonTrial, RandomFrames,OutDir,Keypoints,Type, MasterIndexCounter,DictList2D,DictList3D):
-    """For a trial, save frames into output directory and return annotation dict list for 2D and 3D"""
+def SaveImages(PigeonTrial, RandomFrames,OutDir,Keypoints,Type, MasterIndexCounter,DictList2D,DictList3D, CropPad = None,
+               Generator = None, Writer = None):
+    """
+    For a trial, save frames into output directory and return annotation dict list for 2D and 3D
+    CropPad: if not None, also save crop of each bird next to each frame (see ImageDecode.SaveCrops),
+    padded by this fraction of the bbox size, so training can read small crops instead of 4K frames
+    Generator: numpy generator to pick the MixedViews camera, default python random module
+    Writer: ImageDecode.ThreadedImageWriter, images are encoded/ written in its threads while the next frame is decoded,
+            default a writer is created and closed here
+    """
+    CloseWriter = Writer is None
+    if Writer is None:
+        Writer = ImageDecode.ThreadedImageWriter()
     CamObjList = []
-    CapList = []
     SaveDirList = []
 
     for camObj in PigeonTrial.camObjects:
         CamObjList.append(camObj)
-        CapList.append(cv2.VideoCapture(camObj.VideoPath))
         SaveDirList.append(os.path.join(OutDir,camObj.CamName))
         
         
     SeqName = PigeonTrial.TrialName
-    counter = 0
+    #all cameras are decoded in parallel, only sampled frames are decoded,
+    #small gaps are skipped with grab(), large gaps seek to the closest keyframe
+    FrameSet = set(RandomFrames)
+    Reader = VideoReader.MultiVideoReader([camObj.VideoPath for camObj in CamObjList], Frames = sorted(FrameSet))
 
-    while True:
-        # print(counter)
-        FrameList = [cap.read() for cap in CapList]
-        # print(ret)
-                
-        if FrameList[0][0] == True:
-            if counter in RandomFrames: 
+    try:
+        for counter, ImageList in Reader:
+            if counter in FrameSet and any(img is None for img in ImageList):
+                print("Frame %s of %s missing in some cameras, skipped"%(counter, SeqName))
+            elif counter in FrameSet: 
                 ##Frame included in sampled frames:
                 BBoxDataList = []
                 Data2DList = []
-                
+            
                 for x in range(len(CamObjList)):
-                    cv2.imwrite(os.path.join(SaveDirList[x],"%s-F%s.jpg"%(SeqName,counter)),FrameList[x][1])
+                    SaveImgPath = os.path.join(SaveDirList[x],"%s-F%s.jpg"%(SeqName,counter))
+                    Writer.write(SaveImgPath,ImageList[x])
 
                     #BBox Data
                     BBoxData =  {ID:list(CamObjList[x].GetBBoxData(CamObjList[x].BBox, counter, ID)) for ID in PigeonTrial.Subjects} 
                     BBoxData = {ID:[val[0][0],val[0][1],val[1][0],val[1][1]] for ID,val in BBoxData.items()}
                     BBoxDataList.append(BBoxData)
-                    
+                    if CropPad is not None:
+                        ImageDecode.SaveCrops(ImageList[x], BBoxData, SaveImgPath, CropPad, Writer)
+                
                     #2D Data
                     Data2D =  {ID:CamObjList[x].Read2DKeypointData(CamObjList[x].Keypoint2D, counter, ID,Keypoints,StripName=True) for ID in PigeonTrial.Subjects} 
                     Data2DList.append(Data2D)
 
-                    
+                
                 ##3D Data
                 Data3D =  {ID:CamObjList[x].Read3DKeypointData(CamObjList[x].Keypoint3D, counter, ID,Keypoints,StripName=True) for ID in PigeonTrial.Subjects} 
                 CameraDictList = []
@@ -156,7 +95,7 @@ def SaveImages(PigeonTrial, RandomFrames,OutDir,Keypoints,Type, MasterIndexCount
                     CameraDict["BBox"]=BBoxDataList[x]
                     CameraDict["Keypoint2D"]= Data2DList[x]
                     CameraDictList.append(CameraDict)
-                
+            
                 ##Save 3D all data
                 DictList3D.append({
                     "Image-ID" : MasterIndexCounter, 
@@ -164,11 +103,16 @@ def SaveImages(PigeonTrial, RandomFrames,OutDir,Keypoints,Type, MasterIndexCount
                     "Keypoint3D": Data3D,
                     "CameraData": CameraDictList
                 })
-                
+            
                 #2D Data, sample random view between all cameras
-                RandomCamIndex = random.sample(list(range(len(CamObjList))),1)[0]
+                if Generator is None:
+                    RandomCamIndex = random.sample(list(range(len(CamObjList))),1)[0]
+                else:
+                    RandomCamIndex = int(Generator.integers(len(CamObjList)))
                 SaveImgPath = os.path.join(OutDir,"MixedViews","%s-%s-F%s.jpg"%(CamObjList[RandomCamIndex].CamName, SeqName,counter))
-                cv2.imwrite(SaveImgPath,FrameList[RandomCamIndex][1])
+                Writer.write(SaveImgPath,ImageList[RandomCamIndex])
+                if CropPad is not None:
+                    ImageDecode.SaveCrops(ImageList[RandomCamIndex], BBoxDataList[RandomCamIndex], SaveImgPath, CropPad, Writer)
 
                 DictList2D.append({
                     "Image-ID" : MasterIndexCounter, 
@@ -181,21 +125,44 @@ def SaveImages(PigeonTrial, RandomFrames,OutDir,Keypoints,Type, MasterIndexCount
                 # import ipdb;ipdb.set_trace()
 
                 MasterIndexCounter +=1
-
-            counter +=1
-            # print(counter)  
-        elif counter == 0:
-            import ipdb;ipdb.set_trace()
-            print("weird, cant read first frame from video")
-            continue
-        else:
-            #end of video, write video
-            break
-            
-    Release = [cap.release() for cap in CapList]
+    finally:
+        #decode threads are stopped and images written even if saving a frame fails
+        Reader.close()
+        if CloseWriter:
+            Writer.close()
     return DictList3D,DictList2D,MasterIndexCounter
 
 
+def SampleSequence(Catalog, Seq, RandomFrames, OutDir, Keypoints, Type, CropPad, Seed, WriteThreads, ShardPaths=None):
+    """
+    Worker of SampleImages, saves sampled frames of one sequence
+    The MixedViews camera is picked by a generator seeded with (Seed, Seq), so output does not depend
+    on which process runs the sequence or in which order
+    ShardPaths: (3D shard, 2D shard), if given records are streamed into these JSON Lines shards
+    returns 3D and 2D annotation dict lists, Image-IDs counted from 0, or number of records of each shard
+    """
+    PigeonTrial = Catalog.GetTrial(Seq)
+    PigeonTrial.load3DPopTrainingSet(Filter = True, Type = Type)
+    Generator = np.random.default_rng([Seed, Seq])
+    if ShardPaths is None:
+        DictList3D, DictList2D = [], []
+    else:
+        DictList3D, DictList2D = AnnotationShards.ShardWriter(ShardPaths[0]), AnnotationShards.ShardWriter(ShardPaths[1])
+    try:
+        with ImageDecode.ThreadedImageWriter(Workers = WriteThreads) as Writer:
+            SaveImages(PigeonTrial, RandomFrames, OutDir, Keypoints, Type, 0, DictList2D=DictList2D, DictList3D=DictList3D,
+                       CropPad=CropPad, Generator=Generator, Writer=Writer)
+    except BaseException:
+        if ShardPaths is not None:
+            DictList3D.abort()
+            DictList2D.abort()
+        raise
+    if ShardPaths is None:
+        return DictList3D, DictList2D
+    #images are all written, shards can be finished
+    return DictList3D.close(), DictList2D.close()
+
+
 #Temp arguments:
 # DatasetDir = DatasetDir
 # OutDir = TrainDir
@@ -203,11 +170,25 @@ def SaveImages(PigeonTrial, RandomFrames,OutDir,Keypoints,Type, MasterIndexCount
 # AnnotationDir = AnnotationDir
 # Type = "Train"
 
-def SampleImages(DatasetDir,OutDir,ImgDict, AnnotationDir, Keypoints,Type):
+def SampleImages(DatasetDir,OutDir,FrameDict, AnnotationDir, Keypoints,Type, Catalog=None, CropPad=None,
+                 Processes=None, Seed=10, WriteThreads=4, Streaming=False):
     """
     Sample images for a type (train/val/test) and save annotation as json
     Extracts both 3D and 2D ground truth
+    FrameDict: {Sequence: list of frames to save}, see StratifiedSampler.Sample
+    Catalog: Dataset3DPOP catalog, created from DatasetDir if not given
+    CropPad: if not None, save per bird crops padded by this fraction of the bbox, see SaveImages
+    Processes: number of processes, sequences are sampled in parallel, default number of cpus, 1 to run in this process
+    Seed: seed of MixedViews camera choice, see SampleSequence
+    WriteThreads: number of image writing threads per process
+    Streaming: if True, annotations are streamed into one JSON Lines shard per sequence
+               (AnnotationDir/Type-3D and Type-2D, read with ImageReader on their manifest.json) instead of two big jsons.
+               Memory stays flat, and a rerun after a crash only samples sequences without finished shards
+    
+    Annotations are merged in order of FrameDict, so the json does not depend on number of processes
     """
+    if Catalog is None:
+        Catalog = Dataset3DPOP.Dataset3DPOP(DatasetDir)
     
     if not os.path.exists(os.path.join(OutDir,"Cam1")):
         os.mkdir(os.path.join(OutDir,"Cam1"))
@@ -215,48 +196,70 @@ def SampleImages(DatasetDir,OutDir,ImgDict, AnnotationDir, Keypoints,Type):
         os.mkdir(os.path.join(OutDir,"Cam3"))
         os.mkdir(os.path.join(OutDir,"Cam4"))
         os.mkdir(os.path.join(OutDir,"MixedViews"))
-    else:
+    elif not Streaming:
         print("Directories already exist! Ensure Folders are cleared!!")
 
+    Info3D = {
+        "Description":"Sampled 3D ground truth Data from 3D-POP dataset",
+        "Collated by": "Alex Chan",
+        "Date":"06/02/2023",
+        "Keypoints": Keypoints,
+        "TotalImages": sum([len(Frames) for Frames in FrameDict.values()]),
+        "CropPad": CropPad
+    }
+    Info2D = dict(Info3D, Description = "Sampled 2D ground truth Data from 3D-POP dataset")
+
+    Sequences = [Seq for Seq, RandomFrames in FrameDict.items() if len(RandomFrames) > 0]
+    WorkerArgs = {Seq:[Catalog, Seq, FrameDict[Seq], OutDir, Keypoints, Type, CropPad, Seed, WriteThreads] for Seq in Sequences}
+
+    if Streaming:
+        Keys = {Seq:Catalog.GetTrialName(Seq) for Seq in Sequences}
+        Manifests = [AnnotationShards.ShardManifest(AnnotationShards.GetShardDir(AnnotationDir, Type, "3D"), Info3D, list(Keys.values())),
+                     AnnotationShards.ShardManifest(AnnotationShards.GetShardDir(AnnotationDir, Type, "2D"), Info2D, list(Keys.values()))]
+        ToDo = [Seq for Seq in Sequences if not all(Manifest.HasShard(Keys[Seq]) for Manifest in Manifests)]
+        if len(ToDo) < len(Sequences):
+            print("Resuming, %i of %i sequences already sampled"%(len(Sequences)-len(ToDo), len(Sequences)))
+        for Seq in ToDo:
+            WorkerArgs[Seq].append([Manifest.GetShardPath(Keys[Seq]) for Manifest in Manifests])
+
+        def AddShards(Seq, Counts):
+            for Manifest, Count in zip(Manifests, Counts):
+                Manifest.AddShard(Keys[Seq], Count)
+
+        if Processes == 1:
+            for Seq in tqdm(ToDo):
+                AddShards(Seq, SampleSequence(*WorkerArgs[Seq]))
+        else:
+            with ProcessPoolExecutor(max_workers=Processes) as Executor:
+                Futures = {Executor.submit(SampleSequence, *WorkerArgs[Seq]):Seq for Seq in ToDo}
+                #manifest is updated as soon as a sequence is done, so finished work survives a crash
+                for Future in tqdm(as_completed(Futures), total=len(Futures)):
+                    AddShards(Futures[Future], Future.result())
+        return
+
     MasterIndexCounter = 0
     DictList2D = []
     DictList3D = []    
     
-    for Seq, NumImg in tqdm(ImgDict.items()):
-        if NumImg == 0:
-            continue
-        
-        PigeonTrial = Trial.Trial(DatasetDir,Seq)
-        PigeonTrial.load3DPopTrainingSet(Filter = True, Type = Type)
-        
-        #Find frames where all camera views no NA
-        FramesList = []
-        for camObj in PigeonTrial.camObjects:
-            FramesList.append(camObj.Keypoint2D.dropna(axis=0)["frame"].to_list())
-        # import ipdb;ipdb.set_trace()
-        NoNAFrameList = sorted(list(set(FramesList[0]) & set(FramesList[1]) & set(FramesList[2])& set(FramesList[3])))
-        
-        # if len(NoNAFrameList) == 0:
-        #     continue
-        if (NumImg/len(NoNAFrameList))*100 > 100: #if not enough images, just get all images from that trial
-            import ipdb;ipdb.set_trace()
-
-        print(Seq)
-        print("Sampling %s %% of frames present in sequence" %((NumImg/len(NoNAFrameList))*100))
-        
-        RandomFrames = sorted(random.sample(NoNAFrameList,int(NumImg)))
-        
-        DictList3D, DictList2D,MasterIndexCounter = SaveImages(PigeonTrial, RandomFrames,OutDir,Keypoints,Type, MasterIndexCounter,DictList2D,DictList3D)
+    if Processes == 1:
+        Results = [SampleSequence(*WorkerArgs[Seq]) for Seq in tqdm(Sequences)]
+    else:
+        with ProcessPoolExecutor(max_workers=Processes) as Executor:
+            Futures = [Executor.submit(SampleSequence, *WorkerArgs[Seq]) for Seq in Sequences]
+            Results = [Future.result() for Future in tqdm(Futures)]
+    
+    ##Merge in sequence order, Image-IDs continue over sequences
+    for SeqDictList3D, SeqDictList2D in Results:
+        for Dict3D, Dict2D in zip(SeqDictList3D, SeqDictList2D):
+            Dict3D["Image-ID"] = MasterIndexCounter
+            Dict2D["Image-ID"] = MasterIndexCounter
+            DictList3D.append(Dict3D)
+            DictList2D.append(Dict2D)
+            MasterIndexCounter += 1
 
     # import ipdb;ipdb.set_trace()
     OutputDict3D = {
-        "info" : {
-        "Description":"Sampled 3D ground truth Data from 3D-POP dataset",
-        "Collated by": "Alex Chan",
-        "Date":"06/02/2023",
-        "Keypoints": Keypoints,
-        "TotalImages": sum(list(ImgDict.values()))
-    },
+        "info" : Info3D,
       "Annotations":DictList3D}
     
     with open(os.path.join(AnnotationDir,"%s-3D.json"%Type), "w") as outfile:
@@ -264,13 +267,7 @@ def SampleImages(DatasetDir,OutDir,ImgDict, AnnotationDir, Keypoints,Type):
     
     
     OutputDict2D = {
-        "info" : {
-        "Description":"Sampled 2D ground truth Data from 3D-POP dataset",
-        "Collated by": "Alex Chan",
-        "Date":"06/02/2023",
-        "Keypoints": Keypoints,
-        "TotalImages": sum(list(ImgDict.values()))
-    },
+        "info" : Info2D,
       "Annotations":DictList2D}
     
     
@@ -285,16 +282,14 @@ def CopyCalibrationFiles(DatasetDir,OutputDir,MetaDataDir):
     DatasetDir = "/media/alexchan/My Passport/Pop3D-Dataset_Final/"
     OutputDir = "/media/alexchan/My Passport/Pop3D-Dataset_Final/ImageTrainingData/N5000/Calibration/"
     MetaDataDir = os.path.join(DatasetDir,"Pop3DMetadata.csv")
-    Metadf = pd.read_csv(MetaDataDir,dtype=str)
+    Catalog = Dataset3DPOP.Dataset3DPOP(DatasetDir, MetaDataPath=MetaDataDir)
     
     if not os.path.exists(OutputDir):
         os.mkdir(OutputDir)
     
 
-    for Seq in Metadf["Sequence"].tolist():
-        PigeonSeq = Trial.Trial(DatasetDir, int(Seq))
-
-        FileNames = PigeonSeq.GenerateFileNames()
+    for Seq in Catalog.Sequences:
+        FileNames = Catalog.GetFileNames(Seq)
     
         FilesCopy = FileNames["IntrinsicPaths"] + FileNames["ExtrinsicPaths"]
     
@@ -306,13 +301,15 @@ def CopyCalibrationFiles(DatasetDir,OutputDir,MetaDataDir):
     
 
     
-def main(DatasetDir,OutputDir,TrainNum,ValRatio,TestRatio,Keypoints):
+def main(DatasetDir,OutputDir,TrainNum,ValRatio,TestRatio,Keypoints, Seed = 10):
     MetaDataDir = os.path.join(DatasetDir,"Pop3DMetadata.csv")
-    ImgtoSampleDicts= GetInstancePerTrial(MetaDataDir,DatasetDir,TrainNum,ValRatio,TestRatio)
+    Catalog = Dataset3DPOP.Dataset3DPOP(DatasetDir, MetaDataPath=MetaDataDir)
+    #valid frame counts come from validity indexes, re-sampling for another TrainNum does not read videos or csvs
+    FrameDicts = GetInstancePerTrial(MetaDataDir,DatasetDir,TrainNum,ValRatio,TestRatio, Catalog=Catalog, Seed = Seed)
 
-    TrainImgtoSampleDict = ImgtoSampleDicts["Train"]
-    ValImgtoSampleDict = ImgtoSampleDicts["Val"]
-    TestImgtoSampleDict = ImgtoSampleDicts["Test"]
+    TrainFrameDict = FrameDicts["Train"]
+    ValFrameDict = FrameDicts["Val"]
+    TestFrameDict = FrameDicts["Test"]
     
     TrainDir = os.path.join(OutputDir,"Train")
     ValDir = os.path.join(OutputDir,"Val")
@@ -325,9 +322,9 @@ def main(DatasetDir,OutputDir,TrainNum,ValRatio,TestRatio,Keypoints):
         os.mkdir(TestDir)
         os.mkdir(AnnotationDir)
         
-    # SampleImages(DatasetDir,TrainDir,TrainImgtoSampleDict,AnnotationDir,Keypoints,Type = "Train")
-    # SampleImages(DatasetDir,ValDir,ValImgtoSampleDict,AnnotationDir,Keypoints,Type = "Val")
-    SampleImages(DatasetDir,TestDir,TestImgtoSampleDict,AnnotationDir,Keypoints,Type = "Test")
+    # SampleImages(DatasetDir,TrainDir,TrainFrameDict,AnnotationDir,Keypoints,Type = "Train", Catalog=Catalog, Streaming=True)
+    # SampleImages(DatasetDir,ValDir,ValFrameDict,AnnotationDir,Keypoints,Type = "Val", Catalog=Catalog, Streaming=True)
+    SampleImages(DatasetDir,TestDir,TestFrameDict,AnnotationDir,Keypoints,Type = "Test", Catalog=Catalog, Streaming=True)
 
     
 
@@ -5,6 +5,7 @@ Application example of using DLC predictions as a gap filling mechanism for lost
 
 """
 import sys
+sys.path.append('../')
 sys.path.append('./')
 
 from System import systemInit as system
@@ -104,30 +104,6 @@ def DrawBBox(img, roi, roiWidth, roiHeight):
 
     cv.rectangle(img,(roi[1],roi[2]),(roi[0],roi[3]),(255,0,0),2)
 
-def FindClosestFrame(SyncArray, Frame):
-    """
-    Author: Alex Chan
-
-    Given a sony frame and a SyncArray, find closest frame in vicon
-    
-    Will throw error if frame is before first flash
-    """
-    #Index of frame where it is last synced
-    #if minus the current frame, smaller than 1 (i.e any negative number and 0)
-    index = np.where((SyncArray[0]-Frame) <1)[0].argmax()
-    #find proportion of how far the frame is within the gap
-    Prop = (Frame - SyncArray[0][index])/(SyncArray[0][index+1]- SyncArray[0][index])
-
-    #Calculate corresponding vicon frame from the proportion
-    ViconFrame = SyncArray[1][index]+(Prop*(SyncArray[1][index+1] - SyncArray[1][index]))
-
-    return ViconFrame
-
-
-
-
-
-
 class imageAnnotationTool_Manual:
 
     def __init__(self,ImageDir,GroundTruthCSV, OutputCSV,FeatureFile ):
@@ -4,6 +4,7 @@ Reproject output from annotation sequence to 2D views for verification
 """
 
 import sys
+sys.path.append('../')
 sys.path.append('./')
 
 from FileOperations import settingsGenerator
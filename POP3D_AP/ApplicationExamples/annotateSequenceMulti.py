@@ -10,6 +10,7 @@ The code follows following 3 steps.
 """
 
 import sys
+sys.path.append('../')
 sys.path.append('./')
 
 from System import videoVicon
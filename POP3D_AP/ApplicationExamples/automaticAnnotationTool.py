@@ -4,6 +4,10 @@ The automatic annotation tool works in following way. It takes custom 3D feature
 The final projected points are stored in the .csv file to create a database for the image annotations.
 """
 
+import sys
+sys.path.append('../')
+sys.path.append('./')
+
 import cv2 as cv
 from System import systemInit as system
 from FileOperations import settingsGenerator
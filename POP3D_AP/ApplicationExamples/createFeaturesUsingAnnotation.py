@@ -4,6 +4,10 @@ This file shows an example of using the custom 2D annotations and triangulating
 """
 
 
+import sys
+sys.path.append('../')
+sys.path.append('./')
+
 from logging import raiseExceptions
 import cv2 as cv
 import numpy as np
@@ -221,30 +225,6 @@ def CheckSubjectFile(subjects, directoryName):
 
     return FinalSubjects, ReusedSubjects
 
-def FindClosestFrame(SyncArray, Frame):
-    """
-    Author: Alex Chan
-
-    Given a sony frame and a SyncArray, find closest frame in vicon
-    
-    Will throw error if frame is before first flash
-    """
-    # import ipdb;ipdb.set_trace()
-    #Index of frame where it is last synced
-    #if minus the current frame, smaller than 1 (i.e any negative number and 0)
-    index = np.where((SyncArray[0]-Frame) <1)[0].argmax()
-    # index=4
-    #find proportion of how far the frame is within the gap
-    Prop = (Frame - SyncArray[0][index])/(SyncArray[0][index+1]- SyncArray[0][index])
-
-    #Calculate corresponding vicon frame from the proportion
-    ViconFrame = SyncArray[1][index]+(Prop*(SyncArray[1][index+1] - SyncArray[1][index]))
-
-    return ViconFrame
-
-
-
-
 def createTriangulatedFeatures(projectSettings):
     """
     Read the settings from the given file and read
@@ -362,9 +342,12 @@ def createTriangulatedFeatures(projectSettings):
                 #for custom sony: just use cam 1, should all be synced at annotation step anyways
             # RealFrameNo = frameNo - viconCamObjects[0].FrameDiff #for custom sony cameras, theres time lag, correct for it
             # frameNo = frameNo + 163
-            ViconFrameNo = FindClosestFrame(viconCamObjects[0].SyncArray, frameNo)
+            if not viconCamObjects[0].SyncMap.InRange(frameNo):
+                print(" Frame no %i is outside of synchronized range, skipped"%frameNo)
+                continue
+            ViconFrameNo = viconCamObjects[0].SyncMap.ToVicon(frameNo)
             # import ipdb;ipdb.set_trace()
-            coordinateDict = CoordData.getCoordDataForViconFrame(round(ViconFrameNo))
+            coordinateDict = CoordData.getCoordDataForViconFrame(ViconFrameNo)
 
 
             traingulatedFeatureDict3D = defaultTraingulatedFeatureDict3D.copy()
@@ -6,6 +6,10 @@ on the image space.
 """
 #todo: This implementation is imcomplete, one has to add an actual camera to the scene and check the performance.
 
+import sys
+sys.path.append('../')
+sys.path.append('./')
+
 import cv2 as cv
 from System import systemInit as system
 from FileOperations import settingsGenerator
@@ -64,29 +64,6 @@ def DrawBBox(img, roi, roiWidth, roiHeight):
 
     cv.rectangle(img,(roi[1],roi[2]),(roi[0],roi[3]),(255,0,0),2)
 
-def FindClosestFrame(SyncArray, Frame):
-    """
-    Author: Alex Chan
-
-    Given a sony frame and a SyncArray, find closest frame in vicon
-    
-    Will throw error if frame is before first flash
-    """
-    #Index of frame where it is last synced
-    #if minus the current frame, smaller than 1 (i.e any negative number and 0)
-    index = np.where((SyncArray[0]-Frame) <1)[0].argmax()
-    #find proportion of how far the frame is within the gap
-    Prop = (Frame - SyncArray[0][index])/(SyncArray[0][index+1]- SyncArray[0][index])
-
-    #Calculate corresponding vicon frame from the proportion
-    ViconFrame = SyncArray[1][index]+(Prop*(SyncArray[1][index+1] - SyncArray[1][index]))
-
-    return ViconFrame
-
-
-
-
-
 class imageAnnotationTool_Multi:
 
     def __init__(self, projectSettings):
@@ -390,7 +367,7 @@ class imageAnnotationTool_Multi:
             ImgObj = self.imageObjects[i]
             # destroy pre existing windows
             cv.destroyAllWindows()
-            videoObjects.append(vid.VideoVicon(self.videoFiles[i], i))
+            videoObjects.append(vid.VideoVicon(self.videoFiles[i], i, cache=vid.frameCache))
             windowName = videoObjects[i].__getattribute__("windowName")
             # import ipdb;ipdb.set_trace()
             csvFileName = os.path.join(self.dataDir, self.settingsDict["annotationFiles"][i])
@@ -453,26 +430,28 @@ class imageAnnotationTool_Multi:
                     # import ipdb; ipdb.set_trace()
                     ##Get subject approx position and draw bounding box around it to identify bird
                     
-                    #for custom sony cameras
-                    if self.settingsDict["Mode"] == "Custom":
-                        ViconFrame = FindClosestFrame(CameraObj.SyncArray, frameNo)
-                        # import ipdb; ipdb.set_trace()
-                        coordinateDict = self.CoordData.getCoordDataForViconFrame(int(ViconFrame))
+                    #for custom sony cameras, frames outside the synchronized flashes have no vicon data,
+                    #skipped below like untracked frames
+                    Synced = self.settingsDict["Mode"] != "Custom" or CameraObj.SyncMap.InRange(frameNo)
+                    if not Synced:
+                        ArbPoint = [float("nan"), float("nan")]
                     else:
-                        coordinateDict = self.CoordData.getCoordDataForVideoFrame(int(listOfFrames[id]))
-                    object = subject + "_bp" #Using backpack as arbitiary point to generate bbox
-                    ObjectCoordDict = fileOp.get3DDictofObject(coordinateDict, object)
-
-                    
+                        if self.settingsDict["Mode"] == "Custom":
+                            ViconFrame = CameraObj.SyncMap.ToVicon(frameNo, interpolate=True)
+                            # import ipdb; ipdb.set_trace()
+                            coordinateDict = self.CoordData.getCoordDataForViconFrame(int(ViconFrame))
+                        else:
+                            coordinateDict = self.CoordData.getCoordDataForVideoFrame(int(listOfFrames[id]))
+                        object = subject + "_bp" #Using backpack as arbitiary point to generate bbox
+                        ObjectCoordDict = fileOp.get3DDictofObject(coordinateDict, object)
 
-                    featureDictCamSpace = CameraObj.transferFeaturesToObjectSpace(ObjectCoordDict,custom=True)
+                        featureDictCamSpace = CameraObj.transferFeaturesToObjectSpace(ObjectCoordDict,custom=True)
 
-                    
-                    CameraObj.setFeatures(featureDictCamSpace)
-                    imageFeaturesDict = ImgObj.projectFeaturesFromCamSpaceToImageSpace(featureDictCamSpace)
+                        CameraObj.setFeatures(featureDictCamSpace)
+                        imageFeaturesDict = ImgObj.projectFeaturesFromCamSpaceToImageSpace(featureDictCamSpace)
 
-                    #choosing Arbitiary point: point 1 of backpack
-                    ArbPoint = list(imageFeaturesDict.values())[0]
+                        #choosing Arbitiary point: point 1 of backpack
+                        ArbPoint = list(imageFeaturesDict.values())[0]
                     # print(ArbPoint)
                     height, width, channel = clone.shape
 
@@ -285,7 +285,7 @@ class imageAnnotationTool:
         for i in range(len(self.videoFiles)):
             # destroy pre existing windows
             cv.destroyAllWindows()
-            videoObjects.append(vid.VideoVicon(self.videoFiles[i], i))
+            videoObjects.append(vid.VideoVicon(self.videoFiles[i], i, cache=vid.frameCache))
             windowName = videoObjects[i].__getattribute__("windowName")
             csvFileName = os.path.join(os.path.dirname(self.videoFiles[i]), windowName + ".csv")
 
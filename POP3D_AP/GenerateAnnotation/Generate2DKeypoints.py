@@ -11,10 +11,10 @@ from tqdm import tqdm
 import pandas as pd
 import numpy as np
 import cv2 as cv
-import pickle
 import math
 import multiprocessing as mp
 from FileOperations import rwOperations
+from POP3D_Reader import Calibration, SyncMap
 
 
 def createDatabase2D(customFeatures):
@@ -33,23 +33,6 @@ def createDatabase2D(customFeatures):
 
     return defaultDataSeries, dataFrame
 
-def FindClosestFrame(SyncArray, Frame):
-    """
-    Given a sony frame and a SyncArray, find closest frame in vicon
-    
-    Will throw error if frame is before first flash
-    """
-    #Index of frame where it is last synced
-    #if minus the current frame, smaller than 1 (i.e any negative number and 0)
-    index = np.where((SyncArray[0]-Frame) <1)[0].argmax()
-    #find proportion of how far the frame is within the gap
-    Prop = (Frame - SyncArray[0][index])/(SyncArray[0][index+1]- SyncArray[0][index])
-
-    #Calculate corresponding vicon frame from the proportion
-    ViconFrame = SyncArray[1][index]+(Prop*(SyncArray[1][index+1] - SyncArray[1][index]))
-
-    return ViconFrame
-
 def GetObjectList(df):
     """Get list of all objects in a df"""
     dfCol = list(df.columns)
@@ -62,77 +45,102 @@ def GetObjectList(df):
 
     return KeypointNameList
 
-def Generate2DKeypointCam(df, camMat, distCoef,rvec,tvec,FrameCount,SyncArray,imageWidth,imageHeight ):
-        ##Loop through each frame and cam to reproject
-
-    OutputDict = {}
-    KeypointNameList = GetObjectList(df)
-
-    for i in tqdm(range(SyncArray[0][0],SyncArray[0][len(SyncArray[0])-1])): #from first flash to end
-        ViconFrame = round(FindClosestFrame(SyncArray, i))
-
-
-        FrameData = df.loc[df["frame"]==ViconFrame].to_dict()
-        FrameData.pop("frame")
-        counter = 0
-        Point3D =[None]*3
-        # KeypointNameList = []
-        Point3DList=[]
-        
-        for key,val in FrameData.items():
-            if not val:
-                Point3D[counter] = math.nan
-            else:
-                Point3D[counter] = list(val.values())[0]
-            counter +=1
-
-            if counter ==3:
-                Point3DList.append(Point3D)
-                Point3D = [None]*3
-                counter = 0
-                # KeypointNameList.append(key.strip("_z"))
-
-
-        Points3DArr = np.float32(Point3DList).reshape(-1,3)
-
-        #reproject points:
-        TrialFeatureCoordDict, _ = createDatabase2D(KeypointNameList)
+def GetRowIndex(df, ViconFrames):
+    """
+    Row of df for each vicon frame, -1 if the frame is not in df
+    If a frame is in df more than once, the first row is used (same as the per frame lookup)
+    """
+    Frames, FirstRow = np.unique(df["frame"].to_numpy(), return_index=True)
+    ViconFrames = np.asarray(ViconFrames)
+    Pos = np.minimum(np.searchsorted(Frames, ViconFrames), len(Frames)-1)
+    return np.where(Frames[Pos] == ViconFrames, FirstRow[Pos], -1)
 
-        All2DPoints, jac = cv.projectPoints(Points3DArr, rvec, tvec, camMat, distCoef)
-        FrameDict = {KeypointNameList[x]:All2DPoints[x][0].tolist() for x in range(len(All2DPoints))}
-        #filter out points that are outside frame:
-        FrameDict = {key:([math.nan,math.nan] if val[0]>imageWidth or val[1]>imageHeight else val) for key,val in FrameDict.items()}
-                
-        for feature in FrameDict:
-            point2D = FrameDict[feature]
-            TrialFeatureCoordDict[feature + "_x"] = point2D[0]
-            TrialFeatureCoordDict[feature+ "_y"] = point2D[1]
+def GetPoints3D(df, Rows):
+    """
+    Gather 3D points of rows as (F,K,3) float32 array, nan for missing rows (-1)
+    Keypoints are consecutive x,y,z column triples after removing the frame column, see GetObjectList
+    """
+    dfCol = list(df.columns)
+    dfCol.remove('frame')
+    Data = df[dfCol].to_numpy(dtype=np.float32).reshape(len(df), -1, 3)
+    Points = Data.take(np.clip(Rows, 0, None), axis=0)
+    Points[Rows < 0] = np.nan
+    return Points
 
-        TrialFeatureCoordDict["frame"] = i
-        OutputDict.update({str(i):TrialFeatureCoordDict})
+def Generate2DKeypointCam(df, camMat, distCoef,rvec,tvec,FrameCount,Sync,imageWidth,imageHeight, ChunkSize=1000000):
+    """
+    Reproject 3D keypoints of all camera frames (first to last flash) to 2D in one batch
+
+    Input:
+    df: 3D keypoints at vicon fps, frame column plus x,y,z columns of each keypoint
+    camMat, distCoef, rvec, tvec: calibration of camera
+    FrameCount: unused, kept for old callers
+    Sync [SyncMap]: sync map of camera
+    imageWidth, imageHeight: points right of/ below the image are set to nan
+    ChunkSize [int]: max number of points per projectPoints call
+
+    Output:
+    outDF: dataframe with frame (camera frame) and x,y columns of each keypoint
+    """
+    KeypointNameList = GetObjectList(df)
 
-    return OutputDict
+    CamFrames = Sync.CamFrameRange() #from first flash to end
+    #frames outside the flashes give vicon frame -1, so no row and nan points, instead of failing the whole camera
+    Rows = GetRowIndex(df, Sync.ToVicon(CamFrames, mask=True)[0])
+    Points3D = GetPoints3D(df, Rows).reshape(-1, 3)
 
-def Generate3DKeypoint_Camfps(df,SyncArray):
-    """Extra function to run once for 3D data with camera fps"""
+    #project only finite points, in chunks to bound memory of opencv
+    Points2D = np.full((len(Points3D), 2), np.nan, dtype=np.float64)
+    Finite = np.flatnonzero(np.isfinite(Points3D).all(axis=1))
+    for Start in range(0, len(Finite), ChunkSize):
+        Index = Finite[Start:Start+ChunkSize]
+        Projected, _ = cv.projectPoints(Points3D[Index], rvec, tvec, camMat, distCoef)
+        Points2D[Index] = Projected.reshape(-1, 2)
 
+    #filter out points that are outside frame:
+    Points2D[(Points2D[:, 0] > imageWidth) | (Points2D[:, 1] > imageHeight)] = np.nan
 
-    OutDict3Dfps = {}
+    Columns = [str(feature) + Axis for feature in KeypointNameList for Axis in ("_x", "_y")]
+    outDF = pd.DataFrame(Points2D.reshape(len(CamFrames), -1), columns=Columns)
+    outDF.insert(0, "frame", CamFrames)
 
-    for i in tqdm(range(SyncArray[0][0],SyncArray[0][len(SyncArray[0])-1])): #from first flash to end
-        ViconFrame = round(FindClosestFrame(SyncArray, i))
+    return outDF
 
-        FrameData = df.loc[df["frame"]==ViconFrame].to_dict()
-        FrameData.pop("frame")
+def Generate3DKeypoint_Camfps(df,Sync,interpolate=False):
+    """
+    Extra function to run once for 3D data with camera fps
 
-        #for frame fps 3D data:
-        FrameDataCopy = FrameData.copy()
+    Input:
+    df: 3D keypoints at vicon fps, with frame column
+    Sync [SyncMap]: sync map of camera
+    interpolate [bool]: linearly interpolate between the two vicon frames around the fractional vicon frame
+                        of each camera frame, else take the nearest vicon frame (same frames as the 2D reprojection)
 
-        FrameDataCopy = {k:list(v.values())[0] for k,v in FrameDataCopy.items()}
-        FrameDataCopy.update({"frame":i})
-        OutDict3Dfps.update({i:FrameDataCopy})
-    #save Cam fps 3D dict:
-    Camfps3Ddf = pd.DataFrame.from_dict(OutDict3Dfps, orient = "index")
+    Output:
+    Camfps3Ddf: dataframe indexed by camera frame, same columns as df with frame (camera frame) last,
+                nan where a vicon frame is missing
+    """
+    CamFrames = Sync.CamFrameRange() #from first flash to end
+    Columns = [col for col in df.columns if col != "frame"]
+    Data = df[Columns].to_numpy(dtype=np.float64)
+
+    if interpolate:
+        ViconFrames, Valid = Sync.ToVicon(CamFrames, interpolate=True, mask=True)
+        ViconFrames = np.where(Valid, ViconFrames, -1) #no row, see GetRowIndex
+        Lower = np.floor(ViconFrames).astype(np.int64)
+        Weight = (ViconFrames - Lower)[:, None]
+        LowerRows = GetRowIndex(df, Lower)
+        #upper frame is only needed if camera frame is not exactly on a vicon frame
+        UpperRows = np.where(Weight[:, 0] > 0, GetRowIndex(df, Lower+1), LowerRows)
+        Points = (1-Weight)*Data.take(np.clip(LowerRows, 0, None), axis=0) + Weight*Data.take(np.clip(UpperRows, 0, None), axis=0)
+        Points[(LowerRows < 0) | (UpperRows < 0)] = np.nan
+    else:
+        Rows = GetRowIndex(df, Sync.ToVicon(CamFrames, mask=True)[0])
+        Points = Data.take(np.clip(Rows, 0, None), axis=0)
+        Points[Rows < 0] = np.nan
+
+    Camfps3Ddf = pd.DataFrame(Points, index=CamFrames, columns=Columns)
+    Camfps3Ddf["frame"] = CamFrames
 
     return Camfps3Ddf
 
@@ -142,24 +150,24 @@ def GenerateKeypointCamLoop(i, df,viconSystemData,settingsDict,AnnotDir,basedir,
         camMat = viconSystemData.viconImageObjects[i].intrinsicMatrix
         distCoef= viconSystemData.viconImageObjects[i].distortionMatrix
 
-        #just using pickles to load extrinsics
+        #just using pickles to load extrinsics, through the calibration registry so they are only read once
         # import ipdb; ipdb.set_trace()
         ExtPath = os.path.join(basedir,"CalibrationInfo","%s-Cam%i-Extrinsics.p"%(settingsDict["session"],Cam))
-        rvec, tvec = pickle.load(open(ExtPath,"rb"))
+        IntPath = os.path.join(basedir,"CalibrationInfo","%s-Cam%i-Intrinsics.p"%(settingsDict["session"],Cam))
+        Calib = Calibration.GetCalibration(settingsDict["session"], "Cam%i"%Cam, ExtPath, IntPath)
+        rvec, tvec = Calib.rvec, Calib.tvec
         FrameCount = viconSystemData.viconVideoObjects[i].totalFrameCount
 
         SyncPath = os.path.join(basedir,"CalibrationInfo","%s-Cam%i-SyncArray.p"%(settingsDict["session"],Cam))
-        SyncArray = pickle.load(open(SyncPath,"rb"))
+        Sync = SyncMap.GetSyncMap(SyncPath)
         # import ipdb;ipdb.set_trace()
 
-        Camfps3Ddf = Generate3DKeypoint_Camfps(df, SyncArray)
+        Camfps3Ddf = Generate3DKeypoint_Camfps(df, Sync)
         Cam3Dpath = os.path.join(AnnotDir,settingsDict["FinalFeatureCSV3D"][i])
         Camfps3Ddf.to_csv(Cam3Dpath)
 
         ##For 2D Keypoints:
-        OutputDict = Generate2DKeypointCam(df, camMat, distCoef,rvec,tvec,FrameCount,SyncArray,imageWidth,imageHeight)
-
-        outDF = pd.DataFrame.from_dict(OutputDict, orient="index")
+        outDF = Generate2DKeypointCam(df, camMat, distCoef,rvec,tvec,FrameCount,Sync,imageWidth,imageHeight)
         OutPath = os.path.join(AnnotDir,settingsDict["FinalFeatureCSV2D"][i])
         outDF.to_csv(OutPath, index=False)
 
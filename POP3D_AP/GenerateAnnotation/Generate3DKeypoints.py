@@ -9,6 +9,7 @@ from logging.handlers import RotatingFileHandler
 from System import systemInit as system
 from FileOperations import rwOperations as fileOp
 import os
+import re
 from tqdm import tqdm
 import pandas as pd
 import numpy as np
@@ -34,6 +35,22 @@ def createDatabase(customFeatures):
     return defaultDataSeries, dataFrame
 
 
+def GetObjectMarkers(TrialData, ObjectName, ObjectLen = 4):
+    """
+    Marker trajectories of an object over the whole trial, columns matched like fileOp.get3DDictofObject
+
+    :param TrialData: dataframe of 3D tracking data (MatlabCSVReader.data)
+    :param ObjectName: str name of object
+    :param ObjectLen: number of markers of object, default 4
+    :return: FxMx3 array, markers in column order
+    """
+    Columns = [col for col in TrialData.columns if re.search(r'%s'%ObjectName, col)]
+    if len(Columns) != ObjectLen*3:
+        raise ValueError("Expected %i marker columns for %s, found %i"%(ObjectLen*3, ObjectName, len(Columns)))
+
+    return TrialData[Columns].to_numpy(dtype=np.float64).reshape(len(TrialData), ObjectLen, 3)
+
+
 def Generate3DKeypoint(projectSettings):
     """
     Author:Alex Chan
@@ -72,46 +89,21 @@ def Generate3DKeypoint(projectSettings):
 
     # import ipdb; ipdb.set_trace()
 
-    FullDFDict = {} #Not using pandas append, append to dictionary instead
-
     print("Applying custom features to the whole trial")
-    for i in tqdm(range(len(TrialCoord.data))):
-    # for i in tqdm(range(12000)):
-        # import ipdb; ipdb.set_trace()
-        i = TrialCoord.data["Frame"][i]
-        TrialFeatureCoordDict, _ = createDatabase(Features)
-
-        coordinateDict = TrialCoord.getCoordDataForViconFrame(i)
-        transferredFeatureDictViconSpace = {}
-        for object in viconObjectsFinal:
-            ObjectCoordDict = fileOp.get3DDictofObject(coordinateDict, object.name)
-            Rotation,Translation = object.GetRotTransFromViconSpace(ObjectCoordDict)
-
-            if Rotation is False:
-                # import ipdb; ipdb.set_trace()
-                #Cannot compute rotation/ translation, just return NA for all values
-                Outdict = object.featureDict.fromkeys(object.featureDict.keys(),[float('nan'),float('nan'),float('nan')])
-                transferredFeatureDictViconSpace.update(Outdict)
-            else:
-                object.setTransformationParameters(Rotation,Translation)
-                Outdict = object.transferFeaturesToViconSpaceSimple()
-                transferredFeatureDictViconSpace.update(Outdict)
-            
-        ##Generate dictionary with split coordinates
-        for feature in transferredFeatureDictViconSpace:
-            point3D = transferredFeatureDictViconSpace[feature]
-            TrialFeatureCoordDict[feature + '_x'] = point3D[0]
-            TrialFeatureCoordDict[feature + '_y'] = point3D[1]
-            TrialFeatureCoordDict[feature + '_z'] = point3D[2]
-        TrialFeatureCoordDict["frame"] = i
-
-        # import ipdb; ipdb.set_trace()
-
-        #Save Data:
-        FullDFDict.update({str(i):TrialFeatureCoordDict})
-
-
-    TrialFeatureCoordDF = pd.DataFrame.from_dict(FullDFDict, orient="index")
+    #all frames of each object at once, frames with missing markers are nan
+    FeatureColumns = {"frame": TrialCoord.data["Frame"].to_numpy()}
+    for object in tqdm(viconObjectsFinal):
+        Markers3D = GetObjectMarkers(TrialCoord.data, object.name)
+        FeaturePoints = object.transferFeaturesToViconSpaceBatch(Markers3D)
+
+        ##Generate columns with split coordinates
+        for k, feature in enumerate(object.featureDict):
+            FeatureColumns[feature + '_x'] = FeaturePoints[:, k, 0]
+            FeatureColumns[feature + '_y'] = FeaturePoints[:, k, 1]
+            FeatureColumns[feature + '_z'] = FeaturePoints[:, k, 2]
+
+    #same columns and order as createDatabase(Features), 0 for features no object produced
+    TrialFeatureCoordDF = pd.DataFrame(FeatureColumns).reindex(columns=list(createDatabase(Features)[0]), fill_value=0)
     #Save csv
     TrialFeatureCoordPath =  os.path.join(AnnotDir, settingsDict["FinalFeatureCSV"])
     TrialFeatureCoordDF.to_csv(TrialFeatureCoordPath, index=False)
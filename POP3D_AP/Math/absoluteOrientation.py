@@ -1,6 +1,7 @@
 #!/usr/bin/python
 
 from numpy import *
+import numpy as np
 from math import sqrt
 from Math import transformations
 
@@ -17,8 +18,8 @@ def findPoseFromPoints(pointsInCurrentFrameA, pointsInTargetFrameB,Name=None):
     :return: 3x3 Rotation Matrix and 3x1 Translation matrix,
     """
 
-    pointsInCurrentFrameA = mat(pointsInCurrentFrameA)
-    pointsInTargetFrameB = mat(pointsInTargetFrameB)
+    pointsInCurrentFrameA = asmatrix(pointsInCurrentFrameA)
+    pointsInTargetFrameB = asmatrix(pointsInTargetFrameB)
 
     assert len(pointsInCurrentFrameA) == len(pointsInTargetFrameB)
 
@@ -64,6 +65,50 @@ def findPoseFromPoints(pointsInCurrentFrameA, pointsInTargetFrameB,Name=None):
 
     return R, t
 
+def findPoseFromPointsBatch(pointsInCurrentFrameA, pointsInTargetFrameB):
+    """
+    Batched findPoseFromPoints, finds pose of all frames with one stacked SVD
+    :param pointsInCurrentFrameA: Nx3 array of point set A (same for all frames) or FxNx3 array
+    :param pointsInTargetFrameB: FxNx3 array of point set B
+    :return: Fx3x3 Rotation Matrices and Fx3 Translations (B = R.A + t),
+             nan for frames where any point is nan
+    """
+    pointsInTargetFrameB = np.asarray(pointsInTargetFrameB, dtype=np.float64)
+    pointsInCurrentFrameA = np.broadcast_to(np.asarray(pointsInCurrentFrameA, dtype=np.float64), pointsInTargetFrameB.shape)
+
+    if pointsInTargetFrameB.ndim != 3 or pointsInTargetFrameB.shape[2] != 3:
+        raise Exception("point set B is not FxNx3, it is {}".format(pointsInTargetFrameB.shape))
+
+    NumFrames = pointsInTargetFrameB.shape[0]
+    R = np.full((NumFrames, 3, 3), np.nan)
+    t = np.full((NumFrames, 3), np.nan)
+
+    #only solve frames with all points
+    Valid = np.isfinite(pointsInCurrentFrameA).all(axis=(1, 2)) & np.isfinite(pointsInTargetFrameB).all(axis=(1, 2))
+    A = pointsInCurrentFrameA[Valid]
+    B = pointsInTargetFrameB[Valid]
+
+    # find mean and subtract it
+    centroid_A = A.mean(axis=1)
+    centroid_B = B.mean(axis=1)
+    H = np.einsum("fni,fnj->fij", A - centroid_A[:, None], B - centroid_B[:, None])
+
+    # find rotation of all frames
+    U, S, Vt = np.linalg.svd(H)
+    RValid = np.swapaxes(Vt, 1, 2) @ np.swapaxes(U, 1, 2)
+
+    # special reflection case, same correction as findPoseFromPoints
+    Reflection = np.linalg.det(RValid) < 0
+    if Reflection.any():
+        print("det(R) < 0 in %i frames, reflection detected!, correcting for it ...\n"%Reflection.sum())
+        Vt[Reflection, 2, :] *= -1
+        RValid[Reflection] = np.swapaxes(Vt[Reflection], 1, 2) @ np.swapaxes(U[Reflection], 1, 2)
+
+    R[Valid] = RValid
+    t[Valid] = centroid_B - np.einsum("fij,fj->fi", RValid, centroid_A)
+
+    return R, t
+
 if __name__ == '__main__':
     test = True
 
@@ -83,7 +128,7 @@ if __name__ == '__main__':
 
         rot, trans = findPoseFromPoints(point1, point2)
         print(" Rotation{0} and Translation{1} : ".format(rot,trans))
-        testPoint = dot(rot,mat(p4).T) + trans
+        testPoint = dot(rot,asmatrix(p4).T) + trans
         print("Test Point:", testPoint )
 
         transformedPoints = transformations.transformPoints(point1,rot,trans)
@@ -95,8 +140,8 @@ if __name__ == '__main__':
     # # Random rotation and translation
 
         random.seed(100)
-        R = mat(random.rand(3,3))
-        t = mat(random.rand(3,1))
+        R = asmatrix(random.rand(3,3))
+        t = asmatrix(random.rand(3,1))
 
         # make R a proper rotation matrix, force orthonormal
         U, S, Vt = linalg.svd(R)
@@ -110,7 +155,7 @@ if __name__ == '__main__':
         # number of points
         n = 4
 
-        A = mat(random.rand(3, n));
+        A = asmatrix(random.rand(3, n));
         B = R*A + tile(t, (1, n))
 
         # Recover R and t
@@ -98,6 +98,34 @@ class ObjectVicon:
         
         return Rotation, Translation
 
+    def GetMarkerFeatures(self, NumMarkers):
+        """
+        Object space points of markers 1 to NumMarkers, matched by name like GetRotTransFromViconSpace
+        :return: Mx3 array
+        """
+        ObjectFeatKey = list(self.featureDict.keys())
+        ObjectFeat = []
+        for i in range(NumMarkers):
+            ObjectFeatMatch = [key for key in ObjectFeatKey if key.endswith("%s%i"%(self.object,i+1))]
+            if len(ObjectFeatMatch) == 0:
+                raise ValueError("Marker %s%i not in features of %s"%(self.object, i+1, self.name))
+            ObjectFeat.append(self.featureDict[ObjectFeatMatch[0]])
+
+        return np.array(ObjectFeat, dtype=np.float64)
+
+    def transferFeaturesToViconSpaceBatch(self, Markers3D):
+        """
+        Batched GetRotTransFromViconSpace + transferFeaturesToViconSpaceSimple over all frames of a trial
+        :param Markers3D: FxMx3 array of marker positions in vicon space, markers in order 1 to M
+        :return: FxKx3 array of all features in featureDict order, nan for frames with missing markers
+        """
+        assert (len(self.featureDict) != 0), "Dicitonary empty!! No object features to transfer"
+        Markers3D = np.asarray(Markers3D, dtype=np.float64)
+        Rotation, Translation = absoluteOrientation.findPoseFromPointsBatch(self.GetMarkerFeatures(Markers3D.shape[1]), Markers3D)
+
+        Features = np.array(list(self.featureDict.values()), dtype=np.float64)
+        return np.einsum("fij,kj->fki", Rotation, Features) + Translation[:, None, :]
+
     def transferFeaturesToViconSpace(self, custom = False) :
         """
         Transfer the features from Object space to target space
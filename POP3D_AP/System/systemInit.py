@@ -10,6 +10,7 @@ import cv2 as cv
 from System import camera
 import numpy as np
 import pickle
+from POP3D_Reader import Calibration, SyncMap
 
 # Debug Function to print the calibration Information
 def printCalibInformation(camInstances):
@@ -67,23 +68,13 @@ class SystemInit:
         return dataObject
     
     def LoadSyncArray(self):
-        DataDir = os.path.join(self.rootDir, "CalibrationInfo")
-
-        SonyFirstFlash = []
-        for i, cam in enumerate(self.settingsDict["cameras"]):
-            SyncArrDir = os.path.join(DataDir, "%s-%s-SyncArray.p")%(self.sessionName,cam)
-            SyncArray = pickle.load(open(SyncArrDir,"rb"))
-            self.viconCameraObjects[i].SyncArray = SyncArray
-            SonyFirstFlash.append(SyncArray[0][0])
-
-        # import ipdb; ipdb.set_trace()
-
-        #Get frame diff compared to earliest flash to synchronize all sony cams
-        FrameDiff = [min(SonyFirstFlash)-x for x in SonyFirstFlash] #staggered start frames for vid
+        SyncArrays, FrameDiff = videoVicon.loadFrameDiff(self.rootDir, self.sessionName, self.settingsDict["cameras"])
 
         for i in range(len(self.settingsDict["cameras"])):
+            self.viconCameraObjects[i].SyncArray = SyncArrays[i]
+            #vectorized camera <-> vicon frame mapping, shared with other users of the same pickle
+            self.viconCameraObjects[i].SyncMap = SyncMap.GetSyncMap(videoVicon.getSyncArrayPath(self.rootDir, self.sessionName, self.settingsDict["cameras"][i]))
             self.viconCameraObjects[i].FrameDiff = FrameDiff[i]
-        # import ipdb; ipdb.set_trace()
 
     def loadViconCoord(self):
         print("Load marker swap corrected Matlab output csv")
@@ -162,19 +153,19 @@ class SystemInit:
             ExtrinsicDir = os.path.join(DataDir ,"%s-%s-Extrinsics.p"%(self.sessionName,cam))
             # SyncArrDir = DataDir + cam + "_" +Video + "_SyncArr.p"
 
-            rvec, tvec = pickle.load(open(ExtrinsicDir,"rb"))
-            cameraMatrix, distCoeffs= pickle.load(open(IntrinsicDir,"rb"))
+            #pickles are read once per process and rotation matrix/ quaternion cached, shared with POP3D_Reader
+            Calib = Calibration.GetCalibration(self.sessionName, cam, ExtrinsicDir, IntrinsicDir)
+            cameraMatrix, distCoeffs = Calib.camMat, Calib.distCoef
             # SyncArray = pickle.load(open(SyncArrDir,"rb"))
 
             # rot = rvec.reshape(1,3).tolist()[0]
             #convert rotation vector from opencv to rot matrix?0
             # import ipdb; ipdb.set_trace()
-            rotMat = cv.Rodrigues(rvec)[0]
-            rotQuat = tf.rotMatrixToQuat(rotMat) #trying quaternion
+            rotQuat = Calib.Quat #same as tf.rotMatrixToQuat(cv.Rodrigues(rvec)[0])
             rotList = [rotQuat[0],rotQuat[1],rotQuat[2],rotQuat[3]]
 
 
-            trans = tvec.reshape(1,3).tolist()[0]
+            trans = Calib.tvec.reshape(1,3).tolist()[0]
 
             self.addCustomCameraInstances("custom",i,rotList,trans,cameraMatrix,distCoeffs)
             # self.customCameraInstances[i].SyncArray = SyncArray
@@ -207,7 +198,7 @@ class SystemInit:
 
         for i in range(len(self.settingsDict["cameras"])):
             CamNum = i+1
-            videoObject = videoVicon.VideoVicon(self.sessionVideoFiles[str("Cam%i"%CamNum)], int(CamNum))
+            videoObject = videoVicon.VideoVicon(self.sessionVideoFiles[str("Cam%i"%CamNum)], int(CamNum), cache=videoVicon.frameCache)
             videoObjects.append(videoObject)
 
         return videoObjects
@@ -217,7 +208,7 @@ class SystemInit:
         videoObjects = []
 
         for serialNo in self.settingsDict["cameras"]:
-            videoObject = videoVicon.VideoVicon(self.sessionVideoFiles[str(serialNo)], int(serialNo))
+            videoObject = videoVicon.VideoVicon(self.sessionVideoFiles[str(serialNo)], int(serialNo), cache=videoVicon.frameCache)
             videoObjects.append(videoObject)
 
         return videoObjects
@@ -1,8 +1,12 @@
 import cv2 as cv
 import os
+from concurrent.futures import ThreadPoolExecutor
 from System import SettingsGenerator
 import numpy as np
+from POP3D_Reader import VideoReader, SyncMap
 
+#decoded frame cache shared by the video objects of the annotation tools, which revisit frames (stepping back, re-showing, crops per subject)
+frameCache = VideoReader.FrameCache()
 
 def setWindowName(path):
     windowName = os.path.basename(path)
@@ -11,14 +15,18 @@ def setWindowName(path):
 
 class VideoVicon:
     # todo : Global variable must have serialNo savedfor each object, so we can check declaration of same camera
-    def __init__(self, path, serialNo):
+    def __init__(self, path, serialNo, useKeyframeIndex=True, cache=None):
         """
         Initialization of class, gets path for the video files and return images
+        :param useKeyframeIndex: seek with keyframe index sidecar (built on first use), see VideoReader.SeekableVideo
+        :param cache: VideoReader.FrameCache for decoded frames (e.g module frameCache), default None, no caching
         """
         if os.path.exists(path):
             self.videoFilePath = path
-            self.capture = cv.VideoCapture(self.videoFilePath)
-            self.totalFrameCount = int(self.capture.get(cv.CAP_PROP_FRAME_COUNT))
+            self.cache = cache
+            self.video = VideoReader.SeekableVideo(self.videoFilePath, UseIndex=useKeyframeIndex)
+            self.capture = self.video.capture
+            self.totalFrameCount = self.video.FrameCount
             self.windowName = setWindowName(self.videoFilePath)
             self.objectID = serialNo
         else:
@@ -33,18 +41,69 @@ class VideoVicon:
         """
        # capture = cv.VideoCapture(self.videoFilePath)
         # Sanity check for the given frame number
-        frameNo = np.floor(frameNo)
-        if frameNo <= self.totalFrameCount:
-            self.capture.set(cv.CAP_PROP_POS_FRAMES, frameNo)
-        else:
+        frameNo = int(np.floor(frameNo))
+        if frameNo > self.totalFrameCount:
             raise ValueError(" Frame no does not exist")
 
-        ret, frame = self.capture.read()
+        if self.cache is not None:
+            frame = self.cache.get(self.videoFilePath, frameNo)
+            if frame is not None:
+                return frame
+
+        # jumps to closest keyframe and grabs forward, instead of a slow and sometimes inaccurate CAP_PROP_POS_FRAMES seek
+        ret, frame = self.video.read(frameNo)
+
+        if ret and self.cache is not None:
+            #cache keeps its own copy, returned frame can be drawn on
+            self.cache.put(self.videoFilePath, frameNo, frame.copy())
 
         return frame
 
     def __del__(self):
-        del self.capture
+        if hasattr(self, "video"):
+            self.video.release()
+
+def getSyncArrayPath(rootDir, sessionName, cam):
+    """Path of sync array pickle of a camera, in rootDir/CalibrationInfo"""
+    return os.path.join(rootDir, "CalibrationInfo", "%s-%s-SyncArray.p"%(sessionName,cam))
+
+def loadFrameDiff(rootDir, sessionName, cameras):
+    """
+    Loads sync arrays of all cameras and computes frame offset of each camera to the camera that flashed first
+    Video frame of camera i for a synchronized frame number is frameNo - FrameDiff[i]
+    :param rootDir: root directory of session, sync arrays are in rootDir/CalibrationInfo
+    :param sessionName: name of session
+    :param cameras: list of camera names
+    :return: list of sync arrays, list of frame differences
+    """
+    SyncArrays = []
+    SonyFirstFlash = []
+    for cam in cameras:
+        SyncArray = SyncMap.GetSyncMap(getSyncArrayPath(rootDir, sessionName, cam)).SyncArray
+        SyncArrays.append(SyncArray)
+        SonyFirstFlash.append(SyncArray[0][0])
+
+    #Get frame diff compared to earliest flash to synchronize all sony cams
+    FrameDiff = [min(SonyFirstFlash)-x for x in SonyFirstFlash] #staggered start frames for vid
+
+    return SyncArrays, FrameDiff
+
+def getSyncedFrames(videoObjects, frameNo, FrameDiff, executor):
+    """
+    Reads the same synchronized frame from all cameras, each camera is decoded in its own thread
+    :param videoObjects: list of VideoVicon objects
+    :param frameNo: synchronized frame number
+    :param FrameDiff: frame offset of each camera, see loadFrameDiff
+    :param executor: ThreadPoolExecutor with a worker per camera
+    :return: list of images, None if frame does not exist for that camera
+    """
+    def readFrame(j):
+        realFrame = frameNo - FrameDiff[j]
+        if realFrame < 0 or realFrame >= videoObjects[j].totalFrameCount:
+            return None
+        return videoObjects[j].getFrame(realFrame)
+
+    return list(executor.map(readFrame, range(len(videoObjects))))
 
 def makeEntryToFile(fileName, frameNo):
     assert (os.path.exists(fileName)), "File does no exist"
@@ -88,13 +147,19 @@ def defineVideoFramesForAnnotation(settingsDict):
 
 
     for i in range(len(videoFiles)):
-        videoObjects.append(VideoVicon(videoFiles[i], i))
+        videoObjects.append(VideoVicon(videoFiles[i], i, cache=frameCache))
 
     frameCounts = [None]*len(videoObjects)
 
     for i in range(len(videoObjects)):
         frameCounts[i] = videoObjects[i].totalFrameCount
 
+    #offset custom sony cameras the same way the annotation tool does, other videos are shown at the raw frame number
+    FrameDiff = [0]*len(videoObjects)
+    if settingsDict.get("Mode") == "Custom":
+        _, FrameDiff = loadFrameDiff(rootDir, settingsDict["session"], settingsDict["cameras"])
+
+    executor = ThreadPoolExecutor(max_workers=len(videoObjects))
 
     cv.namedWindow("temp", cv.WINDOW_NORMAL)
 
@@ -102,17 +167,22 @@ def defineVideoFramesForAnnotation(settingsDict):
     #Check if all videos have same number of frames
     # assert (len(set(frameCounts))==1), " Video files do not have same frame number"
     frameNo = 0
+    shownFrameNo = None
 
     # captureStatus= False
 
     while 0<= frameNo <= frameCounts[0]:
-        images = []
-        print("Frame No: ", frameNo)
-
-        for j in range(len(videoObjects)):
-            image = videoObjects[j].getFrame(frameNo)
-
-            images.append(image)
+        if frameNo != shownFrameNo:
+            #only decode when frame changed, not every key poll
+            print("Frame No: ", frameNo)
+            images = getSyncedFrames(videoObjects, frameNo, FrameDiff, executor)
+            validImage = next((image for image in images if image is not None), None)
+            if validImage is None:
+                #no camera has this frame, show black images of video size
+                validImage = np.zeros((int(videoObjects[0].capture.get(cv.CAP_PROP_FRAME_HEIGHT)),
+                                       int(videoObjects[0].capture.get(cv.CAP_PROP_FRAME_WIDTH)), 3), dtype=np.uint8)
+            images = [np.zeros_like(validImage) if image is None else image for image in images]
+            shownFrameNo = frameNo
 
         #determines how the images are split, 2 images per row
         SplitIndex = [[k, k+1] for k in range(0,len(images),2)]
@@ -154,6 +224,7 @@ def defineVideoFramesForAnnotation(settingsDict):
             print("b : previous frame \n ")
             print("S : Enter frame status in log file \n ")
 
+    executor.shutdown()
     print("Program terminated frame No/totalFrame : ", frameNo, "/", frameCounts[0])
 
 
@@ -0,0 +1,8 @@
+import os
+import sys
+
+#modules of POP3D_AP import System, Math and FileOperations as top level packages, and POP3D_Reader from the repository root,
+#same paths the entry scripts add
+Root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(Root)
+sys.path.append(os.path.join(Root, ".."))
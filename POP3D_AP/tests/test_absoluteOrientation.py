@@ -0,0 +1,55 @@
+""" Regression tests of the batched rigid body solver against findPoseFromPoints"""
+
+import numpy as np
+
+from Math import absoluteOrientation, transformations
+
+
+def MakeFrames(NumFrames=20, NumPoints=5, Seed=0):
+    """Random object points and their positions under random rigid transforms, plus some noise"""
+    rng = np.random.default_rng(Seed)
+    Object = rng.normal(0, 30, (NumPoints, 3))
+    Frames = []
+    for _ in range(NumFrames):
+        R = transformations.eulerAnglesToRotationMatrix(rng.uniform(-np.pi, np.pi, 3))
+        t = rng.normal(0, 1000, 3)
+        Frames.append(Object @ R.T + t + rng.normal(0, 0.5, (NumPoints, 3)))
+    return Object, np.array(Frames)
+
+def test_MatchesFindPoseFromPoints():
+    Object, Frames = MakeFrames()
+    R, t = absoluteOrientation.findPoseFromPointsBatch(Object, Frames)
+    assert R.shape == (20, 3, 3) and t.shape == (20, 3)
+    for f in range(len(Frames)):
+        RSingle, tSingle = absoluteOrientation.findPoseFromPoints(Object.T, Frames[f].T)
+        np.testing.assert_allclose(R[f], np.asarray(RSingle), atol=1e-9)
+        np.testing.assert_allclose(t[f], np.asarray(tSingle).ravel(), atol=1e-6)
+
+def test_PerFramePointSetA():
+    Object, Frames = MakeFrames(NumFrames=4)
+    A = Frames[::-1]
+    R, t = absoluteOrientation.findPoseFromPointsBatch(A, Frames)
+    for f in range(len(Frames)):
+        RSingle, tSingle = absoluteOrientation.findPoseFromPoints(A[f].T, Frames[f].T)
+        np.testing.assert_allclose(R[f], np.asarray(RSingle), atol=1e-9)
+        np.testing.assert_allclose(t[f], np.asarray(tSingle).ravel(), atol=1e-6)
+
+def test_Reflection(capsys):
+    """Mirrored point sets are corrected to a rotation the same way in both solvers"""
+    Object, Frames = MakeFrames(NumFrames=3, NumPoints=4)
+    Frames[1] = Frames[1] * np.array([1, 1, -1])
+    R, t = absoluteOrientation.findPoseFromPointsBatch(Object, Frames)
+    assert "det(R) < 0 in 1 frames" in capsys.readouterr().out
+    np.testing.assert_allclose(np.linalg.det(R), 1.0)
+    RSingle, tSingle = absoluteOrientation.findPoseFromPoints(Object.T, Frames[1].T)
+    np.testing.assert_allclose(R[1], np.asarray(RSingle), atol=1e-9)
+    np.testing.assert_allclose(t[1], np.asarray(tSingle).ravel(), atol=1e-6)
+
+def test_NaNFrames():
+    Object, Frames = MakeFrames(NumFrames=5)
+    Frames[2, 3, 0] = np.nan
+    R, t = absoluteOrientation.findPoseFromPointsBatch(Object, Frames)
+    assert np.isnan(R[2]).all() and np.isnan(t[2]).all()
+    assert np.isfinite(np.delete(R, 2, axis=0)).all() and np.isfinite(np.delete(t, 2, axis=0)).all()
+    Expected, _ = absoluteOrientation.findPoseFromPointsBatch(Object, np.delete(Frames, 2, axis=0))
+    np.testing.assert_allclose(np.delete(R, 2, axis=0), Expected)
@@ -0,0 +1,35 @@
+""" Regression tests of VideoVicon.getFrame with the shared frame cache"""
+
+import numpy as np
+import cv2
+import pytest
+
+from System import videoVicon
+from POP3D_Reader import VideoReader
+
+
+def WriteVideo(Path, NumFrames=30):
+    writer = cv2.VideoWriter(Path, cv2.VideoWriter_fourcc(*"mp4v"), 30, (64, 48))
+    if not writer.isOpened():
+        pytest.skip("OpenCV can not write mp4v videos")
+    for i in range(NumFrames):
+        img = np.zeros((48, 64, 3), dtype=np.uint8)
+        cv2.rectangle(img, (i, 0), (i + 4, 47), (255, 255, 255), -1)
+        writer.write(img)
+    writer.release()
+    return Path
+
+def test_GetFrameCached(tmp_path):
+    Path = WriteVideo(str(tmp_path / "Cam1.mp4"))
+    capture = cv2.VideoCapture(Path)
+    Expected = [capture.read()[1] for _ in range(30)]
+    capture.release()
+
+    Cache = VideoReader.FrameCache()
+    video = videoVicon.VideoVicon(Path, 0, cache=Cache)
+    for frameNo in [5, 20, 5, 4, 20]:
+        frame = video.getFrame(frameNo)
+        assert np.array_equal(frame, Expected[frameNo])
+        #drawing on a returned frame does not change the cached one
+        frame[:] = 0
+    assert Cache.GetStats()["Hits"] == 2 and len(Cache) == 3
@@ -0,0 +1,336 @@
+# !/usr/bin/env python3
+""" Indexed binary layout of the sampled image annotation jsons (Train/Val/Test-2D/3D.json), built once, opened lazily"""
+
+import os
+import json
+import shutil
+import numpy as np
+
+from POP3D_Reader import CSVCache, AnnotationShards
+
+IndexVersion = 1
+ArrayNames = ["ImageID", "BirdOffsets", "BirdIDs", "InBirdID", "CamNames", "Paths",
+              "In3D", "Keypoint3D", "Has3D", "In2D", "Keypoint2D", "Has2D", "InBBox", "BBox"]
+
+
+def GetIndexPath(JSONPath, IndexDir=None):
+    """Directory of index, next to json by default, see CSVCache.GetCachePath"""
+    return CSVCache.GetCachePath(JSONPath, IndexDir, Ext=".index")
+
+def GetType(Annotations):
+    """3D jsons have per camera data under CameraData, 2D jsons have one view per image"""
+    if len(Annotations) > 0 and "CameraData" in Annotations[0]:
+        return "3D"
+    return "2D"
+
+def ReadAnnotations(JSONPath):
+    """
+    Info and a function returning an iterator over annotation records
+    JSONPath can be an annotation json, or the manifest.json of annotation shards (see AnnotationShards),
+    shards are streamed line by line
+    """
+    if AnnotationShards.IsManifest(JSONPath):
+        return AnnotationShards.ReadManifest(JSONPath)["Info"], lambda: AnnotationShards.IterRecords(JSONPath)
+    with open(JSONPath) as f:
+        data = json.load(f)
+    return data["info"], lambda: iter(data["Annotations"])
+
+def LoadData(JSONPath):
+    """Full annotation dict {"info":..., "Annotations":[...]} of a json or of shards"""
+    if AnnotationShards.IsManifest(JSONPath):
+        return AnnotationShards.LoadData(JSONPath)
+    with open(JSONPath) as f:
+        return json.load(f)
+
+def BuildIndex(JSONPath, IndexPath):
+    """
+    Convert an annotation json (or shard manifest) into an index directory, json is parsed once here
+
+    Layout, M is total number of birds over all images, C max cameras, K keypoints:
+    meta.json: info, type, source stamp and string tables (Birds, Keypoints, CamNames, Paths)
+    ImageID (N,), BirdOffsets (N+1,): birds of image i are rows BirdOffsets[i]:BirdOffsets[i+1]
+    BirdIDs (M,): index into Birds, InBirdID (M,): bird listed in BirdID of image
+    CamNames, Paths (N,C): index into string tables, -1 if camera missing
+    In3D (M,), Keypoint3D (M,K,3), Has3D (M,K): bird/ keypoint present in Keypoint3D dict
+    In2D (M,C), Keypoint2D (M,C,K,2), Has2D (M,C,K)
+    InBBox (M,C), BBox (M,C,4)
+    """
+    Stamp = CSVCache.GetSourceStamp(JSONPath)
+    Info, Records = ReadAnnotations(JSONPath)
+    Type = None
+
+    Tables = {"Birds": [], "Keypoints": [], "CamNames": [], "Paths": []}
+    Lookups = {Name: {} for Name in Tables}
+    def Lookup(Name, String):
+        if String not in Lookups[Name]:
+            Lookups[Name][String] = len(Tables[Name])
+            Tables[Name].append(String)
+        return Lookups[Name][String]
+
+    def GetViews(Annot):
+        return Annot["CameraData"] if Type == "3D" else [Annot]
+
+    ##First pass, string tables and bird order of each image
+    ImageBirds = []
+    C = 1
+    for Annot in Records():
+        if Type is None:
+            Type = GetType([Annot])
+        Views = GetViews(Annot)
+        C = max(C, len(Views))
+        BirdOrder = list(Annot.get("BirdID", []))
+        for BirdDict in [Annot["Keypoint3D"]] + [View["Keypoint2D"] for View in Views] + [View["BBox"] for View in Views]:
+            for bird, Value in BirdDict.items():
+                if bird not in BirdOrder:
+                    BirdOrder.append(bird)
+                if isinstance(Value, dict):
+                    for Key in Value:
+                        Lookup("Keypoints", Key)
+        for bird in BirdOrder:
+            Lookup("Birds", bird)
+        ImageBirds.append(BirdOrder)
+
+    if Type is None:
+        Type = GetType([])
+    N = len(ImageBirds)
+    K = len(Tables["Keypoints"])
+    BirdOffsets = np.zeros(N+1, dtype=np.int64)
+    BirdOffsets[1:] = np.cumsum([len(Birds) for Birds in ImageBirds])
+    M = int(BirdOffsets[-1])
+
+    Arrays = {"ImageID": np.full(N, -1, dtype=np.int64),
+              "BirdOffsets": BirdOffsets,
+              "BirdIDs": np.zeros(M, dtype=np.int64),
+              "InBirdID": np.zeros(M, dtype=bool),
+              "CamNames": np.full((N, C), -1, dtype=np.int64),
+              "Paths": np.full((N, C), -1, dtype=np.int64),
+              "In3D": np.zeros(M, dtype=bool),
+              "Keypoint3D": np.full((M, K, 3), np.nan),
+              "Has3D": np.zeros((M, K), dtype=bool),
+              "In2D": np.zeros((M, C), dtype=bool),
+              "Keypoint2D": np.full((M, C, K, 2), np.nan),
+              "Has2D": np.zeros((M, C, K), dtype=bool),
+              "InBBox": np.zeros((M, C), dtype=bool),
+              "BBox": np.full((M, C, 4), np.nan)}
+
+    def FillPoints(Value, Out, Has):
+        if not isinstance(Value, dict):
+            return
+        for Key, Point in Value.items():
+            k = Lookups["Keypoints"][Key]
+            Out[k] = np.array(Point, dtype=float)
+            Has[k] = True
+
+    ##Second pass, fill arrays
+    for i, Annot in enumerate(Records()):
+        Arrays["ImageID"][i] = Annot.get("Image-ID", i)
+        Rows = {bird: BirdOffsets[i] + b for b, bird in enumerate(ImageBirds[i])}
+        for bird, Row in Rows.items():
+            Arrays["BirdIDs"][Row] = Lookups["Birds"][bird]
+            Arrays["InBirdID"][Row] = bird in Annot.get("BirdID", [])
+
+        for bird, Value in Annot["Keypoint3D"].items():
+            Arrays["In3D"][Rows[bird]] = True
+            FillPoints(Value, Arrays["Keypoint3D"][Rows[bird]], Arrays["Has3D"][Rows[bird]])
+
+        for c, View in enumerate(GetViews(Annot)):
+            Arrays["Paths"][i, c] = Lookup("Paths", View["Path"])
+            if "CamName" in View:
+                Arrays["CamNames"][i, c] = Lookup("CamNames", View["CamName"])
+            for bird, Value in View["Keypoint2D"].items():
+                Arrays["In2D"][Rows[bird], c] = True
+                FillPoints(Value, Arrays["Keypoint2D"][Rows[bird], c], Arrays["Has2D"][Rows[bird], c])
+            for bird, Value in View["BBox"].items():
+                Arrays["InBBox"][Rows[bird], c] = True
+                Arrays["BBox"][Rows[bird], c] = np.array(Value, dtype=float)
+
+    Meta = {"Version": IndexVersion,
+            "Stamp": Stamp.tolist(),
+            "Type": Type,
+            "Info": Info,
+            "NumImages": N,
+            "NumCams": C}
+    Meta.update(Tables)
+
+    ##Write to temp dir first, so a crash never leaves a half written index
+    TempPath = "%s.tmp%i"%(IndexPath, os.getpid())
+    try:
+        if os.path.exists(TempPath):
+            shutil.rmtree(TempPath)
+        os.makedirs(TempPath)
+        for Name in ArrayNames:
+            np.save(os.path.join(TempPath, "%s.npy"%Name), Arrays[Name])
+        with open(os.path.join(TempPath, "meta.json"), "w") as f:
+            json.dump(Meta, f)
+        if os.path.exists(IndexPath):
+            shutil.rmtree(IndexPath)
+        os.replace(TempPath, IndexPath)
+    except OSError as e:
+        #e.g read only dataset drive, keep index in memory only
+        print("Could not write annotation index %s: %s"%(IndexPath, e))
+        if os.path.exists(TempPath):
+            shutil.rmtree(TempPath)
+        return None, (Meta, Arrays)
+
+    return IndexPath, (Meta, Arrays)
+
+def IsIndexValid(IndexPath, JSONPath):
+    MetaPath = os.path.join(IndexPath, "meta.json")
+    if not os.path.exists(MetaPath):
+        return False
+    try:
+        with open(MetaPath) as f:
+            Meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return Meta.get("Version") == IndexVersion and CSVCache.IsCacheValid(Meta["Stamp"], JSONPath)
+
+
+class AnnotationIndex:
+
+    def __init__(self, JSONPath, IndexDir=None):
+        """
+        Lazily opened index of an annotation json, arrays are memory mapped so only accessed images are read.
+        Index is built on first use and rebuilt if json changed
+
+        Input:
+        JSONPath [str]: path to json file, or manifest.json of annotation shards (see AnnotationShards)
+        IndexDir [str]: directory to save index, if None saved next to json
+        """
+        self.JSONPath = JSONPath
+        self.IndexPath = GetIndexPath(JSONPath, IndexDir)
+
+        self.Arrays = {}
+        if IsIndexValid(self.IndexPath, JSONPath):
+            with open(os.path.join(self.IndexPath, "meta.json")) as f:
+                self.Meta = json.load(f)
+        else:
+            print("Building annotation index for %s"%JSONPath)
+            IndexPath, (self.Meta, Arrays) = BuildIndex(JSONPath, self.IndexPath)
+            if IndexPath is None:
+                self.Arrays = Arrays
+
+        self.Type = self.Meta["Type"]
+        self.Info = self.Meta["Info"]
+        self.Birds = self.Meta["Birds"]
+        self.Keypoints = self.Meta["Keypoints"]
+        self.CamNameTable = self.Meta["CamNames"]
+        self.PathTable = self.Meta["Paths"]
+
+    def __len__(self):
+        return self.Meta["NumImages"]
+
+    def __getattr__(self, Name):
+        """Arrays are memory mapped on first access"""
+        if Name in ArrayNames:
+            if Name not in self.Arrays:
+                self.Arrays[Name] = np.load(os.path.join(self.IndexPath, "%s.npy"%Name), mmap_mode="r")
+            return self.Arrays[Name]
+        raise AttributeError(Name)
+
+    def GetRows(self, index):
+        """Bird rows of image"""
+        return range(int(self.BirdOffsets[index]), int(self.BirdOffsets[index+1]))
+
+    def GetNumCams(self, index):
+        return int((self.Paths[index] >= 0).sum())
+
+    def GetBirdIDs(self, index):
+        """BirdID list of image"""
+        return [self.Birds[self.BirdIDs[Row]] for Row in self.GetRows(index) if self.InBirdID[Row]]
+
+    def PointDict(self, Points, Has):
+        return {self.Keypoints[k]: Points[k].tolist() for k in np.flatnonzero(Has)}
+
+    def Get3D(self, index):
+        """{bird: {keypoint: [x,y,z]}}"""
+        return {self.Birds[self.BirdIDs[Row]]: self.PointDict(self.Keypoint3D[Row], self.Has3D[Row])
+                for Row in self.GetRows(index) if self.In3D[Row]}
+
+    def Get2D(self, index, cam):
+        """{bird: {keypoint: [x,y]}} of one camera"""
+        return {self.Birds[self.BirdIDs[Row]]: self.PointDict(self.Keypoint2D[Row, cam], self.Has2D[Row, cam])
+                for Row in self.GetRows(index) if self.In2D[Row, cam]}
+
+    def GetBBox(self, index, cam):
+        """{bird: [x1,y1,x2,y2]} of one camera"""
+        return {self.Birds[self.BirdIDs[Row]]: self.BBox[Row, cam].tolist()
+                for Row in self.GetRows(index) if self.InBBox[Row, cam]}
+
+    def GetPath(self, index, cam):
+        return self.PathTable[self.Paths[index, cam]]
+
+    def GetCamName(self, index, cam):
+        return self.CamNameTable[self.CamNames[index, cam]]
+
+    def GetAnnotation(self, index):
+        """Rebuild the json annotation dict of an image"""
+        if self.Type == "2D":
+            return {"Image-ID": int(self.ImageID[index]),
+                    "BirdID": self.GetBirdIDs(index),
+                    "Path": self.GetPath(index, 0),
+                    "Keypoint3D": self.Get3D(index),
+                    "Keypoint2D": self.Get2D(index, 0),
+                    "BBox": self.GetBBox(index, 0)}
+
+        CameraData = [{"CamName": self.GetCamName(index, c),
+                       "Path": self.GetPath(index, c),
+                       "BBox": self.GetBBox(index, c),
+                       "Keypoint2D": self.Get2D(index, c)} for c in range(self.GetNumCams(index))]
+        return {"Image-ID": int(self.ImageID[index]),
+                "BirdID": self.GetBirdIDs(index),
+                "Keypoint3D": self.Get3D(index),
+                "CameraData": CameraData}
+
+    def GetKeypointIndex(self, Keypoints=None):
+        """Index of keypoint names in keypoint table, all keypoints if None"""
+        if Keypoints is None:
+            return np.arange(len(self.Keypoints))
+        Missing = [Key for Key in Keypoints if Key not in self.Keypoints]
+        if len(Missing) > 0:
+            raise ValueError("Keypoints %s not in annotations, available: %s"%(Missing, self.Keypoints))
+        return np.array([self.Keypoints.index(Key) for Key in Keypoints], dtype=np.int64)
+
+    def BuildDenseTensors(self):
+        """
+        Dense ground truth of all images, birds padded to the max number of birds per image
+        Built with one scatter per array from the per bird rows
+
+        Output dict, N images, B max birds, C cameras, K keypoints (order of self.Keypoints):
+        BirdIDs (N,B): index into self.Birds, -1 for padding
+        BirdMask (N,B): bird exists
+        Keypoint3D (N,B,K,3), Mask3D (N,B,K)
+        Keypoint2D (N,C,B,K,2), Mask2D (N,C,B,K)
+        BBox (N,C,B,4), MaskBBox (N,C,B)
+        """
+        N = len(self)
+        C = self.Meta["NumCams"]
+        K = len(self.Keypoints)
+        Offsets = np.asarray(self.BirdOffsets)
+        Counts = np.diff(Offsets)
+        B = int(Counts.max()) if N > 0 else 0
+
+        #image and slot of each bird row
+        Image = np.repeat(np.arange(N), Counts)
+        Slot = np.arange(int(Offsets[-1])) - Offsets[Image]
+
+        Out = {"BirdIDs": np.full((N, B), -1, dtype=np.int64),
+               "BirdMask": np.zeros((N, B), dtype=bool),
+               "Keypoint3D": np.full((N, B, K, 3), np.nan),
+               "Mask3D": np.zeros((N, B, K), dtype=bool),
+               "Keypoint2D": np.full((N, C, B, K, 2), np.nan),
+               "Mask2D": np.zeros((N, C, B, K), dtype=bool),
+               "BBox": np.full((N, C, B, 4), np.nan),
+               "MaskBBox": np.zeros((N, C, B), dtype=bool)}
+
+        Out["BirdIDs"][Image, Slot] = self.BirdIDs
+        Out["BirdMask"][Image, Slot] = True
+        Out["Keypoint3D"][Image, Slot] = self.Keypoint3D
+        Out["Mask3D"][Image, Slot] = self.Has3D & np.asarray(self.In3D)[:, None]
+        #camera axis before bird axis
+        Out["Keypoint2D"][Image, :, Slot] = self.Keypoint2D
+        Out["Mask2D"][Image, :, Slot] = self.Has2D & np.asarray(self.In2D)[:, :, None]
+        Out["BBox"][Image, :, Slot] = self.BBox
+        Out["MaskBBox"][Image, :, Slot] = self.InBBox
+
+        return Out
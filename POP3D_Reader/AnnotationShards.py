@@ -0,0 +1,134 @@
+# !/usr/bin/env python3
+""" Streaming annotation output, one JSON Lines shard per sequence plus a small manifest"""
+
+import os
+import json
+
+ManifestName = "manifest.json"
+ShardVersion = 1
+
+
+def GetShardDir(AnnotationDir, Type, Dim):
+    """Directory of shards of a split, e.g Annotation/Train-3D"""
+    return os.path.join(AnnotationDir, "%s-%s"%(Type, Dim))
+
+def IsManifest(Path):
+    return os.path.basename(Path) == ManifestName
+
+
+class ShardWriter:
+
+    def __init__(self, Path):
+        """
+        Append annotation records to a JSON Lines shard, one compact json per line.
+        Written to a temp file which only replaces Path in close(), so an interrupted shard is never read.
+        Has append() like a list, so it can be passed where annotation dict lists are filled.
+        """
+        self.Path = Path
+        self.TempPath = "%s.tmp%i"%(Path, os.getpid())
+        self.File = open(self.TempPath, "w")
+        self.Count = 0
+
+    def append(self, Record):
+        self.File.write(json.dumps(Record, separators=(",", ":")))
+        self.File.write("\n")
+        self.Count += 1
+
+    def __len__(self):
+        return self.Count
+
+    def close(self):
+        """Finish shard, returns number of records"""
+        self.File.flush()
+        os.fsync(self.File.fileno())
+        self.File.close()
+        os.replace(self.TempPath, self.Path)
+        return self.Count
+
+    def abort(self):
+        self.File.close()
+        if os.path.exists(self.TempPath):
+            os.remove(self.TempPath)
+
+
+class ShardManifest:
+
+    def __init__(self, ShardDir, Info=None, Order=None):
+        """
+        Manifest of shards of a split, rewritten atomically whenever a shard is finished,
+        so after a crash only the unfinished shards have to be written again.
+
+        ShardDir [str]: directory of shards and manifest.json, created if missing
+        Info [dict]: info of annotations, like info of the json files
+        Order [list]: keys of all shards, in the order records are read (e.g sequence order),
+                      if None, taken from existing manifest
+
+        manifest.json: {"Version", "Info", "Order": [keys], "Shards": {key: {"File", "Records"}}, "Complete"}
+        """
+        self.ShardDir = ShardDir
+        self.Path = os.path.join(ShardDir, ManifestName)
+        if os.path.exists(self.Path):
+            with open(self.Path) as f:
+                self.Manifest = json.load(f)
+            if Order is not None and [str(Key) for Key in Order] != self.Manifest["Order"]:
+                print("Shard order changed, finished shards in %s are kept"%ShardDir)
+                self.Manifest["Order"] = [str(Key) for Key in Order]
+            if Info is not None:
+                self.Manifest["Info"] = Info
+        else:
+            if not os.path.exists(ShardDir):
+                os.makedirs(ShardDir)
+            self.Manifest = {"Version": ShardVersion, "Info": Info, "Order": [str(Key) for Key in (Order or [])],
+                             "Shards": {}, "Complete": False}
+        self.Save()
+
+    def GetShardPath(self, Key):
+        return os.path.join(self.ShardDir, "%s.jsonl"%Key)
+
+    def HasShard(self, Key):
+        """Shard was finished, and file still exists"""
+        Shard = self.Manifest["Shards"].get(str(Key))
+        return Shard is not None and os.path.exists(os.path.join(self.ShardDir, Shard["File"]))
+
+    def AddShard(self, Key, Records):
+        """Record a finished shard (see ShardWriter.close)"""
+        self.Manifest["Shards"][str(Key)] = {"File": os.path.basename(self.GetShardPath(Key)), "Records": int(Records)}
+        self.Manifest["Complete"] = all(self.HasShard(Key) for Key in self.Manifest["Order"])
+        self.Save()
+
+    def Save(self):
+        TempPath = "%s.tmp%i"%(self.Path, os.getpid())
+        with open(TempPath, "w") as f:
+            json.dump(self.Manifest, f, indent=4)
+        os.replace(TempPath, self.Path)
+
+
+def ReadManifest(Path):
+    with open(Path) as f:
+        return json.load(f)
+
+def IterRecords(ManifestPath):
+    """
+    Stream annotation records of all finished shards in manifest order, one line at a time
+    Image-ID is set to the running index over all shards, same as a merged json
+    """
+    Manifest = ReadManifest(ManifestPath)
+    if not Manifest["Complete"]:
+        print("Warning: shards in %s are not complete, reading finished shards only"%os.path.dirname(ManifestPath))
+    ImageID = 0
+    for Key in Manifest["Order"]:
+        Shard = Manifest["Shards"].get(Key)
+        if Shard is None:
+            continue
+        with open(os.path.join(os.path.dirname(ManifestPath), Shard["File"])) as f:
+            for Line in f:
+                if not Line.strip():
+                    continue
+                Record = json.loads(Line)
+                Record["Image-ID"] = ImageID
+                ImageID += 1
+                yield Record
+
+def LoadData(ManifestPath):
+    """All shards as one dict, same layout as the json files: {"info":..., "Annotations":[...]}"""
+    return {"info": ReadManifest(ManifestPath)["Info"], "Annotations": list(IterRecords(ManifestPath))}
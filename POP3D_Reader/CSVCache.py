@@ -0,0 +1,110 @@
+# !/usr/bin/env python3
+""" Binary sidecar cache for 3DPOP csvs, so each csv is only parsed as text once"""
+
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+CacheVersion = 2 #2: float columns are stored as read from csv (float64)
+
+
+def GetSourceStamp(Path):
+    """Get modification time (ns) and size of a file, used to check if a cache is stale"""
+    Stat = os.stat(Path)
+    return np.array([Stat.st_mtime_ns, Stat.st_size], dtype=np.int64)
+
+def GetCachePath(Path, CacheDir=None, Ext=".npz"):
+    """
+    Get path of the sidecar cache file of a source file
+
+    Path: path to source file
+    CacheDir: if None, cache is written next to the source file,
+              else into CacheDir, with a hash of the source directory to avoid name clashes
+              (e.g Annotation and TrainingSplit csvs have the same file names)
+    Ext: extension of cache file
+    """
+    if CacheDir is None:
+        return Path + Ext
+
+    DirHash = hashlib.md5(os.path.dirname(os.path.abspath(Path)).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(CacheDir, "%s.%s%s"%(os.path.basename(Path), DirHash, Ext))
+
+def IsCacheValid(Stamp, Path):
+    """Check if saved stamp matches current source file"""
+    return np.array_equal(np.asarray(Stamp, dtype=np.int64), GetSourceStamp(Path))
+
+def WriteCache(CachePath, ArrayDict):
+    """Write dict of arrays to npz, via a temp file so a crash never leaves a half written cache"""
+    TempPath = "%s.tmp%i"%(CachePath, os.getpid())
+    try:
+        if not os.path.exists(os.path.dirname(os.path.abspath(CachePath))):
+            os.makedirs(os.path.dirname(os.path.abspath(CachePath)))
+        with open(TempPath, "wb") as f:
+            np.savez(f, **ArrayDict)
+        os.replace(TempPath, CachePath)
+        return True
+    except OSError as e:
+        #e.g read only dataset drive, just continue without cache
+        print("Could not write cache file %s: %s"%(CachePath, e))
+        if os.path.exists(TempPath):
+            os.remove(TempPath)
+        return False
+
+def CastFloatColumns(df, dtype):
+    """Cast all float columns to given dtype, integer columns (e.g frame) are kept, nothing is done if dtype is None"""
+    if dtype is None:
+        return df
+    FloatCols = [col for col in df.columns if pd.api.types.is_float_dtype(df[col])]
+    if len(FloatCols) > 0:
+        df[FloatCols] = df[FloatCols].astype(dtype)
+    return df
+
+def LoadCSVCache(CachePath, Path):
+    """Load dataframe from npz cache, returns None if cache is missing, stale or unreadable"""
+    if not os.path.exists(CachePath):
+        return None
+    try:
+        with np.load(CachePath, allow_pickle=False) as Cache:
+            if int(Cache["__version__"]) != CacheVersion or not IsCacheValid(Cache["__stamp__"], Path):
+                return None
+            Columns = Cache["__columns__"].tolist()
+            df = pd.DataFrame({col: Cache["c%i"%i] for i, col in enumerate(Columns)}, columns=Columns)
+    except (OSError, KeyError, ValueError) as e:
+        print("Could not read cache file %s, reading csv instead: %s"%(CachePath, e))
+        return None
+    return df
+
+def ReadCSV(Path, CacheDir=None, Cache=True, dtype=None):
+    """
+    Read a 3DPOP csv, using a binary copy if it exists and is up to date with the csv.
+    If not, parse csv then write the binary copy for next time.
+    The binary copy keeps the dtypes of the csv, so values are the same as pd.read_csv
+
+    Path: path to csv
+    CacheDir: directory to save binary copy, if None, saved next to csv
+    Cache: if False, just use pd.read_csv
+    dtype: if given (e.g np.float32 to save memory), float columns are cast to it after loading
+    """
+    if not Cache:
+        df = pd.read_csv(Path)
+        return CastFloatColumns(df, dtype)
+
+    CachePath = GetCachePath(Path, CacheDir)
+    df = LoadCSVCache(CachePath, Path)
+    if df is not None:
+        return CastFloatColumns(df, dtype)
+
+    Stamp = GetSourceStamp(Path)
+    df = pd.read_csv(Path)
+    if not all(pd.api.types.is_numeric_dtype(df[col]) for col in df.columns):
+        #only numeric tables are cached
+        return CastFloatColumns(df, dtype)
+
+    ArrayDict = {"c%i"%i: df[col].to_numpy() for i, col in enumerate(df.columns)}
+    ArrayDict["__columns__"] = np.array(list(df.columns), dtype=str)
+    ArrayDict["__stamp__"] = Stamp
+    ArrayDict["__version__"] = np.array(CacheVersion)
+    WriteCache(CachePath, ArrayDict)
+
+    return CastFloatColumns(df, dtype)
@@ -0,0 +1,145 @@
+# !/usr/bin/env python3
+""" Process wide registry of camera calibrations, each pickle is read once and derived matrices are cached"""
+
+import threading
+import pickle as p
+import numpy as np
+import cv2
+
+
+def RotMatrixToQuat(R):
+    """
+    Convert rotation matrix to quaternion [w,x,y,z]
+    Same convention and sign as pyquaternion.Quaternion(matrix=R), used by POP3D_AP
+    """
+    m = np.asarray(R, dtype=np.float64).conj().transpose()
+    if m[2, 2] < 0:
+        if m[0, 0] > m[1, 1]:
+            t = 1 + m[0, 0] - m[1, 1] - m[2, 2]
+            q = [m[1, 2]-m[2, 1], t, m[0, 1]+m[1, 0], m[2, 0]+m[0, 2]]
+        else:
+            t = 1 - m[0, 0] + m[1, 1] - m[2, 2]
+            q = [m[2, 0]-m[0, 2], m[0, 1]+m[1, 0], t, m[1, 2]+m[2, 1]]
+    else:
+        if m[0, 0] < -m[1, 1]:
+            t = 1 - m[0, 0] - m[1, 1] + m[2, 2]
+            q = [m[0, 1]-m[1, 0], m[2, 0]+m[0, 2], m[1, 2]+m[2, 1], t]
+        else:
+            t = 1 + m[0, 0] + m[1, 1] + m[2, 2]
+            q = [t, m[1, 2]-m[2, 1], m[2, 0]-m[0, 2], m[0, 1]-m[1, 0]]
+    q = np.array(q, dtype=np.float64)
+    q *= 0.5 / np.sqrt(t)
+    return q
+
+
+class CameraCalibration:
+
+    def __init__(self, Sequence, CamName, ExtPath, IntPath):
+        """
+        Calibration of one camera in one sequence, pickles are read on first access only
+
+        Sequence [str]: sequence name, e.g Sequence1_n01_01072022
+        CamName [str]: camera name, e.g Cam1
+        ExtPath [str]: path to extrinsics pickle (rvec, tvec)
+        IntPath [str]: path to intrinsics pickle (camera matrix, distortion)
+
+        Attributes (all cached):
+        rvec, tvec, camMat, distCoef: as saved in the pickles
+        R: 3x3 rotation matrix
+        P: 3x4 projection matrix camMat @ [R|t]
+        Quat: rotation as quaternion [w,x,y,z]
+        """
+        self.Sequence = Sequence
+        self.CamName = CamName
+        self.ExtPath = ExtPath
+        self.IntPath = IntPath
+        self.Cache = {}
+        self.UndistortMaps = {} #{(width,height): (map1,map2)}
+        self.Lock = threading.RLock() #derived values load their inputs while holding the lock
+
+    def LoadExtrinsics(self):
+        rvec, tvec = p.load(open(self.ExtPath,"rb"))
+        self.Cache.update({"rvec":rvec, "tvec":tvec})
+
+    def LoadIntrinsics(self):
+        camMat, distCoef = p.load(open(self.IntPath,"rb"))
+        self.Cache.update({"camMat":camMat, "distCoef":distCoef})
+
+    def Get(self, Name):
+        """Get cached value, loading/ computing it on first access"""
+        if Name in self.Cache:
+            return self.Cache[Name]
+        with self.Lock:
+            if Name in self.Cache:
+                return self.Cache[Name]
+            if Name in ["rvec", "tvec"]:
+                self.LoadExtrinsics()
+            elif Name in ["camMat", "distCoef"]:
+                self.LoadIntrinsics()
+            elif Name == "R":
+                self.Cache["R"] = cv2.Rodrigues(np.asarray(self.Get("rvec"), dtype=np.float64))[0]
+            elif Name == "P":
+                Rt = np.hstack([self.Get("R"), np.asarray(self.Get("tvec"), dtype=np.float64).reshape(3, 1)])
+                self.Cache["P"] = np.asarray(self.Get("camMat"), dtype=np.float64) @ Rt
+            elif Name == "Quat":
+                self.Cache["Quat"] = RotMatrixToQuat(self.Get("R"))
+            else:
+                raise KeyError(Name)
+        return self.Cache[Name]
+
+    rvec = property(lambda self: self.Get("rvec"))
+    tvec = property(lambda self: self.Get("tvec"))
+    camMat = property(lambda self: self.Get("camMat"))
+    distCoef = property(lambda self: self.Get("distCoef"))
+    R = property(lambda self: self.Get("R"))
+    P = property(lambda self: self.Get("P"))
+    Quat = property(lambda self: self.Get("Quat"))
+
+    def GetUndistortMaps(self, Size):
+        """Remap tables to undistort images of given (width,height), computed once per size"""
+        Size = tuple(int(x) for x in Size)
+        if Size not in self.UndistortMaps:
+            camMat = np.asarray(self.camMat, dtype=np.float64)
+            self.UndistortMaps[Size] = cv2.initUndistortRectifyMap(camMat, np.asarray(self.distCoef, dtype=np.float64),
+                                                                   None, camMat, Size, cv2.CV_16SC2)
+        return self.UndistortMaps[Size]
+
+    def Undistort(self, img):
+        """Undistort image with cached remap tables, equivalent to cv2.undistort without recomputing the maps"""
+        map1, map2 = self.GetUndistortMaps((img.shape[1], img.shape[0]))
+        return cv2.remap(img, map1, map2, cv2.INTER_LINEAR)
+
+
+class CalibrationRegistry:
+
+    def __init__(self):
+        """Calibrations keyed by (sequence, camera name)"""
+        self.Calibrations = {}
+        self.Lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.Calibrations)
+
+    def Get(self, Sequence, CamName, ExtPath, IntPath):
+        """
+        Get calibration of a camera, created on first request
+        If the same camera is requested with other pickle paths, it is replaced
+        """
+        Key = (Sequence, CamName)
+        with self.Lock:
+            Calib = self.Calibrations.get(Key)
+            if Calib is None or Calib.ExtPath != ExtPath or Calib.IntPath != IntPath:
+                Calib = CameraCalibration(Sequence, CamName, ExtPath, IntPath)
+                self.Calibrations[Key] = Calib
+        return Calib
+
+    def clear(self):
+        with self.Lock:
+            self.Calibrations.clear()
+
+
+Registry = CalibrationRegistry()
+
+def GetCalibration(Sequence, CamName, ExtPath, IntPath):
+    """Get calibration from the process wide registry"""
+    return Registry.Get(Sequence, CamName, ExtPath, IntPath)
@@ -8,10 +8,42 @@ import numpy as np
 import pandas as pd
 import cv2
 
+from POP3D_Reader import KeypointStore, CSVCache, Calibration
+
+
+AnnotationTypes = ["Keypoint2D", "Keypoint2DFilter", "BBox", "Keypoint3D"]
+AnnotationDims = {"Keypoint2D": 2, "Keypoint2DFilter": 2, "BBox": 4, "Keypoint3D": 3}
+
+def LazyCalibration(Name, Loader, Doc):
+    """Calibration attribute that calls given loader method on first access"""
+    def Getter(self):
+        if Name not in self.Calibration:
+            getattr(self, Loader)()
+        return self.Calibration[Name]
+
+    def Setter(self, Value):
+        self.Calibration[Name] = Value
+
+    return property(Getter, Setter, doc=Doc)
+
+def LazyAnnotation(Name, Doc):
+    """Annotation dataframe attribute that is read from its csv on first access"""
+    def Getter(self):
+        if Name not in self.Annotations:
+            if Name not in self.AnnotationPaths:
+                raise AttributeError("%s of %s not loaded, load the dataset first"%(Name, self.CamName))
+            self.Annotations[Name] = self.ReadCSV(self.AnnotationPaths[Name])
+        return self.Annotations[Name]
+
+    def Setter(self, df):
+        self.Annotations[Name] = df
+
+    return property(Getter, Setter, doc=Doc)
+
 
 class CameraObject:
     
-    def __init__(self,CamName, VideoPath, ExtPath,IntPath,Resolution):
+    def __init__(self,CamName, VideoPath, ExtPath,IntPath,Resolution, Cache=True, CacheDir=None, Sequence=None, Subjects=None):
         """
         Initialize Camera Object
         CamName [str]: Name of Camera
@@ -19,29 +51,79 @@ class CameraObject:
         ExtPath [str]: Path to extrinsics pickle
         IntPath [str]: Path to intrinsics pickle
         Resolution [tuple]: (width,height) of input video        
+        Cache [bool]: Whether to cache csvs as binary files for faster loading, see CSVCache
+        CacheDir [str]: Directory to save cache, if None, saved next to csvs
+        Sequence [str]: Name of sequence, key of calibration registry, if None, read from extrinsics file name
+        Subjects [list]: Bird IDs of the trial, columns of each bird are matched by prefix,
+                         if None, read from column names (see KeypointStore)
         """
         
         # import ipdb;ipdb.set_trace()
         self.CamName = CamName
+        self.Sequence = Sequence if Sequence is not None else os.path.basename(ExtPath).split("-")[0]
         self.VideoPath = VideoPath
         self.dim = Resolution
-        
-        ##Load camera Extrinsics
-        if os.path.exists(ExtPath):
-            self.rvec, self.tvec = self.LoadExt(ExtPath)
+        self.Cache = Cache
+        self.CacheDir = CacheDir
+        self.Subjects = Subjects
+        self.KeypointStores = {} #frame indexed stores of loaded dataframes, see GetKeypointStore
+
+        ##Calibration and annotations are only loaded on first access, see LazyCalibration and LazyAnnotation
+        self.ExtPath = ExtPath
+        self.IntPath = IntPath
+        self.Calibration = {}
+        self.AnnotationPaths = {}
+        self.Annotations = {}
+
+    rvec = LazyCalibration("rvec", "LoadExtrinsics", "Extrinsics rotation vector (opencv)")
+    tvec = LazyCalibration("tvec", "LoadExtrinsics", "Extrinsics translation vector")
+    camMat = LazyCalibration("camMat", "LoadIntrinsics", "Camera matrix (3x3)")
+    distCoef = LazyCalibration("distCoef", "LoadIntrinsics", "Distortion coefficients")
+
+    Keypoint2D = LazyAnnotation("Keypoint2D", "2D keypoint ground truth dataframe")
+    Keypoint2DFilter = LazyAnnotation("Keypoint2DFilter", "2D keypoint ground truth dataframe after GESD filtering")
+    BBox = LazyAnnotation("BBox", "BBox ground truth dataframe")
+    Keypoint3D = LazyAnnotation("Keypoint3D", "3D keypoint ground truth dataframe")
+
+    def GetCalibration(self):
+        """Get calibration of this camera from the process wide registry, see Calibration.CalibrationRegistry"""
+        return Calibration.GetCalibration(self.Sequence, self.CamName, self.ExtPath, self.IntPath)
+
+    def LoadExtrinsics(self):
+        """Load camera extrinsics into calibration dict"""
+        if os.path.exists(self.ExtPath):
+            rvec, tvec = self.GetCalibration().rvec, self.GetCalibration().tvec
         else:
             print("No extrinsics found, loading default")
-            self.rvec = [0,0,0]
-            self.tvec = [0,0,0]
-            
-        ##Load camera Intrinsics
-        if os.path.exists(IntPath):
-            self.camMat, self.distCoef = self.LoadInt(IntPath)
+            rvec = [0,0,0]
+            tvec = [0,0,0]
+        self.Calibration.update({"rvec":rvec, "tvec":tvec})
+
+    def LoadIntrinsics(self):
+        """Load camera intrinsics into calibration dict"""
+        if os.path.exists(self.IntPath):
+            camMat, distCoef = self.GetCalibration().camMat, self.GetCalibration().distCoef
         else:
             print("No intrinsics found, loading default")
-            self.camMat = np.identity(3)
-            self.distCoef = [0,0,0,0,0]
+            camMat = np.identity(3)
+            distCoef = [0,0,0,0,0]
+        self.Calibration.update({"camMat":camMat, "distCoef":distCoef})
+
+    def SetAnnotationPath(self, Name, Path):
+        """
+        Set path of an annotation csv, which is then only read when the attribute is first accessed
+        
+        Name: one of Keypoint2D, Keypoint2DFilter, BBox, Keypoint3D
+        Path: path to csv
+        """
+        if Name not in AnnotationTypes:
+            raise ValueError("Unknown annotation type %s, has to be one of %s"%(Name, AnnotationTypes))
+        self.AnnotationPaths[Name] = Path
+        self.Annotations.pop(Name, None) #unload previous data
         
+    def IsLoaded(self, Name):
+        """Check if annotation/ calibration is already loaded, without loading it"""
+        return Name in self.Annotations or Name in self.Calibration
     
     def LoadSyncArr(self, SyncArrPath):
         """Load Sync Array"""
@@ -60,26 +142,72 @@ class CameraObject:
     
     def ReadCSV(self, Path):
         """Load 2D keypoint ground truth data"""
-        df = pd.read_csv(Path)
+        df = CSVCache.ReadCSV(Path, CacheDir=self.CacheDir, Cache=self.Cache)
         return df
 
     def load2DKeypoint(self, K2DPath):
         """Load 2D keypoint ground truth data"""
-        self.Keypoint2D = pd.read_csv(K2DPath)
+        self.Keypoint2D = self.ReadCSV(K2DPath)
+        self.GetKeypointStore(self.Keypoint2D, 2)
         
     def load2DFilterKeypoint(self, K2DPath):
         """Load 2D keypoint ground truth data after GESD filtering"""
-        self.Keypoint2DFilter = pd.read_csv(K2DPath)
+        self.Keypoint2DFilter = self.ReadCSV(K2DPath)
+        self.GetKeypointStore(self.Keypoint2DFilter, 2)
     
     def loadBBoxData(self, BBoxPath):
         """Load BBox ground truth data"""
-        self.BBox = pd.read_csv(BBoxPath)
+        self.BBox = self.ReadCSV(BBoxPath)
+        self.GetKeypointStore(self.BBox, 4)
         
     def load3DKeypoint(self, K3DPath):
         """Load BBox ground truth data"""
-        self.Keypoint3D = pd.read_csv(K3DPath)
+        self.Keypoint3D = self.ReadCSV(K3DPath)
+        self.GetKeypointStore(self.Keypoint3D, 3)
         
         
+    def GetKeypointStore(self, df, Dim):
+        """
+        Get frame indexed store for a given dataframe, built once then reused for all lookups
+        
+        df: Keypoint2D, Keypoint3D or BBox dataframe
+        Dim: number of columns per point (2D: 2, 3D: 3, BBox: 4)
+        """
+        Key = (id(df), Dim)
+        if Key in self.KeypointStores and self.KeypointStores[Key][0] is df:
+            return self.KeypointStores[Key][1]
+        
+        Store = KeypointStore.KeypointStore(df, Dim, Subjects=self.Subjects)
+        #only keep stores of dataframes still loaded in this object
+        LoadedDfs = list(self.Annotations.values())
+        self.KeypointStores = {k:v for k,v in self.KeypointStores.items() if any(v[0] is Loaded for Loaded in LoadedDfs)}
+        #keep reference to df, so id is not reused while store is alive
+        self.KeypointStores[Key] = (df, Store)
+        return Store
+
+    def ReadKeypointData(self, df, frame, bird, Dim, Keypoints=None, StripName=False):
+        """Shared dictionary wrapper for Read2DKeypointData and Read3DKeypointData"""
+        Store = self.GetKeypointStore(df, Dim)
+        if not Store.HasBird(bird):
+            return None,None
+        
+        Points = Store.GetBirdFrame(frame, bird).tolist()
+        Names = Store.Keypoints[bird]
+        
+        OutDict = {}   
+        for i in range(len(Names)):
+            FullName = "%s_%s"%(bird, Names[i])
+            if Keypoints is None: #default, read all
+                OutDict[FullName] = Points[i]
+            else:
+                for Key in Keypoints:
+                    if FullName.endswith(Key):
+                        if StripName:
+                            OutDict[Key] = Points[i]
+                        else:
+                            OutDict[FullName] = Points[i]
+        return OutDict
+        
     def Read2DKeypointData(self, df, frame, bird,Keypoints=None,StripName=False):
         """ 
         Given 2D Keypoint pandas dataframe, extract 2D keypoint data for all keypoints for a given bird ID
@@ -95,47 +223,7 @@ class CameraObject:
         Dict: {Keypoint: [x,y]}
         
         """
-        ObjectColumns = [name for name in df.columns if name.startswith(bird)]
-        AllObjPoints = []
-        AllObjNames = []
-        if len(ObjectColumns) ==0:
-            return None,None
-        #Assuming all object column sequence goes from x then y,
-        #append list of coordinates 2 at a time
-        counter = 0
-        ObjectPoints = [None]*2 #Vector for 1 single 2D point
-
-        #Vicon Output named "Frame", custom features output named "frame"
-        #test for it:
-        if 'frame' in df.columns:
-            FrameName = 'frame'
-        elif 'Frame' in df.columns:
-            FrameName = 'Frame'
-
-        for col in ObjectColumns:
-            Index = df.index[df[FrameName]==frame].to_list()[0]
-            ObjectPoints[counter] = float(df[col].values[Index]) 
-            counter += 1
-            if counter == 2:#if 2 values are filled
-                AllObjPoints.append(ObjectPoints)
-                counter = 0 #reset counter
-                ObjectPoints = [None]*2
-                AllObjNames.append(col.strip("_y"))
-        
-        OutDict = {}   
-        for i in range(len(AllObjNames)):
-            if Keypoints is None: #default, read all
-                OutDict[AllObjNames[i]] = AllObjPoints[i]
-            else:
-                for Key in Keypoints:
-                    if AllObjNames[i].endswith(Key):
-                        if StripName:
-                            OutDict[Key] = AllObjPoints[i]
-                        else:
-                            OutDict[AllObjNames[i]] = AllObjPoints[i]
-                
-        # OutDict = {AllObjNames[i]:AllObjPoints[i] for i in range(len(AllObjNames)) if AllObjNames[i].endswith(Key) for Key in Keypoints}
-        return(OutDict)
+        return self.ReadKeypointData(df, frame, bird, 2, Keypoints, StripName)
         
     def Read3DKeypointData(self, df, frame, bird,Keypoints = None,StripName = False):
         """ 
@@ -154,46 +242,7 @@ class CameraObject:
         Dict: {Keypoint: point}
         
         """
-        ObjectColumns = [name for name in df.columns if name.startswith(bird)]
-        AllObjPoints = []
-        AllObjNames = []
-        if len(ObjectColumns) ==0:
-            return None,None
-        #Assuming all object column sequence goes from x then y then z,
-        #append list of coordinates 3 at a time
-        counter = 0
-        ObjectPoints = [None]*3 #Vector for 1 single 3D point
-
-        #Vicon Output named "Frame", custom features output named "frame"
-        #test for it:
-        if 'frame' in df.columns:
-            FrameName = 'frame'
-        elif 'Frame' in df.columns:
-            FrameName = 'Frame'
-
-        for col in ObjectColumns:
-            Index = df.index[df[FrameName]==frame].to_list()[0]
-            ObjectPoints[counter] = float(df[col].values[Index]) 
-            counter += 1
-            if counter == 3:#if 3 values are filled
-                AllObjPoints.append(ObjectPoints)
-                counter = 0 #reset counter
-                ObjectPoints = [None]*3
-                AllObjNames.append(col.strip("_z"))
-            
-        OutDict = {}   
-        for i in range(len(AllObjNames)):
-            if Keypoints is None: #default, read all
-                OutDict[AllObjNames[i]] = AllObjPoints[i]
-            else:
-                for Key in Keypoints:
-                    if AllObjNames[i].endswith(Key):
-                        if StripName:
-                            OutDict[Key] = AllObjPoints[i]
-                        else:
-                            OutDict[AllObjNames[i]] = AllObjPoints[i]
-        # OutDict = {AllObjNames[i]:AllObjPoints[i] for i in range(len(AllObjNames))}
-        return(OutDict)
+        return self.ReadKeypointData(df, frame, bird, 3, Keypoints, StripName)
     
     def GetBBoxData(self, df, frame, bird):
         """Given bbox dataframe, frame number and birdID, get topleft (Start) and bottom right (End) corner of BBox
@@ -208,14 +257,13 @@ class CameraObject:
         End: Bottom right corner of bbox, [x,y]
         
         """
-        ObjectColumns = [name for name in df.columns if name.startswith(bird)]
-        if len(ObjectColumns) ==0:
+        Store = self.GetKeypointStore(df, 4)
+        if not Store.HasBird(bird):
             return None,None
 
-        Index = df.index[df["frame"]==frame].to_list()[0]
-        
-        Start = (df.loc[Index][ObjectColumns[0]],df.loc[Index][ObjectColumns[1]])
-        End = (Start[0]+df.loc[Index][ObjectColumns[2]],Start[1]+df.loc[Index][ObjectColumns[3]])
+        x, y, w, h = Store.GetBirdFrame(frame, bird)[0]
+        Start = (x,y)
+        End = (Start[0]+w,Start[1]+h)
 
         return Start,End
     
@@ -0,0 +1,194 @@
+# !/usr/bin/env python3
+""" Dataset level catalog of 3DPOP, metadata is parsed once and trials are created from it"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import cv2
+
+from POP3D_Reader import Trial, ValidityIndex
+
+
+def ExportSequenceQA(Catalog, SequenceNum, OutDir, Filter, Type, ExportArgs):
+    """Worker of Dataset3DPOP.ExportQAVideos, exports QA videos of one sequence"""
+    PigeonTrial = Catalog.GetTrial(SequenceNum)
+    if Type == "3DPOP":
+        PigeonTrial.load3DPopDataset(Filter=Filter, artifacts=["Keypoint2D", "BBox"])
+    else:
+        PigeonTrial.load3DPopTrainingSet(Filter=Filter, Type=Type, artifacts=["Keypoint2D", "BBox"])
+    return PigeonTrial.ExportQAVideos(os.path.join(OutDir, PigeonTrial.TrialName), **ExportArgs)
+
+
+class Dataset3DPOP:
+
+    def __init__(self, dataDir, MetaDataPath=None, Cache=True, CacheDir=None):
+        """
+        Initialize dataset catalog, reads metadata csv once
+
+        Input:
+        dataDir [str]: Directory to dataset
+        MetaDataPath [str]: Path to metadata csv, default Pop3DMetadata.csv in dataDir
+        Cache, CacheDir: passed on to each Trial, see Trial
+        """
+        self.dataDir = dataDir
+        self.Cache = Cache
+        self.CacheDir = CacheDir
+
+        if MetaDataPath is None:
+            MetaDataPath = os.path.join(dataDir, "Pop3DMetadata.csv")
+        self.MetaData = pd.read_csv(MetaDataPath, dtype=str)
+        self.Rows = {int(row["Sequence"]): row for row in self.MetaData.to_dict("records")}
+        self.Sequences = sorted(self.Rows.keys())
+
+        self.FileNameDicts = {} #{(Sequence, Type): FileNameDict}
+        self.Stats = {} #{(Sequence, Type): stats dict}
+        self.ValidityIndexes = {} #{(Sequence, Type, Filter): ValidityIndex}
+
+    def __len__(self):
+        return len(self.Sequences)
+
+    def GetRow(self, SequenceNum):
+        """Get metadata row as dict"""
+        if int(SequenceNum) not in self.Rows:
+            raise ValueError("Sequence %s not in metadata"%SequenceNum)
+        return dict(self.Rows[int(SequenceNum)])
+
+    def GetTrialName(self, SequenceNum):
+        return Trial.GetTrialName(self.GetRow(SequenceNum))
+
+    def GetBaseDir(self, SequenceNum):
+        """Get directory of trial"""
+        RowDict = self.GetRow(SequenceNum)
+        return os.path.join(self.dataDir, "Pigeon%02d"%int(RowDict["IndividualNum"]), Trial.GetTrialName(RowDict))
+
+    def GetSubjects(self, SequenceNum):
+        return self.GetRow(SequenceNum)["Subjects"].split(";")
+
+    def GetIndividualNum(self, SequenceNum):
+        return int(self.GetRow(SequenceNum)["IndividualNum"])
+
+    def GetFileNames(self, SequenceNum, Type="3DPOP"):
+        """
+        Get file name dictionary of a trial, generated once then cached
+        Type: type of data, can be: [3DPOP, Train, Val, Test]
+        """
+        Key = (int(SequenceNum), Type)
+        if Key not in self.FileNameDicts:
+            self.FileNameDicts[Key] = Trial.GenerateFileNames(self.GetBaseDir(SequenceNum), self.GetTrialName(SequenceNum), Type)
+        return self.FileNameDicts[Key]
+
+    def Query(self, IndividualNum=None, Date=None, Subjects=None, Sequences=None):
+        """
+        Find sequences matching all given conditions, only uses metadata, no trial folder is read
+
+        IndividualNum [int/list]: number of individuals, e.g 5 or [1,2]
+        Date [str/list]: recording date as in metadata, e.g "01072022"
+        Subjects [str/list]: bird IDs that all have to be present in the sequence
+        Sequences [list]: only search within these sequences
+
+        returns: sorted list of sequence numbers
+        """
+        if IndividualNum is not None and not isinstance(IndividualNum, (list, tuple, set)):
+            IndividualNum = [IndividualNum]
+        if Date is not None and not isinstance(Date, (list, tuple, set)):
+            Date = [Date]
+        if isinstance(Subjects, str):
+            Subjects = [Subjects]
+
+        Out = []
+        for Seq in self.Sequences:
+            RowDict = self.Rows[Seq]
+            if Sequences is not None and Seq not in [int(x) for x in Sequences]:
+                continue
+            if IndividualNum is not None and int(RowDict["IndividualNum"]) not in [int(x) for x in IndividualNum]:
+                continue
+            if Date is not None and RowDict["Date"] not in [str(x) for x in Date]:
+                continue
+            if Subjects is not None and not set(Subjects).issubset(RowDict["Subjects"].split(";")):
+                continue
+            Out.append(Seq)
+
+        return Out
+
+    def GetTrial(self, SequenceNum, **kwargs):
+        """Create Trial object from catalog, kwargs are passed on to Trial"""
+        kwargs.setdefault("Cache", self.Cache)
+        kwargs.setdefault("CacheDir", self.CacheDir)
+        return Trial.Trial(self.dataDir, SequenceNum, Catalog=self, **kwargs)
+
+    def GetStats(self, SequenceNum, Type="3DPOP"):
+        """
+        Basic stats of a trial, computed on first call then cached
+        Only reads file sizes and video headers, no csv is parsed
+
+        returns dict:
+        IndividualNum: number of individuals
+        Subjects: list of bird IDs
+        FrameCounts: frame count of each camera video, None if video missing
+        FileSizes: {key of file name dict: list of file sizes in bytes, None if file missing}
+        """
+        Key = (int(SequenceNum), Type)
+        if Key in self.Stats:
+            return self.Stats[Key]
+
+        FileNameDict = self.GetFileNames(SequenceNum, Type)
+
+        FrameCounts = []
+        for VideoPath in FileNameDict["VideoPaths"]:
+            if not os.path.exists(VideoPath):
+                FrameCounts.append(None)
+                continue
+            cap = cv2.VideoCapture(VideoPath)
+            FrameCounts.append(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+            cap.release()
+
+        FileSizes = {key: [os.path.getsize(path) if os.path.exists(path) else None for path in PathList]
+                     for key, PathList in FileNameDict.items()}
+
+        self.Stats[Key] = {"IndividualNum": self.GetIndividualNum(SequenceNum),
+                           "Subjects": self.GetSubjects(SequenceNum),
+                           "FrameCounts": FrameCounts,
+                           "FileSizes": FileSizes}
+        return self.Stats[Key]
+
+    def GetValidityIndex(self, SequenceNum, Type="3DPOP", Filter=False):
+        """
+        Get packed validity index of 2D keypoints of a trial, see ValidityIndex
+        Only reads the csvs the first time ever, afterwards loaded from the sidecar index file
+        Type: type of data, can be: [3DPOP, Train, Val, Test]
+        Filter: use filtered 2D keypoints
+        """
+        Key = (int(SequenceNum), Type, Filter)
+        if Key not in self.ValidityIndexes:
+            FileNameDict = self.GetFileNames(SequenceNum, Type)
+            self.ValidityIndexes[Key] = ValidityIndex.ValidityIndex(FileNameDict["Key2DFilterPaths" if Filter else "Key2DPaths"],
+                                                                    Subjects=self.GetSubjects(SequenceNum),
+                                                                    CacheDir=self.CacheDir, Cache=self.Cache)
+        return self.ValidityIndexes[Key]
+
+    def ExportQAVideos(self, OutDir, Sequences=None, Processes=None, Filter=False, Type="3DPOP", **ExportArgs):
+        """
+        Headless export of QA overlay videos for many sequences, sequences are distributed over a process pool
+        Each process runs the threaded pipeline of Trial.ExportQAVideos for one sequence
+
+        Input:
+        OutDir [str]: output directory, videos of each sequence saved in OutDir/TrialName
+        Sequences [list]: sequences to export, default all
+        Processes [int]: number of processes, default number of cpus
+        Filter [bool]: use filtered 2D keypoints
+        Type [str]: data to export, can be: [3DPOP, Train, Val, Test]
+        ExportArgs: passed on to Trial.ExportQAVideos, e.g BBox=True, Traj=True
+
+        Output:
+        OutPaths [dict]: {Sequence: list of video paths}
+        """
+        if Sequences is None:
+            Sequences = self.Sequences
+
+        OutPaths = {}
+        with ProcessPoolExecutor(max_workers=Processes) as Executor:
+            Futures = {Seq: Executor.submit(ExportSequenceQA, self, Seq, OutDir, Filter, Type, ExportArgs) for Seq in Sequences}
+            for Seq, Future in Futures.items():
+                OutPaths[Seq] = Future.result()
+
+        return OutPaths
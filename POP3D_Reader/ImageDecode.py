@@ -0,0 +1,161 @@
+# !/usr/bin/env python3
+"""Decode layer for sampled 3DPOP images, reduced resolution jpg decoding and per bird crops"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+#opencv flags to decode jpgs at reduced resolution, much faster than decoding 4K then resizing
+ReduceFlags = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def GetReduceFactor(Size, OutSize):
+    """
+    Largest reduce factor so that the decoded image is still at least OutSize
+    Size, OutSize: (width,height)
+    """
+    for Reduce in [8, 4, 2]:
+        if Size[0]/Reduce >= OutSize[0] and Size[1]/Reduce >= OutSize[1]:
+            return Reduce
+    return 1
+
+
+def ReadImage(ImgPath, Reduce=1):
+    """Read image at 1/Reduce resolution, Reduce can be 1,2,4,8"""
+    if Reduce not in ReduceFlags:
+        raise ValueError("Reduce has to be one of %s"%list(ReduceFlags.keys()))
+    img = cv2.imread(ImgPath, ReduceFlags[Reduce])
+    if img is None:
+        raise ValueError("Could not read image %s"%ImgPath)
+    return img
+
+
+def ScaleAnnotation(Data, Reduce):
+    """
+    Scale annotation to image decoded at 1/Reduce resolution
+    Data can be nested dicts/ lists of coordinates, e.g {BirdID:{Keypoint:[x,y]}} or {BirdID:[x1,y1,x2,y2]}
+    """
+    if isinstance(Data, dict):
+        return {key: ScaleAnnotation(val, Reduce) for key, val in Data.items()}
+    if isinstance(Data, list) and len(Data) > 0 and isinstance(Data[0], (list, dict)):
+        return [ScaleAnnotation(val, Reduce) for val in Data]
+    return (np.asarray(Data, dtype=np.float64)/Reduce).tolist()
+
+
+def GetCropBox(BBox, Pad, Size):
+    """
+    Integer crop box [x1,y1,x2,y2] of a bird in original image coordinates, None if bbox is invalid
+    BBox: [x1,y1,x2,y2]
+    Pad: fraction of bbox width/height added on each side
+    Size: (width,height) of image
+    """
+    BBox = np.asarray(BBox, dtype=np.float64)
+    if not np.isfinite(BBox).all() or BBox[2] <= BBox[0] or BBox[3] <= BBox[1]:
+        return None
+    PadX, PadY = (BBox[2]-BBox[0])*Pad, (BBox[3]-BBox[1])*Pad
+    Start = np.floor([BBox[0]-PadX, BBox[1]-PadY]).astype(int)
+    End = np.ceil([BBox[2]+PadX, BBox[3]+PadY]).astype(int)
+    Start = np.clip(Start, 0, [Size[0]-1, Size[1]-1])
+    End = np.clip(End, Start+1, [Size[0], Size[1]])
+    return np.concatenate([Start, End])
+
+
+def GetCropPath(ImgPath, BirdID):
+    """Path of crop file of a bird, saved in Crops folder next to the full image"""
+    Stem = os.path.splitext(os.path.basename(ImgPath))[0]
+    return os.path.join(os.path.dirname(ImgPath), "Crops", "%s-%s.jpg"%(Stem, BirdID))
+
+
+class ThreadedImageWriter:
+
+    def __init__(self, Workers=4, QueueSize=16):
+        """
+        Encode and write images in a pool of threads, cv2.imwrite releases the GIL while encoding
+        write() blocks once QueueSize images are waiting, so memory stays bounded
+
+        Workers [int]: number of writing threads
+        QueueSize [int]: max number of images queued or being written
+        """
+        self.Executor = ThreadPoolExecutor(max_workers=Workers)
+        self.Slots = threading.BoundedSemaphore(QueueSize)
+        self.Errors = []
+
+    def WriteImage(self, Path, img, Params):
+        try:
+            if not cv2.imwrite(Path, img, Params):
+                raise OSError("Could not write image %s"%Path)
+        except Exception as e:
+            self.Errors.append(e)
+        finally:
+            self.Slots.release()
+
+    def write(self, Path, img, Params=None):
+        """Queue image to be written, img must not be modified afterwards"""
+        if len(self.Errors) > 0:
+            raise self.Errors[0]
+        self.Slots.acquire()
+        self.Executor.submit(self.WriteImage, Path, img, Params if Params is not None else [])
+
+    def close(self):
+        """Wait for all images to be written"""
+        self.Executor.shutdown(wait=True)
+        if len(self.Errors) > 0:
+            raise self.Errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def SaveCrops(img, BBoxDict, ImgPath, Pad, Writer=None):
+    """
+    Save crop of each bird next to full image, see GetCropPath
+    BBoxDict: {BirdID: [x1,y1,x2,y2]}, birds with invalid bbox are skipped
+    Writer: ThreadedImageWriter to write with, default write now
+    returns list of bird IDs saved
+    """
+    Saved = []
+    for BirdID, BBox in BBoxDict.items():
+        #crop box has to start inside the image, else its offset can not be recovered when reading the crop
+        Box = GetCropBox(BBox, Pad, (np.inf, np.inf))
+        if Box is None or Box[0] >= img.shape[1] or Box[1] >= img.shape[0]:
+            continue
+        Box = GetCropBox(BBox, Pad, (img.shape[1], img.shape[0]))
+        CropPath = GetCropPath(ImgPath, BirdID)
+        os.makedirs(os.path.dirname(CropPath), exist_ok=True)
+        if Writer is not None:
+            Writer.write(CropPath, img[Box[1]:Box[3], Box[0]:Box[2]])
+        else:
+            cv2.imwrite(CropPath, img[Box[1]:Box[3], Box[0]:Box[2]])
+        Saved.append(BirdID)
+    return Saved
+
+
+def ReadCrop(ImgPath, BBox, Pad, Reduce=1, BirdID=None):
+    """
+    Read crop of a bird at 1/Reduce resolution
+    If BirdID is given and a crop file exists (see SaveCrops, must be saved with same Pad) only the crop is decoded,
+    else full image is decoded and cropped
+
+    returns crop, offset (x,y), scale, crop coordinates = (original - offset) * scale
+    """
+    if BirdID is not None:
+        CropPath = GetCropPath(ImgPath, BirdID)
+        if os.path.exists(CropPath):
+            img = ReadImage(CropPath, Reduce)
+            #crop box only depends on bbox, image size is only used for clipping which was done when saving
+            Box = GetCropBox(BBox, Pad, (np.inf, np.inf))
+            if Box is not None:
+                return img, np.maximum(Box[:2], 0).astype(np.float64), 1.0/Reduce
+
+    img = ReadImage(ImgPath, Reduce)
+    Box = GetCropBox(BBox, Pad, (img.shape[1]*Reduce, img.shape[0]*Reduce))
+    if Box is None:
+        raise ValueError("Invalid bbox %s"%list(BBox))
+    Start = Box[:2]//Reduce
+    End = np.maximum(-(-Box[2:]//Reduce), Start+1)
+    return img[Start[1]:End[1], Start[0]:End[0]], (Start*Reduce).astype(np.float64), 1.0/Reduce
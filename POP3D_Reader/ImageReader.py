@@ -1,13 +1,15 @@
 # !/usr/bin/env python3
 """JSON reader class to read images from images sampled from 3DPOP"""
 
-import json
 import cv2
 import os
-import pickle
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 
+from POP3D_Reader import AnnotationIndex, Calibration, ImageDecode
+
 def getColor(keyPoint):
     if keyPoint.endswith("beak"):
         return (255, 0 , 0 )
@@ -31,25 +33,76 @@ def getColor(keyPoint):
         # return (0,165,255)
         return (0,255,0)
 
+def LoadSample(ImgPath, Points, BBox, Slot, Reduce, OutSize, Pad, BirdID=None):
+    """
+    Load one image for ImageReader.batches, run in worker threads/ processes
+    
+    ImgPath: path to image
+    Points: (B,K,2) keypoints of all birds in original pixel coordinates
+    BBox: (B,4) bbox [x1,y1,x2,y2] of all birds
+    Slot: bird to crop by its bbox, None for full image
+    Reduce: decode at 1/Reduce resolution (1,2,4,8)
+    OutSize: (width,height) to resize to, None to keep size
+    Pad: fraction of bbox size added on each side when cropping
+    BirdID: if given, read saved crop file of bird if it exists, see ImageDecode.SaveCrops
+    
+    returns image, keypoints in output image coordinates,
+    scale (x,y) and offset (x,y), so output = (original - offset) * scale
+    """
+    if Slot is None:
+        img = ImageDecode.ReadImage(ImgPath, Reduce)
+        Offset, Scale = np.zeros(2), 1.0/Reduce
+    else:
+        Points = Points[Slot]
+        img, Offset, Scale = ImageDecode.ReadCrop(ImgPath, BBox[Slot], Pad, Reduce, BirdID)
+    Scale = np.array([Scale, Scale])
+    
+    if OutSize is not None:
+        Scale = Scale * np.array([OutSize[0]/img.shape[1], OutSize[1]/img.shape[0]])
+        img = cv2.resize(img, tuple(OutSize), interpolation=cv2.INTER_AREA)
+    
+    return img, (Points - Offset)*Scale, Scale, Offset
+
+
 class ImageReader:
     
-    def __init__(self, JSONPath,DatasetPath, Type = "3D"):
+    def __init__(self, JSONPath,DatasetPath, Type = "3D", IndexDir = None):
         """
         Initialize JSON reader object
-        JSONPath: path to json file
+        JSONPath: path to json file, or manifest.json of annotation shards, e.g Annotation/Train-3D/manifest.json
         DatasetPath: Path to dataset root directory to read images
         Type: 2D or 3D, based om which type was read     
+        IndexDir: directory to save binary index of json, if None saved next to json, see AnnotationIndex
+        
+        The json is converted once into an indexed binary layout, which is memory mapped,
+        so the full json is only parsed if data/ Annotations attributes are used
         """
         
-        with open(JSONPath) as f:
-            self.data = json.load(f)
+        self.JSONPath = JSONPath
+        self.Index = AnnotationIndex.AnnotationIndex(JSONPath, IndexDir)
         
         self.DatasetPath = DatasetPath
         self.Type = Type
-        self.Info = self.data["info"]
+        if self.Index.Type != Type:
+            print("Warning: json looks like type %s, but reading as %s"%(self.Index.Type, Type))
+        self.Info = self.Index.Info
         self.PrintInfo()
-        self.Annotations = self.data["Annotations"]
+        self._data = None
+        self._GTTensors = None
         
+    @property
+    def data(self):
+        """Full parsed json, only loaded on first access"""
+        if self._data is None:
+            self._data = AnnotationIndex.LoadData(self.JSONPath)
+        return self._data
+        
+    @property
+    def Annotations(self):
+        return self.data["Annotations"]
+    
+    def __len__(self):
+        return len(self.Index)
         
     def PrintInfo(self):
         print("Loading JSON...")
@@ -59,105 +112,226 @@ class ImageReader:
         
     def Extract3D(self,index):
         """Extract 3D data"""
-        return self.Annotations[index]["Keypoint3D"]
+        return self.Index.Get3D(index)
         
     def Extract2D(self,index):
         """Extract 2D data"""
         if self.Type == "3D":
-            CameraInfoDict = self.Annotations[index]["CameraData"]
-            Out = [[val for key,val in SubDict.items() if key == "Keypoint2D"][0] for SubDict in CameraInfoDict]
+            Out = [self.Index.Get2D(index, cam) for cam in range(self.Index.GetNumCams(index))]
         else:
-            Out = self.Annotations[index]["Keypoint2D"]
+            Out = self.Index.Get2D(index, 0)
             
         return Out
 
     def ExtractBBox(self,index):
         if self.Type == "3D":
-            CameraInfoDict = self.Annotations[index]["CameraData"]
-            Out = [[val for key,val in SubDict.items() if key == "BBox"][0] for SubDict in CameraInfoDict]
+            Out = [self.Index.GetBBox(index, cam) for cam in range(self.Index.GetNumCams(index))]
         else:
-            Out = self.Annotations[index]["BBox"]
+            Out = self.Index.GetBBox(index, 0)
 
         return Out
     
     def GetImagePath(self,index):
         if self.Type == "3D":
-            CameraInfoDict = self.Annotations[index]["CameraData"]
-            Out = [[val for key,val in SubDict.items() if key == "Path"][0] for SubDict in CameraInfoDict]
+            Out = [self.Index.GetPath(index, cam) for cam in range(self.Index.GetNumCams(index))]
         else:
-            Out = self.Annotations[index]["Path"]
+            Out = self.Index.GetPath(index, 0)
         return Out
     
     def GetSequenceCode(self,FileName):
         return FileName.split("-")[0]
     
-    def GetIntrinsics(self, index):
-        
+    def GetCalibration(self, index):
+        """
+        Get calibration of all 4 cameras of an image from the process wide registry,
+        so each pickle is only read once per sequence, see Calibration.CalibrationRegistry
+        """
         #get sequence from file path        
-        CamInfo = self.data["Annotations"][index]["CameraData"]
-        
-        SequenceCode = self.GetSequenceCode(os.path.basename(CamInfo[0]["Path"]))
-        
-        camMatList = []
-        distCoefList= []
+        SequenceCode = self.GetSequenceCode(os.path.basename(self.Index.GetPath(index, 0)))
         
+        CalibList = []
         for x in range(4): ##For 3D pop, always 4 cam
             Cam = x+1
             Intpath = os.path.join(self.DatasetPath,"Calibration","%s-Cam%s-Intrinsics.p"%(SequenceCode,Cam))
-            camMat, distCoef = pickle.load(open(Intpath,"rb"))
-            camMatList.append(camMat)
-            distCoefList.append(distCoef)
+            Extpath = os.path.join(self.DatasetPath,"Calibration","%s-Cam%s-Extrinsics.p"%(SequenceCode,Cam))
+            CalibList.append(Calibration.GetCalibration(SequenceCode, "Cam%s"%Cam, Extpath, Intpath))
+        
+        return CalibList
+    
+    def GetIntrinsics(self, index):
+        CalibList = self.GetCalibration(index)
+        camMatList = [Calib.camMat for Calib in CalibList]
+        distCoefList = [Calib.distCoef for Calib in CalibList]
             
         return camMatList, distCoefList
 
     def GetExtrinsics(self, index):
-        #get sequence from file path        
-        CamInfo = self.data["Annotations"][index]["CameraData"]
-        
-        SequenceCode = self.GetSequenceCode(os.path.basename(CamInfo[0]["Path"]))
-        
-        rvecList = []
-        tvecList = []
-        
-        for x in range(4): ##For 3D pop, always 4 cam
-            Cam = x+1
-            Extpath = os.path.join(self.DatasetPath,"Calibration","%s-Cam%s-Extrinsics.p"%(SequenceCode,Cam))
-            rvec, tvec = pickle.load(open(Extpath,"rb"))
-            rvecList.append(rvec)
-            tvecList.append(tvec)
+        CalibList = self.GetCalibration(index)
+        rvecList = [Calib.rvec for Calib in CalibList]
+        tvecList = [Calib.tvec for Calib in CalibList]
             
         return rvecList, tvecList
     
-    def GetGTArray(self,Indexes):
+    def GetGTTensors(self):
+        """
+        Dense ground truth tensors of all images/ birds/ cameras with masks, built once then cached
+        See AnnotationIndex.BuildDenseTensors for keys and shapes,
+        Keypoints/ Birds give names along keypoint axis/ of BirdIDs
+        """
+        if self._GTTensors is None:
+            self._GTTensors = self.Index.BuildDenseTensors()
+            self._GTTensors["Keypoints"] = list(self.Index.Keypoints)
+            self._GTTensors["Birds"] = list(self.Index.Birds)
+        return self._GTTensors
+    
+    def GetGTArray(self,Indexes, Keypoints = None, AllBirds = False):
         """
         Get array of all annotation ground truth
-        shape: (N,9,3)
+        shape: (N,9,3), for the first bird of each image
         Indexes is list of index of image
+        Keypoints: list of keypoint names, sets order of keypoint axis, default all keypoints in annotation order
+        AllBirds: if True, returns all birds, shape (N,B,K,3) and a mask (N,B,K) of existing points
         """
-        GTList = []
-        for i in Indexes:
-           GT = np.array(list(self.Extract3D(i).values()))
-           GTList.append(GT)
+        Tensors = self.GetGTTensors()
+        KeyIndex = self.Index.GetKeypointIndex(Keypoints)
+        Indexes = np.asarray(Indexes, dtype=np.int64)
         
-        GTArray = np.stack(GTList)
+        GTArray = Tensors["Keypoint3D"][Indexes][:, :, KeyIndex]
+        if AllBirds:
+            return GTArray, Tensors["Mask3D"][Indexes][:, :, KeyIndex]
         # import ipdb;ipdb.set_trace()
 
-        return GTArray
+        return GTArray[:, 0]
+    
+    def GetSamples(self, indices, cams, crop_to_bbox):
+        """List of (image index, camera, bird slot) samples for batches"""
+        Tensors = self.GetGTTensors()
+        Samples = []
+        for index in indices:
+            if self.Type == "3D":
+                CamList = range(self.Index.GetNumCams(index)) if cams is None else cams
+            else:
+                CamList = [0]
+            for cam in CamList:
+                if not crop_to_bbox:
+                    Samples.append((index, cam, None))
+                    continue
+                for Slot in np.flatnonzero(Tensors["MaskBBox"][index, cam]):
+                    #crop needs a valid bbox
+                    if np.isfinite(Tensors["BBox"][index, cam, Slot]).all():
+                        Samples.append((index, cam, int(Slot)))
+        return Samples
+    
+    def batches(self, indices=None, batch_size=32, crop_to_bbox=False, out_size=None, cams=None,
+                reduce=1, pad=0.0, workers=4, prefetch=2, use_processes=False):
+        """
+        Iterate over images in batches, images are decoded/ cropped/ resized in a pool of workers
+        while earlier batches are used, up to prefetch batches are loaded ahead
+        
+        Input:
+        indices: list of image indexes, default all images
+        batch_size: number of samples per batch
+        crop_to_bbox: if True, each bird is a sample, cropped to its bbox, keypoints shifted to the crop
+        out_size: (width,height) to resize to, needed to stack crops of different sizes
+        cams: for 3D annotations, which camera views to use, default all
+        reduce: decode images at 1/reduce resolution with opencv reduced decode, can be 1,2,4,8
+        pad: when cropping, fraction of bbox width/height added on each side,
+             if equal to CropPad of the json info, crop files saved while sampling are read instead of full images
+        workers: number of worker threads/ processes
+        prefetch: number of batches loaded ahead
+        use_processes: use processes instead of threads
+        
+        Output, yields dict of stacked arrays:
+        Images: (b,H,W,3)
+        Keypoint2D: (b,K,2) if crop_to_bbox, else (b,B,K,2) for all birds, nan where missing
+        Mask: (b,K) or (b,B,K), keypoint exists
+        Scale, Offset: (b,2), output coordinates = (original - Offset) * Scale
+        Index, Cam, Bird: (b,), image index, camera and bird slot (index into BirdIDs of GetGTTensors, -1 for full images)
+        BirdIDs: list of bird IDs of the samples (crop_to_bbox only)
+        Keypoints: names along keypoint axis
+        """
+        if reduce not in ImageDecode.ReduceFlags:
+            raise ValueError("reduce has to be one of %s"%list(ImageDecode.ReduceFlags.keys()))
+        if indices is None:
+            indices = range(len(self))
+        Tensors = self.GetGTTensors()
+        Samples = self.GetSamples(indices, cams, crop_to_bbox)
+        #crop files saved while sampling can only be used if they were cropped with the same padding
+        UseCropFiles = self.Info.get("CropPad") == pad
+        
+        def Submit(Executor, Sample):
+            index, cam, Slot = Sample
+            ImgPath = os.path.join(self.DatasetPath, self.Index.GetPath(index, cam))
+            BirdID = Tensors["Birds"][Tensors["BirdIDs"][index, Slot]] if Slot is not None and UseCropFiles else None
+            return Executor.submit(LoadSample, ImgPath, Tensors["Keypoint2D"][index, cam], Tensors["BBox"][index, cam],
+                                   Slot, reduce, out_size, pad, BirdID)
+        
+        def Collect(BatchSamples, Futures):
+            Results = [Future.result() for Future in Futures]
+            Index = np.array([Sample[0] for Sample in BatchSamples], dtype=np.int64)
+            Cam = np.array([Sample[1] for Sample in BatchSamples], dtype=np.int64)
+            Bird = np.array([-1 if Sample[2] is None else Sample[2] for Sample in BatchSamples], dtype=np.int64)
+            Mask = Tensors["Mask2D"][Index, Cam]
+            Batch = {"Images": np.stack([Result[0] for Result in Results]),
+                     "Keypoint2D": np.stack([Result[1] for Result in Results]),
+                     "Mask": Mask[np.arange(len(Bird)), Bird] if crop_to_bbox else Mask,
+                     "Scale": np.stack([Result[2] for Result in Results]),
+                     "Offset": np.stack([Result[3] for Result in Results]),
+                     "Index": Index, "Cam": Cam, "Bird": Bird,
+                     "Keypoints": Tensors["Keypoints"]}
+            if crop_to_bbox:
+                Batch["BirdIDs"] = [Tensors["Birds"][Tensors["BirdIDs"][i, b]] for i, b in zip(Index, Bird)]
+            return Batch
+        
+        PoolClass = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with PoolClass(max_workers=workers) as Executor:
+            Pending = deque()
+            for start in range(0, len(Samples), batch_size):
+                BatchSamples = Samples[start:start+batch_size]
+                Pending.append((BatchSamples, [Submit(Executor, Sample) for Sample in BatchSamples]))
+                if len(Pending) > prefetch:
+                    yield Collect(*Pending.popleft())
+            while len(Pending) > 0:
+                yield Collect(*Pending.popleft())
     
-    def CheckAnnotations(self, index, show=True, jupyter = False):
+    def LoadImage(self, index, cam=0, reduce=1):
+        """
+        Read image decoded at 1/reduce resolution (1,2,4,8), with 2D keypoints and bbox scaled to match
+        cam: camera view for 3D annotations, ignored for 2D
+        
+        returns image, 2D keypoints {BirdID:{Keypoint:[x,y]}}, bbox {BirdID:[x1,y1,x2,y2]}
+        """
         if self.Type == "3D":
-            ImgPath = self.GetImagePath(index)[0]
-            Key2D = self.Extract2D(index)[0]
-            BBox = self.ExtractBBox(index)[0]
+            ImgPath, Key2D, BBox = self.GetImagePath(index)[cam], self.Extract2D(index)[cam], self.ExtractBBox(index)[cam]
         else:
-            ImgPath = self.GetImagePath(index)
-            Key2D = self.Extract2D(index)
-            BBox = self.ExtractBBox(index)
-        # import ipdb;ipdb.set_trace()
+            ImgPath, Key2D, BBox = self.GetImagePath(index), self.Extract2D(index), self.ExtractBBox(index)
+        img = ImageDecode.ReadImage(os.path.join(self.DatasetPath, ImgPath), reduce)
+        return img, ImageDecode.ScaleAnnotation(Key2D, reduce), ImageDecode.ScaleAnnotation(BBox, reduce)
+    
+    def LoadCrop(self, index, BirdID, cam=0, reduce=1, pad=None):
+        """
+        Read crop of one bird at 1/reduce resolution, with its 2D keypoints in crop coordinates
+        Uses crop file saved while sampling if it exists and pad is the CropPad of the json info
+        pad: fraction of bbox size added on each side, default CropPad of json info or 0
         
-        RealImgPath = os.path.join(self.DatasetPath,ImgPath)
-
-        img = cv2.imread(RealImgPath)
+        returns crop, 2D keypoints {Keypoint:[x,y]}, offset (x,y), scale,
+        crop coordinates = (original - offset) * scale
+        """
+        CropPad = self.Info.get("CropPad")
+        if pad is None:
+            pad = CropPad if CropPad is not None else 0.0
+        if self.Type == "3D":
+            ImgPath, Key2D, BBox = self.GetImagePath(index)[cam], self.Extract2D(index)[cam], self.ExtractBBox(index)[cam]
+        else:
+            ImgPath, Key2D, BBox = self.GetImagePath(index), self.Extract2D(index), self.ExtractBBox(index)
+        img, Offset, Scale = ImageDecode.ReadCrop(os.path.join(self.DatasetPath, ImgPath), BBox[BirdID], pad, reduce,
+                                                  BirdID if pad == CropPad else None)
+        Key2D = {key: ((np.asarray(pts, dtype=np.float64) - Offset)*Scale).tolist() for key, pts in Key2D[BirdID].items()}
+        return img, Key2D, Offset, Scale
+    
+    def CheckAnnotations(self, index, show=True, jupyter = False, reduce = 1):
+        """reduce: decode image at 1/reduce resolution (1,2,4,8), annotations are scaled to match"""
+        img, Key2D, BBox = self.LoadImage(index, 0, reduce)
         
         ##Draw keypoints:
         for BirdID,Key2DDict in Key2D.items():
@@ -173,13 +347,13 @@ class ImageReader:
         if show:
             cv2.imshow('image',img)
             cv2.waitKey(0)
+            cv2.destroyAllWindows()
 
         if jupyter:
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
             plt.imshow(img)
             plt.show()
-            
-        cv2.destroyAllWindows()
+
         return img
 
 
@@ -188,9 +362,9 @@ if __name__ == "__main__":
     JSONPath = "/home/alexchan/Documents/3D-MuPPET/TrainingData/N6000/Annotation/Test-3D.json"
     DatasetPath = "/home/alexchan/Documents/3D-MuPPET/TrainingData/N6000"
     Dataset = ImageReader(JSONPath,DatasetPath, Type = "3D")
-    len(Dataset.Annotations)
+    len(Dataset)
 
-    for i in range(len(Dataset.Annotations)):
+    for i in range(len(Dataset)):
         Dataset.CheckAnnotations(i,show=True, jupyter=False)
 
         
\ No newline at end of file
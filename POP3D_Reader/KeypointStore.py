@@ -0,0 +1,173 @@
+# !/usr/bin/env python3
+""" Frame indexed columnar store for 3DPOP keypoint/ bbox csvs"""
+
+import numpy as np
+
+
+def GetFrameColumn(df):
+    """Vicon Output named "Frame", custom features output named "frame", find which one is used"""
+    if 'frame' in df.columns:
+        return 'frame'
+    elif 'Frame' in df.columns:
+        return 'Frame'
+    else:
+        return None
+
+def GetSubjectFromColumn(ColName):
+    """
+    Guess subject ID from a column name, first 2 parts in 3DPOP, e.g 452_0107_hd_beak_x -> 452_0107
+    Only used when subjects are not given, pass the trial subjects for other ID formats
+    """
+    return "_".join(ColName.split("_")[:2])
+
+
+class KeypointStore:
+
+    def __init__(self, df, Dim, Subjects=None, dtype=np.float64):
+        """
+        Build a frame indexed array out of a 3DPOP annotation dataframe, done once at load time
+        so every frame lookup afterwards is O(1)
+
+        Input:
+        df [pd.DataFrame]: Keypoint2D, Keypoint3D or BBox dataframe
+        Dim [int]: number of columns per point, 2 for 2D keypoints, 3 for 3D keypoints, 4 for bbox
+        Subjects [list]: Bird IDs, columns of a bird are all columns starting with its ID (followed by "_"),
+                         if None, guessed from column names with GetSubjectFromColumn
+        dtype: dtype of output array
+
+        Attributes:
+        Data: array of shape (frames, birds, keypoints, Dim), padded with nan if birds have different keypoints
+        Frames: array of frame numbers, order of frame axis
+        FrameIndex: {frame: row in Data}
+        Subjects: list of bird IDs, order of bird axis
+        Keypoints: {bird: [keypoint names without bird ID]}, order of keypoint axis
+        BirdColumns: {bird: array of column indexes in df, shape (keypoints, Dim)}
+        """
+        self.Dim = Dim
+        self.FrameName = GetFrameColumn(df)
+
+        if Subjects is None:
+            Subjects = []
+            for name in df.columns:
+                if name == self.FrameName or name.startswith("Unnamed"):
+                    continue
+                Subject = GetSubjectFromColumn(name)
+                if Subject not in Subjects:
+                    Subjects.append(Subject)
+        self.Subjects = list(Subjects)
+        self.BirdIndex = {bird: i for i, bird in enumerate(self.Subjects)}
+
+        ##Per bird column slice table, assuming all object columns go x,y(,z)
+        ColumnNames = list(df.columns)
+        self.BirdColumns = {}
+        self.Keypoints = {}
+        for bird in self.Subjects:
+            ColIndex = [i for i, name in enumerate(ColumnNames) if name.startswith(bird + "_")]
+            ColIndex = ColIndex[:len(ColIndex) - (len(ColIndex) % Dim)]
+            self.BirdColumns[bird] = np.array(ColIndex, dtype=int).reshape(-1, Dim)
+            #keypoint name is the last column of the point without the _x/_y/_z suffix
+            self.Keypoints[bird] = [ColumnNames[Cols[-1]][len(bird)+1:-2] for Cols in self.BirdColumns[bird]]
+
+        self.KeypointNum = max([len(Names) for Names in self.Keypoints.values()], default=0)
+
+        ##Frame index
+        if self.FrameName is None:
+            FrameArr = np.arange(len(df))
+        else:
+            FrameArr = df[self.FrameName].to_numpy()
+        self.Frames = np.asarray(FrameArr, dtype=np.int64)
+        self.FrameIndex = {int(frame): row for row, frame in enumerate(self.Frames)}
+
+        self.FrameOrder = np.argsort(self.Frames, kind="stable")
+        self.SortedFrames = self.Frames[self.FrameOrder]
+
+        ##Contiguous array
+        self.Data = np.full((len(df), len(self.Subjects), self.KeypointNum, Dim), np.nan, dtype=dtype)
+        for b, bird in enumerate(self.Subjects):
+            Cols = self.BirdColumns[bird]
+            if len(Cols) == 0:
+                continue
+            Values = df.iloc[:, Cols.ravel()].to_numpy(dtype=dtype, na_value=np.nan)
+            self.Data[:, b, :len(Cols), :] = Values.reshape(len(df), len(Cols), Dim)
+
+    def __len__(self):
+        return len(self.Frames)
+
+    def HasBird(self, bird):
+        return bird in self.BirdIndex and len(self.BirdColumns[bird]) > 0
+
+    def GetRow(self, frame):
+        """Get row of given frame, None if frame not in data"""
+        return self.FrameIndex.get(int(frame))
+
+    def GetRows(self, frames):
+        """
+        Vectorized version of GetRow, for array of frames
+        Returns array of rows, -1 for frames not in data
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        if len(self.SortedFrames) == 0:
+            return np.full(frames.shape, -1, dtype=np.int64)
+        Pos = np.searchsorted(self.SortedFrames, frames)
+        Pos = np.clip(Pos, 0, len(self.SortedFrames) - 1)
+        Rows = self.FrameOrder[Pos]
+        Rows[self.SortedFrames[Pos] != frames] = -1
+        return Rows
+
+    def GetFrame(self, frame):
+        """
+        Get all data for a frame, returns a view of shape (birds, keypoints, Dim)
+        Raises KeyError if frame does not exist
+        """
+        return self.Data[self.FrameIndex[int(frame)]]
+
+    def GetBirdFrame(self, frame, bird):
+        """Get data for one bird in one frame, returns a view of shape (keypoints, Dim)"""
+        Row = self.FrameIndex[int(frame)]
+        b = self.BirdIndex[bird]
+        return self.Data[Row, b, :len(self.Keypoints[bird])]
+
+    def MatchKeypoints(self, bird, Keypoints):
+        """
+        Get index of each desired keypoint for a bird, -1 if not found
+        Same matching as CameraObject.Read2DKeypointData, i.e full name ends with given keypoint
+        """
+        Names = ["%s_%s"%(bird, Name) for Name in self.Keypoints.get(bird, [])]
+        Index = []
+        for Key in Keypoints:
+            Match = [i for i, Name in enumerate(Names) if Name.endswith(Key)]
+            Index.append(Match[0] if len(Match) > 0 else -1)
+        return Index
+
+    def Gather(self, frames, birds=None, Keypoints=None):
+        """
+        Vectorized gather of many frames/ birds/ keypoints at once
+        
+        Input:
+        frames: array of frame numbers
+        birds: list of bird IDs, if None, all birds
+        Keypoints: list of keypoint names, if None, all keypoints of the first bird with data
+        
+        Output:
+        Out: array of shape (frames, birds, keypoints, Dim), nan where frame/bird/keypoint does not exist
+        Keypoints: list of keypoint names along keypoint axis
+        """
+        if birds is None:
+            birds = self.Subjects
+        if Keypoints is None:
+            Keypoints = next((self.Keypoints[bird] for bird in birds if self.HasBird(bird)), [])
+
+        Rows = self.GetRows(frames)
+        BirdIdx = np.array([self.BirdIndex[bird] if self.HasBird(bird) else -1 for bird in birds], dtype=np.int64)
+        KeyIdx = np.array([self.MatchKeypoints(bird, Keypoints) for bird in birds], dtype=np.int64).reshape(len(birds), len(Keypoints))
+
+        if self.Data.size == 0:
+            return np.full((len(Rows), len(birds), len(Keypoints), self.Dim), np.nan, dtype=self.Data.dtype), list(Keypoints)
+
+        Out = self.Data[np.clip(Rows, 0, None)[:, None, None],
+                        np.clip(BirdIdx, 0, None)[None, :, None],
+                        np.clip(KeyIdx, 0, None)[None, :, :]]
+        Missing = (Rows < 0)[:, None, None] | (BirdIdx < 0)[None, :, None] | (KeyIdx < 0)[None, :, :]
+        Out[Missing] = np.nan
+
+        return Out, list(Keypoints)
@@ -0,0 +1,112 @@
+# !/usr/bin/env python3
+""" Stratified sampler of training frames over the 3DPOP catalog, driven by validity indexes only"""
+
+import math
+import numpy as np
+
+
+class StratifiedSampler:
+
+    def __init__(self, Catalog, Types=("Train", "Val", "Test"), Filter=True, StratifyBy="IndividualNum",
+                 Keypoints=None, Seed=10):
+        """
+        Sample frames with ground truth in all camera views, with the image budget split equally over strata
+        (default number of individuals, 1,2,5,10) then over sequences within each stratum.
+        Valid frames are read from the validity index of each sequence (see ValidityIndex), so sampling
+        for another N never touches videos or csvs.
+
+        Input:
+        Catalog [Dataset3DPOP]: dataset catalog
+        Types [list]: splits to sample
+        Filter [bool]: use filtered 2D keypoints to find valid frames
+        StratifyBy [str]: metadata column to stratify by
+        Keypoints [list]: keypoints that have to be valid, default all keypoints in the csvs
+        Seed [int]: seed, frames of each (sequence, split) are drawn from their own generator seeded with
+                    (Seed, Sequence, split), so results do not depend on which other sequences are sampled
+        """
+        self.Catalog = Catalog
+        self.Types = list(Types)
+        self.Filter = Filter
+        self.StratifyBy = StratifyBy
+        self.Keypoints = Keypoints
+        self.Seed = Seed
+        self.Sequences = np.array(Catalog.Sequences, dtype=np.int64)
+        self.Strata = np.array([Catalog.GetRow(Seq)[StratifyBy] for Seq in self.Sequences])
+        self.StrataNames = sorted(set(self.Strata.tolist()), key=lambda x: (len(x), x))
+        self.ValidCounts = None
+
+    def GetValidFrames(self, SequenceNum, Type):
+        """Frames of a sequence/ split with ground truth of all birds in all cameras"""
+        Index = self.Catalog.GetValidityIndex(SequenceNum, Type, self.Filter)
+        return Index.frames_where(all_cams=True, birds="all", keypoints=self.Keypoints)
+
+    def GetValidCounts(self):
+        """Number of valid frames, array of shape (sequences, types), computed once"""
+        if self.ValidCounts is None:
+            self.ValidCounts = np.array([[len(self.GetValidFrames(Seq, Type)) for Type in self.Types]
+                                         for Seq in self.Sequences], dtype=np.int64).reshape(len(self.Sequences), len(self.Types))
+        return self.ValidCounts
+
+    def AllocateQuotas(self, TrainNum, Ratios):
+        """
+        Number of frames to sample for each sequence and split
+
+        Input:
+        TrainNum [int]: total number of training images
+        Ratios [dict]: {Type: ratio to TrainNum}, e.g {"Train":1, "Val":0.2, "Test":0.1}
+
+        Output:
+        Quotas: array of shape (sequences, types)
+
+        Each stratum gets ceil(TrainNum/strata)*ratio frames, split evenly over its sequences.
+        Sequences with too few valid frames give all they have, the shortfall is taken from the
+        other sequences of the stratum in order, as far as they have spare frames.
+        """
+        Valid = self.GetValidCounts()
+        Ratio = np.array([Ratios[Type] for Type in self.Types], dtype=np.float64)
+        NumPerStratum = math.ceil(TrainNum/len(self.StrataNames))
+        Quotas = np.zeros_like(Valid)
+
+        for Stratum in self.StrataNames:
+            InStratum = self.Strata == Stratum
+            StratumValid = Valid[InStratum]
+            Target = np.ceil(NumPerStratum*Ratio).astype(np.int64)
+            PerSeq = np.ceil(math.ceil(NumPerStratum/InStratum.sum())*Ratio).astype(np.int64)
+
+            ##Even split, never over the stratum target
+            Quota = np.minimum(StratumValid, PerSeq)
+            Before = np.cumsum(Quota, axis=0) - Quota
+            Quota = np.minimum(Quota, np.maximum(Target - Before, 0))
+
+            ##Fill shortfall from spare frames of other sequences
+            Shortfall = Target - Quota.sum(axis=0)
+            Spare = StratumValid - Quota
+            Before = np.cumsum(Spare, axis=0) - Spare
+            Quota += np.minimum(Spare, np.maximum(Shortfall - Before, 0))
+
+            Quotas[InStratum] = Quota
+            if (Quota.sum(axis=0) < Target).any():
+                print("Not enough valid frames in stratum %s %s, sampled %s of %s"%(self.StratifyBy, Stratum,
+                                                                                  Quota.sum(axis=0).tolist(), Target.tolist()))
+        return Quotas
+
+    def Sample(self, TrainNum, ValRatio=0.2, TestRatio=0.1):
+        """
+        Sample frames for all splits and sequences
+
+        Output:
+        FrameDicts [dict]: {Type: {Sequence: sorted list of frames}}, sequences with no frames are left out
+        """
+        Ratios = {"Train": 1.0, "Val": ValRatio, "Test": TestRatio}
+        Quotas = self.AllocateQuotas(TrainNum, Ratios)
+
+        FrameDicts = {Type: {} for Type in self.Types}
+        for s, Seq in enumerate(self.Sequences.tolist()):
+            for t, Type in enumerate(self.Types):
+                if Quotas[s, t] == 0:
+                    continue
+                Frames = self.GetValidFrames(Seq, Type)
+                Generator = np.random.default_rng([self.Seed, Seq, t])
+                FrameDicts[Type][Seq] = np.sort(Generator.choice(Frames, Quotas[s, t], replace=False)).tolist()
+
+        return FrameDicts
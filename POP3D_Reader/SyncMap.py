@@ -0,0 +1,134 @@
+# !/usr/bin/env python3
+""" Mapping between camera frames and VICON frames from the sync array of a camera, vectorized over frame arrays"""
+
+import os
+import threading
+import pickle as p
+import numpy as np
+
+
+class SyncMap:
+
+    def __init__(self, SyncArray, Path=None):
+        """
+        Piecewise linear mapping between camera and VICON frames, anchored at the synchronized flashes
+
+        Input:
+        SyncArray: [camera frames of flashes, VICON frames of flashes], as saved in *-SyncArray.p
+        Path [str]: pickle the array was read from, only kept for reference
+
+        Attributes:
+        SyncArray: the sync array as loaded
+        CamFrames, ViconFrames: (N,) float arrays of flash frames, both increasing
+        FirstFrame, LastFrame: camera frames of first and last flash
+        """
+        self.SyncArray = SyncArray
+        self.Path = Path
+        self.CamFrames = np.asarray(SyncArray[0], dtype=np.float64)
+        self.ViconFrames = np.asarray(SyncArray[1], dtype=np.float64)
+        if len(self.CamFrames) < 2 or len(self.CamFrames) != len(self.ViconFrames):
+            raise ValueError("Sync array needs at least 2 flashes in both camera and VICON frames")
+        if (np.diff(self.CamFrames) <= 0).any() or (np.diff(self.ViconFrames) <= 0).any():
+            raise ValueError("Flash frames in sync array are not increasing")
+        self.FirstFrame = int(SyncArray[0][0])
+        self.LastFrame = int(SyncArray[0][len(SyncArray[0])-1])
+
+    @classmethod
+    def FromPickle(cls, Path):
+        with open(Path, "rb") as f:
+            return cls(p.load(f), Path)
+
+    def CamFrameRange(self):
+        """Camera frames from first flash up to (not including) last flash, frames the pipeline annotates"""
+        return np.arange(self.FirstFrame, self.LastFrame, dtype=np.int64)
+
+    def InRange(self, Frames, Inverse=False):
+        """Whether frames are within first and last flash (both included), camera frames (or VICON frames if Inverse)"""
+        Anchors = self.ViconFrames if Inverse else self.CamFrames
+        Frames = np.asarray(Frames, dtype=np.float64)
+        return (Frames >= Anchors[0]) & (Frames <= Anchors[-1])
+
+    def Interpolate(self, Frames, Inverse=False, mask=False):
+        """
+        Map camera frames to fractional VICON frames (or back if Inverse), linear between flashes
+        Frames outside first/ last flash raise ValueError, or give nan if mask
+        """
+        Source, Target = (self.ViconFrames, self.CamFrames) if Inverse else (self.CamFrames, self.ViconFrames)
+        Frames = np.asarray(Frames, dtype=np.float64)
+        Valid = self.InRange(Frames, Inverse)
+        if not mask and not Valid.all():
+            raise ValueError("Frames outside of synchronized range %s-%s"%(Source[0], Source[-1]))
+        #index of last flash at or before frame, last interval is closed at the end
+        Index = np.clip(np.searchsorted(Source, Frames, side="right") - 1, 0, len(Source) - 2)
+        Prop = (Frames - Source[Index]) / (Source[Index+1] - Source[Index])
+        return np.where(Valid, Target[Index] + Prop * (Target[Index+1] - Target[Index]), np.nan)
+
+    def Convert(self, Frames, Inverse, interpolate, mask):
+        """Shared output handling of ToVicon/ ToCam"""
+        Out = self.Interpolate(Frames, Inverse, mask)
+        Valid = np.isfinite(Out)
+        if interpolate:
+            Out = Out if np.ndim(Out) else float(Out)
+        else:
+            Out = np.where(Valid, np.rint(np.where(Valid, Out, 0)), -1).astype(np.int64)
+            Out = Out if np.ndim(Out) else int(Out)
+        if mask:
+            return Out, (Valid if np.ndim(Valid) else bool(Valid))
+        return Out
+
+    def ToVicon(self, Frames, interpolate=False, mask=False):
+        """
+        Camera frames to VICON frames
+
+        Frames from the first flash up to and including the last flash are mapped. Outside this range there is
+        no sync information, so ValueError is raised, for the whole array if any frame is outside.
+        (FindClosestFrame, which this replaces, failed before the first flash too, and also at and after the last flash)
+        Use mask=True to map arrays that may contain frames outside the range.
+
+        Input:
+        Frames: camera frame or array of camera frames
+        interpolate [bool]: return fractional VICON frames, else rounded to the nearest frame (int)
+        mask [bool]: do not raise for frames outside the range, they give -1 (nan if interpolate)
+
+        Output:
+        VICON frame(s), same shape as Frames
+        Valid: only if mask, bool (array) whether frame was within the range
+        """
+        return self.Convert(Frames, False, interpolate, mask)
+
+    def ToCam(self, Frames, interpolate=False, mask=False):
+        """VICON frames to camera frames, inverse of ToVicon with same arguments"""
+        return self.Convert(Frames, True, interpolate, mask)
+
+
+class SyncMapRegistry:
+
+    def __init__(self):
+        """Sync maps keyed by pickle path, each pickle is read once per process"""
+        self.SyncMaps = {}
+        self.Lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.SyncMaps)
+
+    def Get(self, Path):
+        """Get sync map of a pickle, read again if the file changed"""
+        Key = os.path.abspath(Path)
+        Stamp = os.stat(Key).st_mtime_ns
+        with self.Lock:
+            Entry = self.SyncMaps.get(Key)
+            if Entry is None or Entry[0] != Stamp:
+                Entry = (Stamp, SyncMap.FromPickle(Key))
+                self.SyncMaps[Key] = Entry
+        return Entry[1]
+
+    def clear(self):
+        with self.Lock:
+            self.SyncMaps.clear()
+
+
+Registry = SyncMapRegistry()
+
+def GetSyncMap(Path):
+    """Get sync map of a camera's SyncArray pickle from the process wide registry"""
+    return Registry.Get(Path)
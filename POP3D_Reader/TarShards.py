@@ -0,0 +1,186 @@
+# !/usr/bin/env python3
+""" Tar shards of sampled images plus annotations, for sequential reading during training"""
+
+import os
+import io
+import json
+import tarfile
+import numpy as np
+import cv2
+
+from POP3D_Reader import AnnotationIndex, ImageDecode
+
+TarIndexVersion = 1
+
+
+def AddMember(Tar, Name, Data):
+    """Add bytes to tar with fixed metadata (reproducible shards), returns (offset, size) of data in the tar file"""
+    Info = tarfile.TarInfo(Name)
+    Info.size = len(Data)
+    Info.mtime = 0
+    Info.mode = 0o444
+    Offset = Tar.offset + len(Info.tobuf(Tar.format, Tar.encoding, Tar.errors))
+    Tar.addfile(Info, io.BytesIO(Data))
+    return [Offset, len(Data)]
+
+def WriteShard(ShardPath, Samples):
+    """
+    Write one tar shard, via a temp file so an interrupted shard is never read
+    Samples: list of (key, [(member suffix, bytes), ...])
+    returns index of shard samples [{"Key", "Members": {suffix: [offset, size]}}]
+    """
+    TempPath = "%s.tmp%i"%(ShardPath, os.getpid())
+    Index = []
+    with tarfile.open(TempPath, "w", format=tarfile.USTAR_FORMAT) as Tar:
+        for Key, Members in Samples:
+            Index.append({"Key": Key, "Members": {Suffix: AddMember(Tar, "%s.%s"%(Key, Suffix), Data) for Suffix, Data in Members}})
+    os.replace(TempPath, ShardPath)
+    return Index
+
+def ExportTarShards(JSONPath, DatasetPath, OutDir, SamplesPerShard=1000, Name=None, IndexDir=None):
+    """
+    Pack each sampled image (all camera views for 3D annotations, the mixed view for 2D) with its annotation
+    record into tar shards, images are copied as they are (no re-encoding)
+
+    Input:
+    JSONPath [str]: annotation json or shard manifest, see ImageReader
+    DatasetPath [str]: root directory of image paths in annotations
+    OutDir [str]: output directory
+    SamplesPerShard [int]: number of images per tar
+    Name [str]: prefix of shard files, default name of json, e.g Train-3D
+    IndexDir [str]: see AnnotationIndex
+
+    Output:
+    IndexPath [str]: path of {Name}-index.json, holding info, type and byte offsets of every member,
+                     tar members are {key}.json and {key}.{CamName}.jpg (3D) or {key}.jpg (2D)
+    """
+    Index = AnnotationIndex.AnnotationIndex(JSONPath, IndexDir)
+    if Name is None:
+        Name = os.path.basename(os.path.dirname(JSONPath)) if os.path.basename(JSONPath) == "manifest.json" \
+            else os.path.splitext(os.path.basename(JSONPath))[0]
+    if not os.path.exists(OutDir):
+        os.makedirs(OutDir)
+
+    Shards = []
+    for Start in range(0, len(Index), SamplesPerShard):
+        Samples = []
+        for i in range(Start, min(Start + SamplesPerShard, len(Index))):
+            Annotation = Index.GetAnnotation(i)
+            Key = "%08d"%Annotation["Image-ID"]
+            Members = [("json", json.dumps(Annotation, separators=(",", ":")).encode("utf-8"))]
+            for c in range(Index.GetNumCams(i)):
+                Suffix = "%s.jpg"%Index.GetCamName(i, c) if Index.Type == "3D" else "jpg"
+                with open(os.path.join(DatasetPath, Index.GetPath(i, c)), "rb") as f:
+                    Members.append((Suffix, f.read()))
+            Samples.append((Key, Members))
+
+        ShardFile = "%s-%05d.tar"%(Name, len(Shards))
+        Shards.append({"File": ShardFile, "Samples": WriteShard(os.path.join(OutDir, ShardFile), Samples)})
+        print("Written %s, %i samples"%(ShardFile, len(Samples)))
+
+    IndexPath = os.path.join(OutDir, "%s-index.json"%Name)
+    with open(IndexPath + ".tmp", "w") as f:
+        json.dump({"Version": TarIndexVersion, "Type": Index.Type, "Info": Index.Info, "Shards": Shards}, f)
+    os.replace(IndexPath + ".tmp", IndexPath)
+    return IndexPath
+
+
+class TarShardReader:
+
+    def __init__(self, IndexPath, shuffle=False, seed=0, ShuffleBuffer=64, decode=True, reduce=1, Rank=0, WorldSize=1):
+        """
+        Read samples of tar shards written by ExportTarShards, shard by shard in streaming order
+
+        Input:
+        IndexPath [str]: path of {Name}-index.json
+        shuffle [bool]: shuffle order of shards, and samples within a shard with a shuffle buffer
+        seed [int]: seed of shuffling, combined with epoch (see set_epoch)
+        ShuffleBuffer [int]: number of samples held to shuffle within shards, samples are drawn at random from it
+        decode [bool]: decode jpgs with opencv, else images are returned as bytes
+        reduce [int]: decode at 1/reduce resolution (1,2,4,8), see ImageDecode
+        Rank, WorldSize: only read every WorldSize-th shard starting at Rank, e.g for dataloader workers
+
+        Yields dict:
+        Key: sample key
+        Annotation: annotation record, same as in annotation json
+        Images: list of images (one per camera for 3D, one for 2D), BGR arrays or bytes
+        CamNames: camera name of each image (None for 2D)
+        """
+        self.IndexPath = IndexPath
+        self.ShardDir = os.path.dirname(IndexPath)
+        with open(IndexPath) as f:
+            self.Index = json.load(f)
+        self.Type = self.Index["Type"]
+        self.Info = self.Index["Info"]
+        self.Shards = self.Index["Shards"][Rank::WorldSize]
+        self.shuffle = shuffle
+        self.seed = seed
+        self.ShuffleBuffer = ShuffleBuffer
+        self.decode = decode
+        self.reduce = reduce
+        self.epoch = 0
+
+    def __len__(self):
+        return sum([len(Shard["Samples"]) for Shard in self.Shards])
+
+    def set_epoch(self, epoch):
+        """Use another shuffle order for each epoch"""
+        self.epoch = epoch
+
+    def MakeSample(self, Key, Members):
+        """Build output dict from member bytes {suffix: bytes}"""
+        Annotation = json.loads(Members["json"].decode("utf-8"))
+        ImageNames = [Suffix for Suffix in Members if Suffix.endswith("jpg")]
+        Images = [Members[Suffix] for Suffix in ImageNames]
+        if self.decode:
+            Images = [cv2.imdecode(np.frombuffer(Data, dtype=np.uint8), ImageDecode.ReduceFlags[self.reduce]) for Data in Images]
+        CamNames = [Suffix[:-len(".jpg")] if Suffix != "jpg" else None for Suffix in ImageNames]
+        return {"Key": Key, "Annotation": Annotation, "Images": Images, "CamNames": CamNames}
+
+    def ReadShard(self, Shard):
+        """Stream samples of one tar in file order"""
+        Key, Members = None, {}
+        with tarfile.open(os.path.join(self.ShardDir, Shard["File"]), "r|") as Tar:
+            for Member in Tar:
+                MemberKey, Suffix = Member.name.split(".", 1)
+                if MemberKey != Key and Key is not None:
+                    yield self.MakeSample(Key, Members)
+                    Members = {}
+                Key = MemberKey
+                Members[Suffix] = Tar.extractfile(Member).read()
+        if Key is not None:
+            yield self.MakeSample(Key, Members)
+
+    def __iter__(self):
+        Generator = np.random.default_rng([self.seed, self.epoch])
+        Order = Generator.permutation(len(self.Shards)) if self.shuffle else range(len(self.Shards))
+        Buffer = []
+        for s in Order:
+            for Sample in self.ReadShard(self.Shards[s]):
+                if not self.shuffle or self.ShuffleBuffer <= 1:
+                    yield Sample
+                    continue
+                #fill buffer, then swap out a random sample for each new one
+                if len(Buffer) < self.ShuffleBuffer:
+                    Buffer.append(Sample)
+                    continue
+                i = Generator.integers(len(Buffer))
+                yield Buffer[i]
+                Buffer[i] = Sample
+        Generator.shuffle(Buffer)
+        for Sample in Buffer:
+            yield Sample
+
+    def GetSample(self, index):
+        """Random access to a sample by its position in the index, reads only its bytes"""
+        for Shard in self.Shards:
+            if index < len(Shard["Samples"]):
+                Sample = Shard["Samples"][index]
+                Members = {}
+                with open(os.path.join(self.ShardDir, Shard["File"]), "rb") as f:
+                    for Suffix, (Offset, Size) in Sample["Members"].items():
+                        f.seek(Offset)
+                        Members[Suffix] = f.read(Size)
+                return self.MakeSample(Sample["Key"], Members)
+            index -= len(Shard["Samples"])
+        raise IndexError(index)
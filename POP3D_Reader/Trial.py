@@ -8,38 +8,83 @@ import csv
 import numpy as np
 import pandas as pd
 import cv2
-from matplotlib import pyplot as plt
 
 
-from POP3D_Reader import CameraObject
+from POP3D_Reader import CameraObject, VideoReader, ValidityIndex
 from Util.VisualizeUtil import *
+from Util import OverlayRenderer
+
+
+def GetTrialName(RowDict):
+    """Get name of trial from a row of the metadata csv"""
+    return "Sequence%s_n%02d_%s"%(RowDict["Sequence"],int(RowDict["IndividualNum"]),RowDict["Date"])
+
+def GenerateFileNames(baseDir, TrialName, Type = "3DPOP"):
+    """
+    Generate all required file names of a trial into a dictionary
+    baseDir: directory of the trial
+    TrialName: name of trial, see GetTrialName
+    Type: type of data, can be: [3DPOP, Train, Val, Test]        
+    """
+    
+    if Type == "3DPOP":
+        FileNameDict = {"VideoPaths": [os.path.join(baseDir, "Videos","%s-Cam%s.mp4"%(TrialName, i+1) ) for i in range(4)],
+                        "ExtrinsicPaths":[os.path.join(baseDir, "CalibrationInfo","%s-Cam%s-Extrinsics.p"%(TrialName, i+1) ) for i in range(4)],
+                        "IntrinsicPaths":[os.path.join(baseDir, "CalibrationInfo","%s-Cam%s-Intrinsics.p"%(TrialName, i+1) ) for i in range(4)],
+                        "BBoxPaths":[os.path.join(baseDir, "Annotation","%s-Cam%s-BBox.csv"%(TrialName, i+1) ) for i in range(4)],
+                        "Key2DPaths":[os.path.join(baseDir, "Annotation","%s-Cam%s-Keypoint2D.csv"%(TrialName, i+1) ) for i in range(4)],
+                        "Key2DFilterPaths":[os.path.join(baseDir, "Annotation","%s-Cam%s-Keypoint2DFiltered.csv"%(TrialName, i+1) ) for i in range(4)],
+                        "Key3DPaths":[os.path.join(baseDir, "Annotation","%s-Cam%s-Keypoint3D.csv"%(TrialName, i+1) ) for i in range(4)],
+                        "SyncArrPaths":[os.path.join(baseDir, "CalibrationInfo","%s-Cam%s-SyncArray.p"%(TrialName, i+1) ) for i in range(4)]}
+    elif Type in ["Train", "Val", "Test"]:
+        FileNameDict = {"VideoPaths": [os.path.join(baseDir, "TrainingSplit",Type,"%s-Cam%s.mp4"%(TrialName, i+1) ) for i in range(4)],
+                        "ExtrinsicPaths":[os.path.join(baseDir, "CalibrationInfo","%s-Cam%s-Extrinsics.p"%(TrialName, i+1) ) for i in range(4)],
+                        "IntrinsicPaths":[os.path.join(baseDir, "CalibrationInfo","%s-Cam%s-Intrinsics.p"%(TrialName, i+1) ) for i in range(4)],
+                        "BBoxPaths":[os.path.join(baseDir,"TrainingSplit",Type,"%s-Cam%s-BBox.csv"%(TrialName, i+1) ) for i in range(4)],
+                        "Key2DPaths":[os.path.join(baseDir, "TrainingSplit",Type,"%s-Cam%s-Keypoint2D.csv"%(TrialName, i+1) ) for i in range(4)],
+                        "Key2DFilterPaths":[os.path.join(baseDir, "TrainingSplit",Type,"%s-Cam%s-Keypoint2DFiltered.csv"%(TrialName, i+1) ) for i in range(4)],
+                        "Key3DPaths":[os.path.join(baseDir, "TrainingSplit",Type,"%s-Cam%s-Keypoint3D.csv"%(TrialName, i+1) ) for i in range(4)],
+                        "SyncArrPaths":[os.path.join(baseDir, "CalibrationInfo","%s-Cam%s-SyncArray.p"%(TrialName, i+1) ) for i in range(4)]}
+    
+    return(FileNameDict)
 
 
 class Trial:
     
-    def __init__(self, dataDir,SequenceNum):
+    def __init__(self, dataDir,SequenceNum, Cache=True, CacheDir=None, Catalog=None):
         """
         Initialize Trial Class, loads everything related to given trial
         
         Input:
         dataDir [str]: Directory to dataset
         SequenceNum [int]: Sequence number
+        Cache [bool]: Whether to cache csvs as binary files, makes loading much faster after the first time
+        CacheDir [str]: Directory to save cache, if None, saved next to csvs
+        Catalog [Dataset3DPOP]: If given, metadata and file names are taken from the catalog instead of re-reading metadata csv
    
                
         """
         # import ipdb;ipdb.set_trace()
         
         #Read Metadata:
-        MetaData = pd.read_csv(os.path.join(dataDir,"Pop3DMetadata.csv"), dtype = str)
-        RowDict = MetaData.loc[MetaData["Sequence"] == str(SequenceNum)].to_dict()
-        self.TrialName = "Sequence%s_n%02d_%s"%(list(RowDict["Sequence"].values())[0],int(list(RowDict["IndividualNum"].values())[0]),list(RowDict["Date"].values())[0])
-        self.baseDir = os.path.join(dataDir,"Pigeon%02d"%int(list(RowDict["IndividualNum"].values())[0]),self.TrialName)
+        if Catalog is None:
+            MetaData = pd.read_csv(os.path.join(dataDir,"Pop3DMetadata.csv"), dtype = str)
+            RowDict = MetaData.loc[MetaData["Sequence"] == str(SequenceNum)].to_dict()
+            RowDict = {key:list(val.values())[0] for key,val in RowDict.items()}
+        else:
+            RowDict = Catalog.GetRow(SequenceNum)
+        self.Catalog = Catalog
+        self.Sequence = int(RowDict["Sequence"])
+        self.TrialName = GetTrialName(RowDict)
+        self.baseDir = os.path.join(dataDir,"Pigeon%02d"%int(RowDict["IndividualNum"]),self.TrialName)
         
+        self.Cache = Cache
+        self.CacheDir = CacheDir
         self.FileNameDict = self.GenerateFileNames()
         self.CamRes = (3840,2160)
+        self.Subjects = RowDict["Subjects"].split(";")
         self.camObjects = self.loadCamObjects()
         self.CamNum = 4
-        self.Subjects = list(RowDict["Subjects"].values())[0].split(";")
         # import ipdb; ipdb.set_trace()
 
     def GenerateFileNames(self, Type = "3DPOP"):
@@ -47,27 +92,10 @@ class Trial:
         From row from meta data, generate all required file names into a dictionary
         Type: type of data, can be: [3DPOP, Train, Val, Test]        
         """
+        if self.Catalog is not None:
+            return self.Catalog.GetFileNames(self.Sequence, Type)
         
-        if Type == "3DPOP":
-            FileNameDict = {"VideoPaths": [os.path.join(self.baseDir, "Videos","%s-Cam%s.mp4"%(self.TrialName, i+1) ) for i in range(4)],
-                            "ExtrinsicPaths":[os.path.join(self.baseDir, "CalibrationInfo","%s-Cam%s-Extrinsics.p"%(self.TrialName, i+1) ) for i in range(4)],
-                            "IntrinsicPaths":[os.path.join(self.baseDir, "CalibrationInfo","%s-Cam%s-Intrinsics.p"%(self.TrialName, i+1) ) for i in range(4)],
-                            "BBoxPaths":[os.path.join(self.baseDir, "Annotation","%s-Cam%s-BBox.csv"%(self.TrialName, i+1) ) for i in range(4)],
-                            "Key2DPaths":[os.path.join(self.baseDir, "Annotation","%s-Cam%s-Keypoint2D.csv"%(self.TrialName, i+1) ) for i in range(4)],
-                            "Key2DFilterPaths":[os.path.join(self.baseDir, "Annotation","%s-Cam%s-Keypoint2DFiltered.csv"%(self.TrialName, i+1) ) for i in range(4)],
-                            "Key3DPaths":[os.path.join(self.baseDir, "Annotation","%s-Cam%s-Keypoint3D.csv"%(self.TrialName, i+1) ) for i in range(4)],
-                            "SyncArrPaths":[os.path.join(self.baseDir, "CalibrationInfo","%s-Cam%s-SyncArray.p"%(self.TrialName, i+1) ) for i in range(4)]}
-        elif Type in ["Train", "Val", "Test"]:
-                        FileNameDict = {"VideoPaths": [os.path.join(self.baseDir, "TrainingSplit",Type,"%s-Cam%s.mp4"%(self.TrialName, i+1) ) for i in range(4)],
-                            "ExtrinsicPaths":[os.path.join(self.baseDir, "CalibrationInfo","%s-Cam%s-Extrinsics.p"%(self.TrialName, i+1) ) for i in range(4)],
-                            "IntrinsicPaths":[os.path.join(self.baseDir, "CalibrationInfo","%s-Cam%s-Intrinsics.p"%(self.TrialName, i+1) ) for i in range(4)],
-                            "BBoxPaths":[os.path.join(self.baseDir,"TrainingSplit",Type,"%s-Cam%s-BBox.csv"%(self.TrialName, i+1) ) for i in range(4)],
-                            "Key2DPaths":[os.path.join(self.baseDir, "TrainingSplit",Type,"%s-Cam%s-Keypoint2D.csv"%(self.TrialName, i+1) ) for i in range(4)],
-                            "Key2DFilterPaths":[os.path.join(self.baseDir, "TrainingSplit",Type,"%s-Cam%s-Keypoint2DFiltered.csv"%(self.TrialName, i+1) ) for i in range(4)],
-                            "Key3DPaths":[os.path.join(self.baseDir, "TrainingSplit",Type,"%s-Cam%s-Keypoint3D.csv"%(self.TrialName, i+1) ) for i in range(4)],
-                            "SyncArrPaths":[os.path.join(self.baseDir, "CalibrationInfo","%s-Cam%s-SyncArray.p"%(self.TrialName, i+1) ) for i in range(4)]}
-        
-        return(FileNameDict)
+        return GenerateFileNames(self.baseDir, self.TrialName, Type)
 
     def loadCamObjects(self):
         """Load Camera objects"""
@@ -79,58 +107,136 @@ class Trial:
             VidPath = self.FileNameDict["VideoPaths"][index]
             ExtPath = self.FileNameDict["ExtrinsicPaths"][index]
             IntPath = self.FileNameDict["IntrinsicPaths"][index]
-            CamObject = CameraObject.CameraObject(CamName,VidPath,ExtPath,IntPath,self.CamRes)            
+            CamObject = CameraObject.CameraObject(CamName,VidPath,ExtPath,IntPath,self.CamRes,Cache=self.Cache,CacheDir=self.CacheDir,Sequence=self.TrialName,Subjects=self.Subjects)            
             CamObj.append(CamObject)
         return CamObj
     
-    def load3DPopDataset(self, Filter = False):
+    def load3DPopDataset(self, Filter = False, cams = None, artifacts = None, Lazy = True):
         """
         Load in all ground truth data from 3D POP
         
         Filter: Whether to load filtered csv for 2D keypoints
+        cams: Index of cameras to load, default all
+        artifacts: Which annotations to load, any of [Keypoint2D, Keypoint2DFilter, BBox, Keypoint3D], default all
+        Lazy: If True, csvs are only read when first accessed, else read now
         """
-        
-        for index in range(self.CamNum):
-            ##Paths:
-            Keypoint2DPath = self.FileNameDict["Key2DPaths"][index]
-            BBoxPath = self.FileNameDict["BBoxPaths"][index]
-            Keypoint3DPath = self.FileNameDict["Key3DPaths"][index]
-            FilterKeypoint2DPath = self.FileNameDict["Key2DFilterPaths"][index]
-
-            self.camObjects[index].loadBBoxData(BBoxPath)
-            self.camObjects[index].load3DKeypoint(Keypoint3DPath)
-
-            if Filter:
-                self.camObjects[index].Keypoint2D = self.camObjects[index].ReadCSV(FilterKeypoint2DPath)
-            else:
-                self.camObjects[index].load2DKeypoint(Keypoint2DPath)
-                self.camObjects[index].load2DFilterKeypoint(FilterKeypoint2DPath)
+        self.loadAnnotations(Filter, cams, artifacts, Lazy)
                 
-    def load3DPopTrainingSet(self, Filter = True, Type = "Train"):
+    def load3DPopTrainingSet(self, Filter = True, Type = "Train", cams = None, artifacts = None, Lazy = True):
         """
         Load in training set for 3D POP
         
         Filter: Whether to load filtered csv for 2D keypoints
         Type: type of data, can be: [Train, Val, Test]  
+        cams: Index of cameras to load, default all
+        artifacts: Which annotations to load, any of [Keypoint2D, Keypoint2DFilter, BBox, Keypoint3D], default all
+        Lazy: If True, csvs are only read when first accessed, else read now
         """
         self.FileNameDict = self.GenerateFileNames(Type=Type)
         self.camObjects = self.loadCamObjects()
-        
-        for index in range(self.CamNum):
+        self.loadAnnotations(Filter, cams, artifacts, Lazy)
+
+    def loadAnnotations(self, Filter = False, cams = None, artifacts = None, Lazy = True):
+        """
+        Set annotation paths of selected cameras from file name dict, see load3DPopDataset
+        With Filter, Keypoint2D is read from the filtered csv and Keypoint2DFilter is not loaded
+        """
+        if cams is None:
+            cams = list(range(self.CamNum))
+        if artifacts is None:
+            artifacts = CameraObject.AnnotationTypes
+        for Name in artifacts:
+            if Name not in CameraObject.AnnotationTypes:
+                raise ValueError("Unknown annotation type %s, has to be one of %s"%(Name, CameraObject.AnnotationTypes))
+        if Filter:
+            artifacts = [Name for Name in artifacts if Name != "Keypoint2DFilter"]
+
+        for index in cams:
             ##Paths:
-            Keypoint2DPath = self.FileNameDict["Key2DPaths"][index]
-            BBoxPath = self.FileNameDict["BBoxPaths"][index]
-            Keypoint3DPath = self.FileNameDict["Key3DPaths"][index]
-            FilterKeypoint2DPath = self.FileNameDict["Key2DFilterPaths"][index]
+            PathDict = {"Keypoint2D": self.FileNameDict["Key2DFilterPaths" if Filter else "Key2DPaths"][index],
+                        "Keypoint2DFilter": self.FileNameDict["Key2DFilterPaths"][index],
+                        "BBox": self.FileNameDict["BBoxPaths"][index],
+                        "Keypoint3D": self.FileNameDict["Key3DPaths"][index]}
+
+            for Name in artifacts:
+                self.camObjects[index].SetAnnotationPath(Name, PathDict[Name])
+                if not Lazy:
+                    getattr(self.camObjects[index], Name)
+
+    def GetValidityIndex(self, Type = "3DPOP", Filter = False):
+        """
+        Get packed validity index of 2D keypoints, to find frames with ground truth without loading csvs
+        Type: type of data, can be: [3DPOP, Train, Val, Test]
+        Filter: use filtered 2D keypoints
+        e.g self.GetValidityIndex("Train", True).frames_where(all_cams=True, birds="all", keypoints=["hd_beak"])
+        """
+        if self.Catalog is not None:
+            return self.Catalog.GetValidityIndex(self.Sequence, Type, Filter)
+        FileNameDict = self.GenerateFileNames(Type)
+        return ValidityIndex.ValidityIndex(FileNameDict["Key2DFilterPaths" if Filter else "Key2DPaths"],
+                                           Subjects=self.Subjects, CacheDir=self.CacheDir, Cache=self.Cache)
 
-            self.camObjects[index].loadBBoxData(BBoxPath)
-            self.camObjects[index].load3DKeypoint(Keypoint3DPath)
+    def get_range(self, start, stop, cams=None, birds=None, keypoints=None):
+        """
+        Get synchronized ground truth of all cameras for a range of frames as numpy arrays,
+        one vectorized gather per camera instead of reading frame by frame.
+        Requires load3DPopDataset or load3DPopTrainingSet to be called first
 
-            if Filter:
-                self.camObjects[index].Keypoint2D = self.camObjects[index].ReadCSV(FilterKeypoint2DPath)
-            else:
-                self.camObjects[index].load2DKeypoint(Keypoint2DPath)
-                self.camObjects[index].load2DFilterKeypoint(FilterKeypoint2DPath)
+        Input:
+        start, stop [int]: range of frames, stop not included
+        cams [list]: Index of cameras within the trial object, default all
+        birds [list]: Bird IDs, default all subjects
+        keypoints [list]: Keypoint names, e.g ["hd_beak","bp_tail"], default all keypoints
+
+        Output:
+        Dict with keys:
+        Frames: (F,) frame numbers
+        Keypoint2D: (F,C,B,K,2), Valid2D: (F,C,B,K)
+        Keypoint3D: (F,B,K,3), Valid3D: (F,B,K), read from the first camera in cams
+        BBox: (F,C,B,4), top left and bottom right corners [x1,y1,x2,y2], ValidBBox: (F,C,B)
+        Subjects, Keypoints, CamNames: names along bird, keypoint and camera axes
+        """
+        if cams is None:
+            cams = list(range(len(self.camObjects)))
+        if birds is None:
+            birds = self.Subjects
+
+        Frames = np.arange(start, stop)
+        camObjs = [self.camObjects[index] for index in cams]
+
+        ##2D keypoints
+        Key2DList = []
+        for camObj in camObjs:
+            Store = camObj.GetKeypointStore(camObj.Keypoint2D, 2)
+            Key2D, keypoints = Store.Gather(Frames, birds, keypoints)
+            Key2DList.append(Key2D)
+        Keypoint2D = np.stack(Key2DList, axis=1)
+
+        ##3D keypoints
+        Store = camObjs[0].GetKeypointStore(camObjs[0].Keypoint3D, 3)
+        Keypoint3D, _ = Store.Gather(Frames, birds, keypoints)
+
+        ##BBox, convert from x,y,w,h to corners
+        BBoxList = []
+        for camObj in camObjs:
+            Store = camObj.GetKeypointStore(camObj.BBox, 4)
+            BBox, _ = Store.Gather(Frames, birds)
+            BBoxList.append(BBox[:, :, 0, :])
+        BBox = np.stack(BBoxList, axis=1)
+        BBox[..., 2:] += BBox[..., :2]
+
+        OutDict = {"Frames": Frames,
+                   "Keypoint2D": Keypoint2D,
+                   "Valid2D": np.isfinite(Keypoint2D).all(axis=-1),
+                   "Keypoint3D": Keypoint3D,
+                   "Valid3D": np.isfinite(Keypoint3D).all(axis=-1),
+                   "BBox": BBox,
+                   "ValidBBox": np.isfinite(BBox).all(axis=-1),
+                   "Subjects": list(birds),
+                   "Keypoints": list(keypoints),
+                   "CamNames": [camObj.CamName for camObj in camObjs]}
+
+        return OutDict
 
     def VisualizeTrainingData(self,CamIndex = 0, startframe = 0,
                               save = False, 
@@ -150,7 +256,7 @@ class Trial:
         
         Options [Bool]:
         save: Saves video to specified directory
-        show: Shows video on a opencv window
+        show: Shows video on a opencv window, if False no window is used (headless)
         points: plots all keypoints as points
         Lines: plots lines between the keypoints to visualize head and body objects
         BBox: plots bounding boxes
@@ -166,99 +272,28 @@ class Trial:
         
         BirdList = self.Subjects
         # BirdList = ["485_0107"]
-        #custom colours for trajectory:
-        TrajColours = [(255, 0 , 0 ),(0,255,0), (0,0,255),(255,255,0),(255, 0 , 255),(0, 255, 255),(63,133,205),(128,0,128),(203,192,255),(0,165,255)]
+        #lookup tables for colours/ skeleton are built once, each frame is drawn from one keypoint array
+        Renderer = OverlayRenderer.OverlayRenderer(camObj.GetKeypointStore(camObj.Keypoint2D, 2),
+                                                   camObj.GetKeypointStore(camObj.BBox, 4) if (BBox or Traj) else None,
+                                                   camObj.dim, BirdList,
+                                                   points=points, Lines=Lines, BBox=BBox, Traj=Traj, MarkersOnly=MarkersOnly)
 
         if show:
             cv2.namedWindow("Window", cv2.WINDOW_NORMAL)
-        cap = cv2.VideoCapture(VideoPath)
-        cap.set(cv2.CAP_PROP_POS_FRAMES,counter) #Start reading frames from startframe
+        #frames are decoded in a background thread while the previous frame is drawn
+        StopFrame = int(max(camObj.Keypoint2D["frame"]))+1 #end if reach end of dataframe
+        Reader = VideoReader.MultiVideoReader([VideoPath], StartFrame=counter, StopFrame=StopFrame)
 
         # record vid
         if save:
-            out = cv2.VideoWriter(save, cv2.VideoWriter_fourcc(*'mp4v'), 30, camObj.dim)
-
-        BirdTrajDict = {}
-        for bird in BirdList:
-            BirdTrajDict[bird] = []
-
-        while(cap.isOpened()):
-            if counter > max(camObj.Keypoint2D["frame"]): #end if reach end of dataframe
-                break
-        # for x in range(1800):
-            # print(counter)
-            ret, frame = cap.read()
-            if ret == True:
-                for k in range(len(BirdList)):
-                    bird = BirdList[k]
-                    MarkerDict = camObj.Read2DKeypointData(camObj.Keypoint2D, counter, bird)
-                    # AllMarkers, AllObjNames = GetMarkerPoints2D(camObj.Keypoint2D, bird, counter)
-                    if len(MarkerDict)==0:
-                        continue
-                        
-                    if Lines:
-                        #Draw lines
-                        PlotLine(MarkerDict,"leftEye","nose",[0,0,255],frame)
-                        PlotLine(MarkerDict,"rightEye","nose",[0,0,255],frame)
-                        PlotLine(MarkerDict,"beak","nose",[0,0,255],frame)
-                        PlotLine(MarkerDict,"leftEye","rightEye",[0,0,255],frame)
-                        PlotLine(MarkerDict,"leftShoulder","rightShoulder",[0,255,0],frame)
-                        PlotLine(MarkerDict,"leftShoulder","topKeel",[0,255,0],frame)
-                        PlotLine(MarkerDict,"topKeel","rightShoulder",[0,255,0],frame)
-                        PlotLine(MarkerDict,"leftShoulder","tail",[0,255,0],frame)
-                        PlotLine(MarkerDict,"tail","rightShoulder",[0,255,0],frame)
-                        PlotLine(MarkerDict,"tail","bottomKeel",[0,255,0],frame)
-                        PlotLine(MarkerDict,"bottomKeel","topKeel",[0,255,0],frame)
-                    
-                    if Traj:
-                        Start, End = camObj.GetBBoxData(camObj.BBox, counter,bird)
-                        if not Start or not End:
-                            continue
-                        elif np.isnan([Start[0],Start[1],End[0],End[1]]).any() :
-                            continue
-                        Midpoint = camObj.GetBBoxMidPoint(camObj.BBox, counter,bird)
-                        BirdTrajDict[bird].append(Midpoint)
-                        # import ipdb;ipdb.set_trace()
-                        PlotBirdTrajectory(frame, BirdTrajDict[bird], 150, TrajColours[k])
-
-                    if BBox:
-                        Start, End = camObj.GetBBoxData(camObj.BBox, counter,bird)
-                        if not Start or not End:
-                            continue
-                        elif np.isnan([Start[0],Start[1],End[0],End[1]]).any() :
-                            continue
-
-                        # print(Start)
-                        cv2.rectangle(frame,(round(Start[0]),round(Start[1])),(round(End[0]),round(End[1])),
-                        TrajColours[k],3)
-                    if points:
-                        for key,coord in MarkerDict.items():
-                            pts = coord
-                            if np.isnan(pts[0]) or math.isinf(pts[0]) or math.isinf(pts[1]):
-                                continue
-                            #######
-                            point = (round(pts[0]),round(pts[1]))
-                            if IsPointValid(camObj.dim,point):
-                                # import ipdb;ipdb.set_trace()
-                                if MarkersOnly:
-                                    Type = getType(key)
-                                    if Type is None:
-                                        colour = getColor(key)
-                                        cv2.circle(frame,point,3,colour, -1)
-                                    else:
-                                        continue
-
-                                if Lines:
-                                    Type = getType(key)
-                                    if Type == "Head":
-                                        cv2.circle(frame,point,2,[0,255,255], -1)
-                                    elif Type =="Backpack":
-                                        cv2.circle(frame,point,2,[0,255,255], -1)
-                                    else:
-                                        continue
-                                else:
-                                    colour = getColor(key)
-                                    cv2.circle(frame,point,1,colour, -1)
+            out = VideoReader.ThreadedVideoWriter(save, cv2.VideoWriter_fourcc(*'mp4v'), 30, camObj.dim)
+
+        try:
+            for counter, Images in Reader:
+                frame = Images[0]
+                if frame is None:
+                    break
+                Renderer.Draw(frame, counter)
 
                 if save:
                     out.write(frame)
@@ -267,20 +302,75 @@ class Trial:
                     # cv2.imwrite('./sample.jpg', frame)
 
                 if jupyter:
+                    from matplotlib import pyplot as plt #only needed in notebooks
                     frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                     plt.imshow(frame)
                     plt.show()
                     break
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                if show and cv2.waitKey(1) & 0xFF == ord('q'):
                     break
-            else:
-                break
-            counter += 1
-            
-        cap.release()
-        cv2.destroyAllWindows()
-        if save:  
-            out.release()
+        finally:
+            #decode threads and capture are released even if drawing fails or the window is closed
+            Reader.close()
+            if show:
+                cv2.destroyAllWindows()
+            if save:
+                out.release()
+
+    def ExportQAVideos(self, OutDir, cams=None, startframe=0, stopframe=None, fps=30,
+                       points=True, Lines=False, BBox=False, Traj=False, MarkersOnly=False, QueueSize=8):
+        """
+        Headless export of ground truth overlay videos of all cameras, for quality checks.
+        Decoding (one thread per camera), drawing and encoding (one thread per camera) run as
+        overlapping stages connected by bounded queues. No opencv window or matplotlib is used.
+        Requires load3DPopDataset or load3DPopTrainingSet to be called first
+
+        Input:
+        OutDir [str]: directory to save videos, one video per camera named {TrialName}-{CamName}-QA.mp4
+        cams [list]: Index of cameras within the trial object, default all
+        startframe, stopframe [int]: range of frames, default till end of annotations
+        fps [float]: frame rate of output videos
+        points, Lines, BBox, Traj, MarkersOnly [bool]: what to draw, see VisualizeTrainingData
+        QueueSize [int]: number of frames buffered between stages
+
+        Output:
+        OutPaths [list]: paths of saved videos
+        """
+        if cams is None:
+            cams = list(range(len(self.camObjects)))
+        camObjs = [self.camObjects[index] for index in cams]
+        if not os.path.exists(OutDir):
+            os.makedirs(OutDir)
+
+        if stopframe is None:
+            stopframe = min([int(max(camObj.Keypoint2D["frame"])) for camObj in camObjs])+1
+
+        Renderers = []
+        Writers = []
+        OutPaths = []
+        for camObj in camObjs:
+            Renderers.append(OverlayRenderer.OverlayRenderer(camObj.GetKeypointStore(camObj.Keypoint2D, 2),
+                                                             camObj.GetKeypointStore(camObj.BBox, 4) if (BBox or Traj) else None,
+                                                             camObj.dim, self.Subjects,
+                                                             points=points, Lines=Lines, BBox=BBox, Traj=Traj, MarkersOnly=MarkersOnly))
+            OutPath = os.path.join(OutDir, "%s-%s-QA.mp4"%(self.TrialName, camObj.CamName))
+            Writers.append(VideoReader.ThreadedVideoWriter(OutPath, cv2.VideoWriter_fourcc(*'mp4v'), fps, camObj.dim, QueueSize))
+            OutPaths.append(OutPath)
+
+        Reader = VideoReader.MultiVideoReader([camObj.VideoPath for camObj in camObjs],
+                                              StartFrame=startframe, StopFrame=stopframe, QueueSize=QueueSize)
+        try:
+            for counter, Images in Reader:
+                for x in range(len(camObjs)):
+                    if Images[x] is None:
+                        continue
+                    Writers[x].write(Renderers[x].Draw(Images[x], counter))
+        finally:
+            Reader.close()
+            for Writer in Writers:
+                Writer.release()
+
+        return OutPaths
 
 def main():
     ##Test on default file
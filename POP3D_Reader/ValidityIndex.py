@@ -0,0 +1,174 @@
+# !/usr/bin/env python3
+""" Packed bit index of which (frame, camera, bird, keypoint) have 2D ground truth, for fast sampling queries"""
+
+import os
+import numpy as np
+
+from POP3D_Reader import CSVCache, KeypointStore
+
+ValidityIndexVersion = 1
+
+
+def BuildValidity(CSVPaths, Subjects=None, CacheDir=None, Cache=True):
+    """
+    Read 2D keypoint csvs of all cameras of a trial and get validity of each point
+
+    Input:
+    CSVPaths [list]: Keypoint2D csv of each camera
+    Subjects [list]: bird IDs, default read from csv column names
+    CacheDir, Cache: see CSVCache.ReadCSV
+
+    Output:
+    Frames: (F,) sorted union of frames of all cameras
+    Valid: (F,C,B,K) bool, point is not nan, False if frame is missing in a camera
+    Has: (C,B,K) bool, csv of camera has a column for the keypoint of the bird
+    Subjects: bird IDs along bird axis
+    Keypoints: keypoint names (without bird ID) along keypoint axis
+    """
+    Stores = [KeypointStore.KeypointStore(CSVCache.ReadCSV(Path, CacheDir=CacheDir, Cache=Cache, dtype=np.float32), 2,
+                                          Subjects=Subjects, dtype=np.float32)
+              for Path in CSVPaths]
+    if Subjects is None:
+        Subjects = []
+        for Store in Stores:
+            Subjects += [bird for bird in Store.Subjects if bird not in Subjects]
+    Keypoints = []
+    for Store in Stores:
+        for bird in Subjects:
+            Keypoints += [Name for Name in Store.Keypoints.get(bird, []) if Name not in Keypoints]
+
+    Frames = np.unique(np.concatenate([Store.Frames for Store in Stores])) if len(Stores) > 0 else np.zeros(0, dtype=np.int64)
+    Valid = np.zeros((len(Frames), len(Stores), len(Subjects), len(Keypoints)), dtype=bool)
+    Has = np.zeros((len(Stores), len(Subjects), len(Keypoints)), dtype=bool)
+    for c, Store in enumerate(Stores):
+        Rows = Store.GetRows(Frames)
+        for b, bird in enumerate(Subjects):
+            if not Store.HasBird(bird):
+                continue
+            Names = Store.Keypoints[bird]
+            KeyIdx = [Keypoints.index(Name) for Name in Names]
+            Points = Store.Data[np.clip(Rows, 0, None), Store.BirdIndex[bird], :len(Names)]
+            Valid[:, c, b, KeyIdx] = np.isfinite(Points).all(axis=-1) & (Rows >= 0)[:, None]
+            Has[c, b, KeyIdx] = True
+
+    return Frames, Valid, Has, list(Subjects), Keypoints
+
+
+class ValidityIndex:
+
+    def __init__(self, CSVPaths, CamNames=None, Subjects=None, CacheDir=None, Cache=True):
+        """
+        Validity of every 2D keypoint of a trial, stored as packed bits (8 keypoints per byte) in a sidecar npz
+        next to the first csv (or in CacheDir). The csvs are only read when the index is missing or stale,
+        queries afterwards only use the bits.
+
+        Input:
+        CSVPaths [list]: Keypoint2D (or filtered) csv of each camera
+        CamNames [list]: names of cameras, default Cam1...
+        Subjects [list]: bird IDs, default read from csv column names
+        CacheDir [str]: directory to save index, if None, saved next to first csv
+        Cache [bool]: passed on to CSVCache.ReadCSV when the index has to be built
+
+        Attributes:
+        Frames: (F,) frame numbers
+        Bits: (F,C,B,ceil(K/8)) uint8, packed validity along keypoint axis
+        HasBits: (C,B,ceil(K/8)) uint8, packed keypoints that exist in the csv of each camera/ bird
+        Subjects, Keypoints, CamNames: names along bird, keypoint and camera axes
+        """
+        self.CSVPaths = list(CSVPaths)
+        self.CamNames = list(CamNames) if CamNames is not None else ["Cam%i"%(i+1) for i in range(len(self.CSVPaths))]
+        self.IndexPath = CSVCache.GetCachePath(self.CSVPaths[0], CacheDir, Ext=".valid.npz")
+
+        if not self.Load(Subjects):
+            print("Building validity index for %s"%os.path.basename(self.CSVPaths[0]))
+            Stamps = np.stack([CSVCache.GetSourceStamp(Path) for Path in self.CSVPaths])
+            self.Frames, Valid, Has, self.Subjects, self.Keypoints = BuildValidity(self.CSVPaths, Subjects, CacheDir, Cache)
+            self.Bits = np.packbits(Valid, axis=-1)
+            self.HasBits = np.packbits(Has, axis=-1)
+            CSVCache.WriteCache(self.IndexPath, {"Frames": self.Frames, "Bits": self.Bits, "HasBits": self.HasBits,
+                                                 "Subjects": np.array(self.Subjects, dtype=str),
+                                                 "Keypoints": np.array(self.Keypoints, dtype=str),
+                                                 "__stamp__": Stamps,
+                                                 "__version__": np.array(ValidityIndexVersion)})
+        self.BirdIndex = {bird: i for i, bird in enumerate(self.Subjects)}
+
+    def Load(self, Subjects):
+        """Load index from npz, returns False if missing, stale or built for other subjects"""
+        if not os.path.exists(self.IndexPath):
+            return False
+        try:
+            with np.load(self.IndexPath, allow_pickle=False) as Index:
+                Stamps = Index["__stamp__"]
+                if int(Index["__version__"]) != ValidityIndexVersion or len(Stamps) != len(self.CSVPaths):
+                    return False
+                if not all(CSVCache.IsCacheValid(Stamp, Path) for Stamp, Path in zip(Stamps, self.CSVPaths)):
+                    return False
+                if Subjects is not None and Index["Subjects"].tolist() != list(Subjects):
+                    return False
+                self.Frames = Index["Frames"]
+                self.Bits = Index["Bits"]
+                self.HasBits = Index["HasBits"]
+                self.Subjects = Index["Subjects"].tolist()
+                self.Keypoints = Index["Keypoints"].tolist()
+        except (OSError, KeyError, ValueError) as e:
+            print("Could not read validity index %s, rebuilding: %s"%(self.IndexPath, e))
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.Frames)
+
+    def GetKeypointMask(self, keypoints):
+        """Packed bit mask of keypoints, matched by suffix like KeypointStore.MatchKeypoints"""
+        Selected = np.zeros(len(self.Keypoints), dtype=bool)
+        for Key in keypoints:
+            Match = [i for i, Name in enumerate(self.Keypoints) if Name.endswith(Key)]
+            if len(Match) == 0:
+                raise ValueError("Keypoint %s not in validity index"%Key)
+            Selected[Match[0]] = True
+        return np.packbits(Selected)
+
+    def GetValid(self, cams=None, birds="all", keypoints=None):
+        """
+        Whether all selected keypoints are valid, for each frame/ camera/ bird
+
+        cams [list]: camera indexes, default all
+        birds: "all", "any" or list of bird IDs
+        keypoints [list]: keypoint names, default all keypoints each bird has in the csv (same as dropna on the csv)
+
+        returns (F,C,B) bool array
+        """
+        if cams is None:
+            cams = list(range(len(self.CamNames)))
+        if isinstance(birds, str):
+            BirdIdx = list(range(len(self.Subjects)))
+        else:
+            BirdIdx = [self.BirdIndex[bird] for bird in birds]
+        if keypoints is None:
+            Mask = self.HasBits[cams][:, BirdIdx]
+        else:
+            Mask = self.GetKeypointMask(keypoints)
+        Bits = self.Bits[:, cams][:, :, BirdIdx]
+        return ((Bits & Mask) == Mask).all(axis=-1)
+
+    def frames_where(self, all_cams=True, birds="all", keypoints=None, cams=None):
+        """
+        Frames where keypoints are valid, answered from the packed bits only
+
+        Input:
+        all_cams [bool]: if True, valid in all cameras, else in at least one camera
+        birds: "all" (all subjects valid), "any" (at least one subject) or list of bird IDs that all have to be valid
+        keypoints [list]: keypoint names that all have to be valid, default all keypoints in the csvs
+        cams [list]: camera indexes to consider, default all
+
+        Output:
+        Frames: sorted array of frame numbers
+        """
+        Valid = self.GetValid(cams, birds, keypoints)
+        Valid = Valid.any(axis=-1) if birds == "any" else Valid.all(axis=-1)
+        Valid = Valid.all(axis=-1) if all_cams else Valid.any(axis=-1)
+        return self.Frames[Valid]
+
+    def count_where(self, **kwargs):
+        """Number of frames of frames_where, same arguments"""
+        return len(self.frames_where(**kwargs))
@@ -0,0 +1,405 @@
+# !/usr/bin/env python3
+""" Threaded video readers for synchronized multi camera 3DPOP videos"""
+
+import os
+import threading
+import queue
+import itertools
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+from POP3D_Reader import CSVCache
+
+EndOfVideo = object() #sentinel put in queue when a camera runs out of frames
+KeyframeIndexVersion = 1
+
+
+def BuildKeyframeIndex(VideoPath):
+    """
+    Find keyframes of a video by reading raw packets without decoding them (FFmpeg backend only)
+
+    Input:
+    VideoPath [str]: path to video
+    Output:
+    Keyframes [array]: sorted frame numbers of keyframes, None if backend does not report keyframes
+    FrameCount [int]: number of frames read
+    """
+    if not hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME"):
+        return None, 0
+    cap = cv2.VideoCapture(VideoPath, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+    if not cap.isOpened():
+        return None, 0
+
+    Keyframes = []
+    FrameCount = 0
+    while cap.grab():
+        if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+            Keyframes.append(FrameCount)
+        FrameCount += 1
+    cap.release()
+
+    if len(Keyframes) == 0 or Keyframes[0] != 0:
+        #backend did not report keyframes properly, dont trust index
+        return None, FrameCount
+    return np.array(Keyframes, dtype=np.int64), FrameCount
+
+def LoadKeyframeIndex(VideoPath, CacheDir=None, Build=True):
+    """
+    Load keyframe index of a video from its sidecar file, index is built and saved on first use
+    Sidecar is rebuilt if video was modified since
+
+    Input:
+    VideoPath [str]: path to video
+    CacheDir [str]: directory of sidecar, if None saved next to video (see CSVCache.GetCachePath)
+    Build [bool]: build index if no valid sidecar exists
+    Output:
+    Keyframes [array]: sorted keyframe numbers, None if not available
+    """
+    IndexPath = CSVCache.GetCachePath(VideoPath, CacheDir, Ext=".keyframes.npz")
+    if os.path.exists(IndexPath):
+        try:
+            with np.load(IndexPath, allow_pickle=False) as Index:
+                if int(Index["__version__"]) == KeyframeIndexVersion and CSVCache.IsCacheValid(Index["__stamp__"], VideoPath):
+                    return Index["Keyframes"]
+        except (OSError, KeyError, ValueError) as e:
+            print("Could not read keyframe index %s, rebuilding: %s"%(IndexPath, e))
+
+    if not Build:
+        return None
+
+    Stamp = CSVCache.GetSourceStamp(VideoPath)
+    Keyframes, FrameCount = BuildKeyframeIndex(VideoPath)
+    if Keyframes is None:
+        print("Could not index keyframes of %s, using normal seeking"%VideoPath)
+        return None
+    CSVCache.WriteCache(IndexPath, {"Keyframes": Keyframes,
+                                    "FrameCount": np.array(FrameCount),
+                                    "__stamp__": Stamp,
+                                    "__version__": np.array(KeyframeIndexVersion)})
+    return Keyframes
+
+
+class ThreadedVideoWriter:
+
+    def __init__(self, Path, Fourcc, fps, Size, QueueSize=8):
+        """
+        cv2.VideoWriter that encodes in a background thread, write() only puts the frame on a bounded queue
+
+        Input:
+        Path [str]: output video path
+        Fourcc: cv2.VideoWriter_fourcc code
+        fps [float]: frame rate
+        Size [tuple]: (width,height)
+        QueueSize [int]: number of frames buffered before write() blocks
+        """
+        self.Path = Path
+        self.Writer = cv2.VideoWriter(Path, Fourcc, fps, Size)
+        self.Queue = queue.Queue(maxsize=QueueSize)
+        self.Errors = []
+        self.Thread = threading.Thread(target=self.WriteLoop, daemon=True)
+        self.Thread.start()
+
+    def WriteLoop(self):
+        while True:
+            img = self.Queue.get()
+            if img is EndOfVideo:
+                break
+            try:
+                self.Writer.write(img)
+            except Exception as e:
+                self.Errors.append(e)
+
+    def write(self, img):
+        if len(self.Errors) > 0:
+            raise self.Errors[0]
+        self.Queue.put(img)
+
+    def release(self):
+        """Wait for all queued frames to be written, then close video"""
+        self.Queue.put(EndOfVideo)
+        self.Thread.join()
+        self.Writer.release()
+        if len(self.Errors) > 0:
+            raise self.Errors[0]
+
+
+class FrameCache:
+
+    def __init__(self, MaxBytes=256*1024**2):
+        """
+        Least recently used cache of decoded frames, capped by total bytes of stored images
+        (a 3840x2160 BGR frame is ~25MB, so default 256MB holds ~10 4K frames)
+        Thread safe, can be shared between videos, keys are (VideoPath, frame)
+
+        Input:
+        MaxBytes [int]: byte budget, 0 to disable caching
+
+        Hits/ Misses count lookups, use GetStats to size the budget
+        """
+        self.MaxBytes = MaxBytes
+        self.CurrentBytes = 0
+        self.Frames = OrderedDict()
+        self.Hits = 0
+        self.Misses = 0
+        self.Lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.Frames)
+
+    def get(self, VideoPath, frame):
+        """Returns copy of cached frame, None if not cached. Copy so drawing on it does not alter the cache"""
+        Key = (VideoPath, int(frame))
+        with self.Lock:
+            if Key not in self.Frames:
+                self.Misses += 1
+                return None
+            self.Hits += 1
+            self.Frames.move_to_end(Key)
+            return self.Frames[Key].copy()
+
+    def put(self, VideoPath, frame, img):
+        """
+        Store a frame, dropping least recently used frames until within budget
+        The cache owns img afterwards (it is not copied), do not modify it after put, get returns copies
+        """
+        if img is None or img.nbytes > self.MaxBytes:
+            return
+        Key = (VideoPath, int(frame))
+        with self.Lock:
+            if Key in self.Frames:
+                self.CurrentBytes -= self.Frames.pop(Key).nbytes
+            self.Frames[Key] = img
+            self.CurrentBytes += img.nbytes
+            while self.CurrentBytes > self.MaxBytes:
+                _, Dropped = self.Frames.popitem(last=False)
+                self.CurrentBytes -= Dropped.nbytes
+
+    def clear(self):
+        with self.Lock:
+            self.Frames.clear()
+            self.CurrentBytes = 0
+
+    def GetStats(self):
+        """Dict of hits, misses, hit rate, number of frames and bytes used"""
+        with self.Lock:
+            Total = self.Hits + self.Misses
+            return {"Hits": self.Hits,
+                    "Misses": self.Misses,
+                    "HitRate": self.Hits/Total if Total > 0 else 0.0,
+                    "Frames": len(self.Frames),
+                    "Bytes": self.CurrentBytes,
+                    "MaxBytes": self.MaxBytes}
+
+
+class SeekableVideo:
+
+    def __init__(self, VideoPath, CacheDir=None, UseIndex=True, MaxGrab=16):
+        """
+        Video capture with fast accurate random access.
+        To read a frame, jumps to the closest keyframe before it and grabs forward,
+        or only grabs forward if the frame is just after the current position.
+
+        Input:
+        VideoPath [str]: path to video
+        CacheDir [str]: directory of keyframe index sidecar, if None saved next to video
+        UseIndex [bool]: if False, or no index could be built, seek with CAP_PROP_POS_FRAMES
+        MaxGrab [int]: targets at most this many frames ahead are always reached by grabbing,
+                       cheaper than a seek even if a keyframe lies in between
+        """
+        self.VideoPath = VideoPath
+        self.MaxGrab = MaxGrab
+        self.capture = cv2.VideoCapture(VideoPath)
+        self.FrameCount = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.Keyframes = LoadKeyframeIndex(VideoPath, CacheDir) if UseIndex else None
+        self.Position = 0 #next frame the capture will return
+
+    def GetKeyframe(self, frame):
+        """Closest keyframe at or before frame"""
+        return int(self.Keyframes[np.searchsorted(self.Keyframes, frame, side="right") - 1])
+
+    def seek(self, frame):
+        """Move capture so that next read returns given frame"""
+        frame = int(frame)
+        if frame == self.Position:
+            return True
+        if self.Position < frame <= self.Position + self.MaxGrab:
+            return self.GrabTo(frame)
+        if self.Keyframes is None:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, frame)
+            self.Position = frame
+            return True
+
+        Keyframe = self.GetKeyframe(frame)
+        if not (Keyframe <= self.Position < frame):
+            #target is behind, or a keyframe lies in between, jump to keyframe
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, Keyframe)
+            self.Position = Keyframe
+        return self.GrabTo(frame)
+
+    def GrabTo(self, frame):
+        """Grab (without retrieving) until next read returns given frame"""
+        while self.Position < frame:
+            if not self.capture.grab():
+                return False
+            self.Position += 1
+        return True
+
+    def read(self, frame=None):
+        """Read given frame, or next frame if None. Returns (ret, image) like cv2"""
+        if frame is not None and not self.seek(frame):
+            return False, None
+        ret, img = self.capture.read()
+        if ret:
+            self.Position += 1
+        return ret, img
+
+    def grab(self):
+        ret = self.capture.grab()
+        if ret:
+            self.Position += 1
+        return ret
+
+    def release(self):
+        self.capture.release()
+
+
+class MultiVideoReader:
+
+    def __init__(self, VideoPaths, FrameDiffs=None, StartFrame=0, StopFrame=None, QueueSize=8,
+                 Frames=None, UseIndex=None, CacheDir=None, MaxGrab=16):
+        """
+        Reads multiple videos in parallel, one decoding thread per camera, and yields aligned frames.
+        OpenCV releases the GIL while decoding, so cameras are decoded at the same time.
+        With Frames, only those frames are decoded, see SeekableVideo, so reading time scales
+        with the number of frames instead of the length of the video.
+
+        Input:
+        VideoPaths [list]: paths to videos
+        FrameDiffs [list]: frame offset of each camera (see SystemInit.LoadSyncArray),
+                           video frame of camera i is frame - FrameDiffs[i]. Default all 0, i.e videos already synced
+        StartFrame [int]: first frame to read
+        StopFrame [int]: frame to stop at (not included), if None read till end of video
+        QueueSize [int]: number of decoded frames buffered per camera
+        Frames [list]: only read these frames (sorted, duplicates removed), within StartFrame/ StopFrame
+        UseIndex [bool]: seek with keyframe index, default only if Frames is given
+        CacheDir [str]: directory of keyframe index sidecars, if None saved next to videos
+        MaxGrab [int]: gaps up to this many frames are skipped with grab(), larger gaps seek to a keyframe
+
+        Usage:
+        with MultiVideoReader(Paths) as Reader:
+            for frame, Images in Reader:
+                ...
+        Images is a list with one image per camera, None if frame does not exist for that camera
+        (before its start or after its end), iteration stops when all cameras reached their end
+        """
+        self.VideoPaths = list(VideoPaths)
+        self.FrameDiffs = list(FrameDiffs) if FrameDiffs is not None else [0]*len(self.VideoPaths)
+        if len(self.FrameDiffs) != len(self.VideoPaths):
+            raise ValueError("Number of frame diffs does not match number of videos")
+        self.StartFrame = StartFrame
+        self.StopFrame = StopFrame
+        self.QueueSize = QueueSize
+        self.Frames = np.unique(np.asarray(Frames, dtype=np.int64)) if Frames is not None else None
+        self.UseIndex = UseIndex if UseIndex is not None else Frames is not None
+        self.CacheDir = CacheDir
+        self.MaxGrab = MaxGrab
+
+        self.Queues = []
+        self.Threads = []
+        self.StopEvent = threading.Event()
+        self.Errors = []
+
+    def GetTargetFrames(self):
+        """Frames (in synced frame numbers) to read"""
+        if self.Frames is not None:
+            Frames = self.Frames[self.Frames >= self.StartFrame]
+            if self.StopFrame is not None:
+                Frames = Frames[Frames < self.StopFrame]
+            return Frames.tolist()
+        if self.StopFrame is None:
+            return itertools.count(self.StartFrame)
+        return range(self.StartFrame, self.StopFrame)
+
+    def start(self):
+        """Start one decoding thread per camera"""
+        if len(self.Threads) > 0:
+            return
+        for CamIndex in range(len(self.VideoPaths)):
+            Queue = queue.Queue(maxsize=self.QueueSize)
+            Thread = threading.Thread(target=self.DecodeLoop, args=(CamIndex, Queue), daemon=True)
+            self.Queues.append(Queue)
+            self.Threads.append(Thread)
+            Thread.start()
+
+    def Put(self, Queue, Item):
+        """Put into bounded queue, give up if reader is closed"""
+        while not self.StopEvent.is_set():
+            try:
+                Queue.put(Item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def DecodeLoop(self, CamIndex, Queue):
+        """Decoding thread of one camera"""
+        video = None
+        try:
+            video = SeekableVideo(self.VideoPaths[CamIndex], self.CacheDir, self.UseIndex, self.MaxGrab)
+            for frame in self.GetTargetFrames():
+                if self.StopEvent.is_set():
+                    break
+                CamFrame = frame - self.FrameDiffs[CamIndex]
+                if CamFrame < 0:
+                    if not self.Put(Queue, (frame, None)):
+                        break
+                    continue
+
+                ret, img = video.read(CamFrame)
+                if not ret:
+                    break
+                if not self.Put(Queue, (frame, img)):
+                    break
+        except Exception as e:
+            self.Errors.append(e)
+        finally:
+            if video is not None:
+                video.release()
+            self.Put(Queue, EndOfVideo)
+
+    def __iter__(self):
+        self.start()
+        Ended = [False]*len(self.Queues)
+        while True:
+            Images = [None]*len(self.Queues)
+            frame = None
+            for CamIndex, Queue in enumerate(self.Queues):
+                if Ended[CamIndex]:
+                    continue
+                Item = Queue.get()
+                if Item is EndOfVideo:
+                    #camera past its end, gives None for the remaining frames
+                    Ended[CamIndex] = True
+                    continue
+                frame, Images[CamIndex] = Item
+            if len(self.Errors) > 0:
+                raise self.Errors[0]
+            if all(Ended):
+                return
+            yield frame, Images
+
+    def close(self):
+        """Stop decoding threads"""
+        self.StopEvent.set()
+        for Thread in self.Threads:
+            Thread.join()
+        self.Threads = []
+        self.Queues = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,87 @@
+""" Regression tests of the indexed annotation layout: every image rebuilds to the json record"""
+
+import os
+import json
+import numpy as np
+
+from POP3D_Reader import AnnotationIndex
+
+Info = {"Description": "test", "Keypoints": ["hd_beak", "bp_tail"], "TotalImages": 3}
+
+
+def Make3DAnnotations():
+    """Images with different numbers of cameras and birds, a bird missing in a view and not in BirdID"""
+    return [{"Image-ID": 0, "BirdID": ["452_0107"],
+             "Keypoint3D": {"452_0107": {"hd_beak": [1.5, 2.5, 3.5], "bp_tail": [4.0, 5.0, 6.0]}},
+             "CameraData": [{"CamName": "Cam%i"%c, "Path": "Train/Cam%i/Seq1-F3.jpg"%c,
+                             "BBox": {"452_0107": [1.0, 2.0, 30.0 + c, 40.0]},
+                             "Keypoint2D": {"452_0107": {"hd_beak": [10.25, 20.5 + c], "bp_tail": [11.0, 21.0]}}}
+                            for c in range(1, 5)]},
+            {"Image-ID": 1, "BirdID": ["452_0107", "A_B_C"],
+             "Keypoint3D": {"452_0107": {"hd_beak": [7.0, 8.0, 9.0]}, "A_B_C": {"bp_tail": [0.0, -1.0, 2.0]}},
+             "CameraData": [{"CamName": "Cam2", "Path": "Train/Cam2/Seq2-F9.jpg",
+                             "BBox": {"A_B_C": [5.0, 6.0, 7.0, 8.0]},
+                             "Keypoint2D": {"452_0107": {"hd_beak": [1.0, 2.0]}, "A_B_C": {}}},
+                            {"CamName": "Cam3", "Path": "Train/Cam3/Seq2-F9.jpg", "BBox": {}, "Keypoint2D": {}}]},
+            {"Image-ID": 2, "BirdID": [],
+             "Keypoint3D": {"Extra": {"hd_beak": [1.0, 1.0, 1.0]}},
+             "CameraData": [{"CamName": "Cam1", "Path": "Train/Cam1/Seq3-F1.jpg", "BBox": {}, "Keypoint2D": {}}]}]
+
+def Make2DAnnotations():
+    Annotations = []
+    for Annot in Make3DAnnotations():
+        for View in Annot["CameraData"]:
+            Annotations.append({"Image-ID": len(Annotations), "BirdID": Annot["BirdID"], "Path": View["Path"],
+                                "Keypoint3D": Annot["Keypoint3D"], "Keypoint2D": View["Keypoint2D"], "BBox": View["BBox"]})
+    return Annotations
+
+def WriteJSON(Path, Annotations):
+    with open(Path, "w") as f:
+        json.dump({"info": Info, "Annotations": Annotations}, f)
+
+def test_RoundTrip3D(tmp_path):
+    Path = str(tmp_path / "Train-3D.json")
+    Annotations = Make3DAnnotations()
+    WriteJSON(Path, Annotations)
+    Index = AnnotationIndex.AnnotationIndex(Path)
+    assert Index.Type == "3D" and Index.Info == Info and len(Index) == 3
+    assert [Index.GetNumCams(i) for i in range(3)] == [4, 2, 1]
+    assert Index.GetCamName(1, 1) == "Cam3"
+    for i, Annot in enumerate(Annotations):
+        assert Index.GetAnnotation(i) == Annot
+
+def test_RoundTrip2D(tmp_path):
+    Path = str(tmp_path / "Train-2D.json")
+    Annotations = Make2DAnnotations()
+    WriteJSON(Path, Annotations)
+    Index = AnnotationIndex.AnnotationIndex(Path)
+    assert Index.Type == "2D" and len(Index) == 7
+    for i, Annot in enumerate(Annotations):
+        assert Index.GetAnnotation(i) == Annot
+
+def test_ReopenAndRebuild(tmp_path, capsys):
+    Path = str(tmp_path / "Train-3D.json")
+    WriteJSON(Path, Make3DAnnotations())
+    AnnotationIndex.AnnotationIndex(Path)
+    assert os.path.isdir(Path + ".index")
+    capsys.readouterr()
+    Index = AnnotationIndex.AnnotationIndex(Path)
+    assert "Building" not in capsys.readouterr().out
+    assert isinstance(Index.Keypoint2D, np.memmap)
+    assert Index.GetAnnotation(1) == Make3DAnnotations()[1]
+
+    #changed json rebuilds the index
+    Annotations = Make3DAnnotations()[:2]
+    Stamp = os.stat(Path).st_mtime_ns
+    WriteJSON(Path, Annotations)
+    os.utime(Path, ns=(Stamp + 10**9, Stamp + 10**9))
+    Index = AnnotationIndex.AnnotationIndex(Path)
+    assert "Building" in capsys.readouterr().out
+    assert len(Index) == 2
+
+def test_IndexDir(tmp_path):
+    Path = str(tmp_path / "Train-3D.json")
+    WriteJSON(Path, Make3DAnnotations())
+    Index = AnnotationIndex.AnnotationIndex(Path, IndexDir=str(tmp_path / "Index"))
+    assert not os.path.exists(Path + ".index")
+    assert Index.GetAnnotation(0) == Make3DAnnotations()[0]
@@ -0,0 +1,71 @@
+""" Regression tests of JSON Lines annotation shards: write, resume after interruption, read back as one json"""
+
+import os
+import json
+
+from POP3D_Reader import AnnotationShards, AnnotationIndex
+
+Info = {"Description": "test"}
+
+
+def MakeRecords(Seq, Num):
+    return [{"Image-ID": i, "BirdID": ["Bird%i"%Seq], "Keypoint3D": {"Bird%i"%Seq: {"hd_beak": [float(i), 1.0, 2.0]}},
+             "Path": "Train/Seq%i-F%i.jpg"%(Seq, i), "Keypoint2D": {}, "BBox": {}} for i in range(Num)]
+
+def WriteShard(Manifest, Seq, Records):
+    Writer = AnnotationShards.ShardWriter(Manifest.GetShardPath(Seq))
+    for Record in Records:
+        Writer.append(Record)
+    Manifest.AddShard(Seq, Writer.close())
+
+def test_WriteRead(tmp_path):
+    ShardDir = AnnotationShards.GetShardDir(str(tmp_path), "Train", "2D")
+    Manifest = AnnotationShards.ShardManifest(ShardDir, Info, Order=[1, 2])
+    WriteShard(Manifest, 2, MakeRecords(2, 2)) #finished out of order, read in manifest order
+    WriteShard(Manifest, 1, MakeRecords(1, 3))
+    assert Manifest.Manifest["Complete"]
+
+    ManifestPath = os.path.join(ShardDir, AnnotationShards.ManifestName)
+    Data = AnnotationShards.LoadData(ManifestPath)
+    Expected = MakeRecords(1, 3) + MakeRecords(2, 2)
+    for i, Record in enumerate(Expected):
+        Record["Image-ID"] = i
+    assert Data == {"info": Info, "Annotations": Expected}
+
+    #readers of the json files accept the manifest
+    assert AnnotationIndex.LoadData(ManifestPath) == Data
+    Index = AnnotationIndex.AnnotationIndex(ManifestPath)
+    assert [Index.GetAnnotation(i) for i in range(len(Index))] == Expected
+
+def test_Resume(tmp_path, capsys):
+    ShardDir = str(tmp_path / "Train-2D")
+    Manifest = AnnotationShards.ShardManifest(ShardDir, Info, Order=[1, 2, 3])
+    WriteShard(Manifest, 1, MakeRecords(1, 3))
+
+    #interrupted shard is never visible
+    Writer = AnnotationShards.ShardWriter(Manifest.GetShardPath(2))
+    Writer.append(MakeRecords(2, 1)[0])
+    Writer.abort()
+    assert not any(".tmp" in Name for Name in os.listdir(ShardDir))
+
+    ManifestPath = os.path.join(ShardDir, AnnotationShards.ManifestName)
+    assert len(AnnotationShards.LoadData(ManifestPath)["Annotations"]) == 3
+    assert "not complete" in capsys.readouterr().out
+
+    #new run only writes missing shards
+    Manifest = AnnotationShards.ShardManifest(ShardDir, Info, Order=[1, 2, 3])
+    assert [Manifest.HasShard(Seq) for Seq in [1, 2, 3]] == [True, False, False]
+    for Seq in [2, 3]:
+        WriteShard(Manifest, Seq, MakeRecords(Seq, 2))
+    with open(ManifestPath) as f:
+        assert json.load(f)["Complete"]
+    Annotations = AnnotationShards.LoadData(ManifestPath)["Annotations"]
+    assert [Annot["Image-ID"] for Annot in Annotations] == list(range(7))
+    assert [Annot["BirdID"] for Annot in Annotations] == [["Bird1"]]*3 + [["Bird2"]]*2 + [["Bird3"]]*2
+
+def test_DeletedShardIsRewritten(tmp_path):
+    ShardDir = str(tmp_path / "Train-2D")
+    Manifest = AnnotationShards.ShardManifest(ShardDir, Info, Order=[1])
+    WriteShard(Manifest, 1, MakeRecords(1, 1))
+    os.remove(Manifest.GetShardPath(1))
+    assert not AnnotationShards.ShardManifest(ShardDir).HasShard(1)
@@ -0,0 +1,66 @@
+""" Regression tests of the binary csv cache: same values as pd.read_csv, rebuilt when the csv changes"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from POP3D_Reader import CSVCache
+
+
+def WriteCSV(Path, Offset=0.0):
+    df = pd.DataFrame({"frame": np.arange(5), "Bird1_hd_beak_x": np.linspace(0.1, 0.9, 5) + Offset,
+                       "Bird1_hd_beak_y": [1.123456789012345, np.nan, 3.0, 4.0, 5.0]})
+    df.to_csv(Path, index=False)
+
+def test_CacheMatchesCSV(tmp_path):
+    Path = str(tmp_path / "Seq-Keypoint2D.csv")
+    WriteCSV(Path)
+    First = CSVCache.ReadCSV(Path)
+    assert os.path.exists(Path + ".npz")
+    Second = CSVCache.ReadCSV(Path)
+    pd.testing.assert_frame_equal(First, pd.read_csv(Path))
+    pd.testing.assert_frame_equal(Second, pd.read_csv(Path))
+    assert Second["Bird1_hd_beak_y"].dtype == np.float64
+    assert Second["frame"].dtype == np.int64
+
+def test_CacheInvalidatedOnChange(tmp_path):
+    Path = str(tmp_path / "Seq-Keypoint2D.csv")
+    WriteCSV(Path)
+    CSVCache.ReadCSV(Path)
+    Stamp = os.stat(Path).st_mtime_ns
+    WriteCSV(Path, Offset=100.0)
+    os.utime(Path, ns=(Stamp + 10**9, Stamp + 10**9)) #make sure mtime changes on coarse file systems
+    assert CSVCache.LoadCSVCache(Path + ".npz", Path) is None
+    pd.testing.assert_frame_equal(CSVCache.ReadCSV(Path), pd.read_csv(Path))
+    assert CSVCache.LoadCSVCache(Path + ".npz", Path) is not None
+
+def test_Float32Option(tmp_path):
+    Path = str(tmp_path / "Seq-Keypoint2D.csv")
+    WriteCSV(Path)
+    for _ in range(2): #from csv, then from cache
+        df = CSVCache.ReadCSV(Path, dtype=np.float32)
+        assert df["Bird1_hd_beak_x"].dtype == np.float32
+        assert df["frame"].dtype == np.int64
+    #cache itself keeps float64
+    assert CSVCache.ReadCSV(Path)["Bird1_hd_beak_x"].dtype == np.float64
+
+def test_CacheDir(tmp_path):
+    for Folder in ["Annotation", "TrainingSplit"]:
+        os.makedirs(str(tmp_path / Folder))
+        WriteCSV(str(tmp_path / Folder / "Seq-Keypoint2D.csv"), Offset=len(Folder))
+    CacheDir = str(tmp_path / "Cache")
+    for Folder in ["Annotation", "TrainingSplit"]:
+        Path = str(tmp_path / Folder / "Seq-Keypoint2D.csv")
+        CSVCache.ReadCSV(Path, CacheDir=CacheDir)
+        assert not os.path.exists(Path + ".npz")
+    #same file names in different folders do not clash
+    assert len(os.listdir(CacheDir)) == 2
+    for Folder in ["Annotation", "TrainingSplit"]:
+        Path = str(tmp_path / Folder / "Seq-Keypoint2D.csv")
+        pd.testing.assert_frame_equal(CSVCache.ReadCSV(Path, CacheDir=CacheDir), pd.read_csv(Path))
+
+def test_NoCache(tmp_path):
+    Path = str(tmp_path / "Seq-Keypoint2D.csv")
+    WriteCSV(Path)
+    CSVCache.ReadCSV(Path, Cache=False)
+    assert not os.path.exists(Path + ".npz")
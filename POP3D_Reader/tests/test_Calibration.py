@@ -0,0 +1,77 @@
+""" Regression tests of the calibration registry, quaternion conversion and cached undistort maps"""
+
+import os
+import pickle
+import numpy as np
+import cv2
+import pytest
+
+from POP3D_Reader import Calibration
+
+
+def WriteCalibration(tmp_path, CamName, rvec=(0.1, -0.2, 0.3), tvec=(10.0, 20.0, 3000.0)):
+    ExtPath = str(tmp_path / ("Seq-%s-Extrinsics.p"%CamName))
+    IntPath = str(tmp_path / ("Seq-%s-Intrinsics.p"%CamName))
+    with open(ExtPath, "wb") as f:
+        pickle.dump((np.array(rvec), np.array(tvec)), f)
+    camMat = np.array([[800.0, 0, 64], [0, 800.0, 48], [0, 0, 1]])
+    with open(IntPath, "wb") as f:
+        pickle.dump((camMat, np.array([-0.3, 0.1, 0.001, -0.002, 0.0])), f)
+    return ExtPath, IntPath
+
+def test_QuaternionMatchesPyquaternion():
+    pq = pytest.importorskip("pyquaternion")
+    rng = np.random.default_rng(0)
+    Rotations = [cv2.Rodrigues(rng.normal(0, 2, 3))[0] for _ in range(200)]
+    #half turns around each axis, every branch of the conversion
+    Rotations += [np.diag([1.0, -1.0, -1.0]), np.diag([-1.0, 1.0, -1.0]), np.diag([-1.0, -1.0, 1.0]), np.identity(3)]
+    for R in Rotations:
+        np.testing.assert_allclose(Calibration.RotMatrixToQuat(R), pq.Quaternion(matrix=R).elements, atol=1e-12)
+
+def test_LazyCachedValues(tmp_path):
+    ExtPath, IntPath = WriteCalibration(tmp_path, "Cam1")
+    Calib = Calibration.CameraCalibration("Seq", "Cam1", ExtPath, IntPath)
+    assert Calib.Cache == {}
+    R = Calib.R
+    np.testing.assert_allclose(R, cv2.Rodrigues(np.array([0.1, -0.2, 0.3]))[0])
+    np.testing.assert_allclose(Calib.P, Calib.camMat @ np.hstack([R, Calib.tvec.reshape(3, 1)]))
+    #pickles are only read once
+    os.remove(ExtPath)
+    os.remove(IntPath)
+    assert Calib.R is R
+    np.testing.assert_allclose(Calib.Quat, Calibration.RotMatrixToQuat(R))
+
+def test_UndistortMaps(tmp_path):
+    Calib = Calibration.CameraCalibration("Seq", "Cam1", *WriteCalibration(tmp_path, "Cam1"))
+    rng = np.random.default_rng(1)
+    img = cv2.GaussianBlur(rng.integers(0, 255, (96, 128, 3), dtype=np.uint8), (9, 9), 3)
+    Expected = cv2.undistort(img, Calib.camMat, Calib.distCoef)
+    Out = Calib.Undistort(img)
+    assert Out.shape == img.shape
+    #remap tables are fixed point, so allow small interpolation differences
+    assert np.abs(Out.astype(int) - Expected.astype(int)).mean() < 1.0
+    assert Calib.GetUndistortMaps((128, 96)) is Calib.GetUndistortMaps([128, 96])
+    assert len(Calib.UndistortMaps) == 1
+
+def test_Registry(tmp_path):
+    Registry = Calibration.CalibrationRegistry()
+    Paths1 = WriteCalibration(tmp_path, "Cam1")
+    Paths2 = WriteCalibration(tmp_path, "Cam2")
+    Calib = Registry.Get("Seq1", "Cam1", *Paths1)
+    assert Registry.Get("Seq1", "Cam1", *Paths1) is Calib
+    assert Registry.Get("Seq2", "Cam1", *Paths1) is not Calib
+    assert Registry.Get("Seq1", "Cam2", *Paths2) is not Calib
+    assert len(Registry) == 3
+    #same camera with other pickles replaces the entry
+    Replaced = Registry.Get("Seq1", "Cam1", *Paths2)
+    assert Replaced is not Calib and Registry.Get("Seq1", "Cam1", *Paths2) is Replaced
+    assert len(Registry) == 3
+    Registry.clear()
+    assert len(Registry) == 0
+
+def test_GetCalibration(tmp_path):
+    Paths = WriteCalibration(tmp_path, "Cam1")
+    try:
+        assert Calibration.GetCalibration("Seq1", "Cam1", *Paths) is Calibration.GetCalibration("Seq1", "Cam1", *Paths)
+    finally:
+        Calibration.Registry.clear()
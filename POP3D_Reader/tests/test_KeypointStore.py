@@ -0,0 +1,59 @@
+""" Regression tests of the frame indexed keypoint store and the CameraObject readers on top of it"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from POP3D_Reader import KeypointStore, CameraObject
+
+
+def MakeKeypointDF():
+    """2 birds with 3DPOP style IDs, frames out of order, bird 452_0107 misses a point in frame 3"""
+    return pd.DataFrame({"frame": [3, 1, 2],
+                         "452_0107_hd_beak_x": [np.nan, 1.0, 2.0], "452_0107_hd_beak_y": [np.nan, 1.5, 2.5],
+                         "452_0107_bp_tail_x": [30.0, 10.0, 20.0], "452_0107_bp_tail_y": [31.0, 11.0, 21.0],
+                         "100_1234_hd_beak_x": [7.0, 5.0, 6.0], "100_1234_hd_beak_y": [7.5, 5.5, 6.5]})
+
+def test_FrameLookup():
+    Store = KeypointStore.KeypointStore(MakeKeypointDF(), 2)
+    assert Store.Subjects == ["452_0107", "100_1234"]
+    assert Store.Keypoints["452_0107"] == ["hd_beak", "bp_tail"]
+    assert Store.GetBirdFrame(1, "452_0107").tolist() == [[1.0, 1.5], [10.0, 11.0]]
+    assert Store.GetBirdFrame(2, "100_1234").tolist() == [[6.0, 6.5]]
+    assert np.isnan(Store.GetBirdFrame(3, "452_0107")[0]).all()
+    assert Store.GetRows([2, 5, 3]).tolist() == [2, -1, 0]
+    with pytest.raises(KeyError):
+        Store.GetFrame(5)
+
+def test_Gather():
+    Store = KeypointStore.KeypointStore(MakeKeypointDF(), 2)
+    Out, Keypoints = Store.Gather([1, 4], birds=["100_1234", "452_0107"], Keypoints=["bp_tail", "hd_beak"])
+    assert Keypoints == ["bp_tail", "hd_beak"]
+    assert Out.shape == (2, 2, 2, 2)
+    assert np.isnan(Out[0, 0, 0]).all() #100_1234 has no bp_tail
+    assert Out[0, 0, 1].tolist() == [5.0, 5.5]
+    assert Out[0, 1].tolist() == [[10.0, 11.0], [1.0, 1.5]]
+    assert np.isnan(Out[1]).all() #frame 4 does not exist
+
+def test_SubjectsMatchedByPrefix():
+    """IDs that are not 2 tokens, and IDs that are prefixes of other IDs"""
+    df = pd.DataFrame({"frame": [0], "Bird1_hd_beak_x": [1.0], "Bird1_hd_beak_y": [2.0],
+                       "Bird10_hd_beak_x": [3.0], "Bird10_hd_beak_y": [4.0],
+                       "A_B_C_bp_tail_x": [5.0], "A_B_C_bp_tail_y": [6.0]})
+    Store = KeypointStore.KeypointStore(df, 2, Subjects=["Bird1", "Bird10", "A_B_C"])
+    assert Store.Keypoints == {"Bird1": ["hd_beak"], "Bird10": ["hd_beak"], "A_B_C": ["bp_tail"]}
+    assert Store.GetBirdFrame(0, "Bird10").tolist() == [[3.0, 4.0]]
+    assert Store.GetBirdFrame(0, "A_B_C").tolist() == [[5.0, 6.0]]
+
+def test_CameraObjectReaders():
+    """Dictionary readers of CameraObject, with subjects of the trial"""
+    Cam = CameraObject.CameraObject("Cam1", "Cam1.mp4", "Seq-Cam1-Extrinsics.p", "Seq-Cam1-Intrinsics.p", (100, 100),
+                                    Cache=False, Subjects=["452_0107", "100_1234", "A_B_C"])
+    Cam.Keypoint2D = MakeKeypointDF()
+    assert Cam.Read2DKeypointData(Cam.Keypoint2D, 2, "452_0107") == {"452_0107_hd_beak": [2.0, 2.5],
+                                                                      "452_0107_bp_tail": [20.0, 21.0]}
+    assert Cam.Read2DKeypointData(Cam.Keypoint2D, 2, "452_0107", ["bp_tail"], StripName=True) == {"bp_tail": [20.0, 21.0]}
+    assert Cam.Read2DKeypointData(Cam.Keypoint2D, 2, "A_B_C") == (None, None)
+
+    Cam.BBox = pd.DataFrame({"frame": [0], "A_B_C_x": [1.0], "A_B_C_y": [2.0], "A_B_C_w": [10.0], "A_B_C_h": [20.0]})
+    assert Cam.GetBBoxData(Cam.BBox, 0, "A_B_C") == ((1.0, 2.0), (11.0, 22.0))
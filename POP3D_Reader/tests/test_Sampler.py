@@ -0,0 +1,62 @@
+""" Regression tests of the stratified sampler quotas, on a small fake catalog"""
+
+import numpy as np
+
+from POP3D_Reader import Sampler
+
+
+class FakeIndex:
+    def __init__(self, Frames):
+        self.Frames = Frames
+
+    def frames_where(self, all_cams=True, birds="all", keypoints=None, cams=None):
+        return self.Frames
+
+class FakeCatalog:
+    """Catalog with the 3 methods the sampler uses, valid frames given per (sequence, type)"""
+    def __init__(self, Strata, ValidFrames):
+        self.Sequences = sorted(Strata)
+        self.Strata = Strata
+        self.ValidFrames = ValidFrames
+
+    def GetRow(self, Seq):
+        return {"IndividualNum": self.Strata[Seq]}
+
+    def GetValidityIndex(self, Seq, Type, Filter):
+        return FakeIndex(self.ValidFrames[(Seq, Type)])
+
+
+def MakeCatalog(Counts, Strata=None):
+    Strata = Strata or {Seq: "1" for Seq in range(len(Counts))}
+    ValidFrames = {(Seq, "Train"): np.arange(100, 100 + Count * 2, 2) for Seq, Count in enumerate(Counts)}
+    return FakeCatalog(Strata, ValidFrames)
+
+def test_ShortfallTakenFromOtherSequences(capsys):
+    Sample = Sampler.StratifiedSampler(MakeCatalog([5, 100, 3, 100]), Types=("Train",))
+    Quotas = Sample.AllocateQuotas(100, {"Train": 1.0})
+    assert Quotas[:, 0].tolist() == [5, 67, 3, 25]
+    assert "Not enough" not in capsys.readouterr().out
+
+def test_NotEnoughFrames(capsys):
+    Sample = Sampler.StratifiedSampler(MakeCatalog([5, 10]), Types=("Train",))
+    assert Sample.AllocateQuotas(100, {"Train": 1.0})[:, 0].tolist() == [5, 10]
+    assert "Not enough" in capsys.readouterr().out
+
+def test_EqualSplitOverStrata():
+    Strata = {0: "1", 1: "1", 2: "2", 3: "10"}
+    Sample = Sampler.StratifiedSampler(MakeCatalog([50, 50, 100, 100], Strata), Types=("Train",))
+    assert Sample.StrataNames == ["1", "2", "10"]
+    assert Sample.AllocateQuotas(60, {"Train": 1.0})[:, 0].tolist() == [10, 10, 20, 20]
+
+def test_SampleDeterministic():
+    Catalog = MakeCatalog([50, 80, 30])
+    FrameDicts = Sampler.StratifiedSampler(Catalog, Types=("Train",), Seed=3).Sample(30)
+    assert sum(len(Frames) for Frames in FrameDicts["Train"].values()) == 30
+    for Seq, Frames in FrameDicts["Train"].items():
+        assert Frames == sorted(set(Frames))
+        assert set(Frames) <= set(Catalog.ValidFrames[(Seq, "Train")].tolist())
+    assert Sampler.StratifiedSampler(Catalog, Types=("Train",), Seed=3).Sample(30) == FrameDicts
+
+    #frames of a sequence do not depend on the other sequences in the catalog
+    Catalog.Sequences = [1]
+    assert Sampler.StratifiedSampler(Catalog, Types=("Train",), Seed=3).Sample(10)["Train"][1] == FrameDicts["Train"][1]
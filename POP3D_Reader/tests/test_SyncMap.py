@@ -0,0 +1,78 @@
+""" Regression tests of SyncMap against the FindClosestFrame it replaced"""
+
+import os
+import pickle
+import numpy as np
+import pytest
+
+from POP3D_Reader import SyncMap
+
+
+def FindClosestFrame(SyncArray, Frame):
+    """Copy of the per frame function that was used in the examples before SyncMap"""
+    index = np.where((SyncArray[0]-Frame) <1)[0].argmax()
+    Prop = (Frame - SyncArray[0][index])/(SyncArray[0][index+1]- SyncArray[0][index])
+    ViconFrame = SyncArray[1][index]+(Prop*(SyncArray[1][index+1] - SyncArray[1][index]))
+    return ViconFrame
+
+SyncArray = [np.array([12, 130, 255, 397, 521]), np.array([40, 276, 527, 811, 1059])]
+
+def test_MatchesFindClosestFrame():
+    Map = SyncMap.SyncMap(SyncArray)
+    Frames = Map.CamFrameRange()
+    assert Frames[0] == 12 and Frames[-1] == 520
+    Expected = np.array([round(FindClosestFrame(SyncArray, i)) for i in Frames])
+    assert np.array_equal(Map.ToVicon(Frames), Expected)
+    Expected = np.array([FindClosestFrame(SyncArray, i) for i in Frames])
+    np.testing.assert_allclose(Map.ToVicon(Frames, interpolate=True), Expected, rtol=0, atol=1e-9)
+
+def test_ScalarAndInverse():
+    Map = SyncMap.SyncMap(SyncArray)
+    assert Map.ToVicon(130) == 276 and isinstance(Map.ToVicon(130), int)
+    assert isinstance(Map.ToVicon(131, interpolate=True), float)
+    assert Map.ToVicon(521) == 1059 #last flash is included
+    Frames = Map.CamFrameRange()
+    assert np.array_equal(Map.ToCam(Map.ToVicon(Frames, interpolate=True)), Frames)
+
+def test_Boundaries():
+    """First and last flash are mapped, one frame outside raises, like FindClosestFrame before the first flash"""
+    Map = SyncMap.SyncMap(SyncArray)
+    assert Map.ToVicon(12) == 40 and Map.ToVicon(521) == 1059
+    assert Map.ToCam(40) == 12 and Map.ToCam(1059) == 521
+    for Frames in [11, [11, 12], 522, [520, 522]]:
+        with pytest.raises(ValueError):
+            Map.ToVicon(Frames)
+    with pytest.raises(ValueError):
+        Map.ToCam(1060)
+    with pytest.raises(ValueError):
+        FindClosestFrame(SyncArray, 11)
+    assert Map.InRange([11, 12, 521, 522]).tolist() == [False, True, True, False]
+    with pytest.raises(ValueError):
+        SyncMap.SyncMap([np.array([5, 3]), np.array([1, 2])])
+
+def test_Mask():
+    """With mask, frames outside the range do not fail the whole array"""
+    Map = SyncMap.SyncMap(SyncArray)
+    Frames = np.array([11, 12, 130, 521, 522])
+    ViconFrames, Valid = Map.ToVicon(Frames, mask=True)
+    assert Valid.tolist() == [False, True, True, True, False]
+    assert ViconFrames.tolist() == [-1, 40, 276, 1059, -1]
+    ViconFrames, Valid = Map.ToVicon(Frames, interpolate=True, mask=True)
+    assert np.isnan(ViconFrames[[0, 4]]).all() and ViconFrames[1:4].tolist() == [40.0, 276.0, 1059.0]
+    assert Map.ToVicon(11, mask=True) == (-1, False)
+    assert Map.ToCam(276, mask=True) == (130, True)
+
+def test_Registry(tmp_path):
+    Path = str(tmp_path / "Seq-Cam1-SyncArray.p")
+    with open(Path, "wb") as f:
+        pickle.dump(SyncArray, f)
+    Map = SyncMap.GetSyncMap(Path)
+    assert SyncMap.GetSyncMap(Path) is Map
+
+    Stamp = tmp_path.joinpath("Seq-Cam1-SyncArray.p").stat().st_mtime_ns
+    with open(Path, "wb") as f:
+        pickle.dump([SyncArray[0], SyncArray[1] + 1], f)
+    os.utime(Path, ns=(Stamp + 10**9, Stamp + 10**9))
+    Reloaded = SyncMap.GetSyncMap(Path)
+    assert Reloaded is not Map and Reloaded.ToVicon(130) == 277
+    SyncMap.Registry.clear()
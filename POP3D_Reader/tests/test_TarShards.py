@@ -0,0 +1,80 @@
+""" Regression tests of tar shard export and the streaming shard reader"""
+
+import os
+import json
+import numpy as np
+import cv2
+
+from POP3D_Reader import TarShards
+
+NumImages = 12
+
+
+def MakeDataset(tmp_path):
+    """3D annotation json with 2 camera views per image, each view a small jpg"""
+    Annotations = []
+    for i in range(NumImages):
+        CameraData = []
+        for Cam in ["Cam1", "Cam2"]:
+            Path = "Train/%s/Seq1-F%i.jpg"%(Cam, i)
+            os.makedirs(str(tmp_path / "Train" / Cam), exist_ok=True)
+            Image = np.full((16, 24, 3), 10 * i, dtype=np.uint8)
+            cv2.imwrite(str(tmp_path / Path), Image)
+            CameraData.append({"CamName": Cam, "Path": Path, "BBox": {"Bird1": [1.0, 2.0, 3.0, 4.0]},
+                               "Keypoint2D": {"Bird1": {"hd_beak": [float(i), 1.0]}}})
+        Annotations.append({"Image-ID": i, "BirdID": ["Bird1"], "Keypoint3D": {"Bird1": {"hd_beak": [float(i), 0.0, 1.0]}},
+                            "CameraData": CameraData})
+    JSONPath = str(tmp_path / "Train-3D.json")
+    with open(JSONPath, "w") as f:
+        json.dump({"info": {"Description": "test"}, "Annotations": Annotations}, f)
+    return JSONPath, Annotations
+
+def ReadBytes(tmp_path, Annotation):
+    Out = []
+    for View in Annotation["CameraData"]:
+        with open(str(tmp_path / View["Path"]), "rb") as f:
+            Out.append(f.read())
+    return Out
+
+def test_ExportAndStream(tmp_path):
+    JSONPath, Annotations = MakeDataset(tmp_path)
+    IndexPath = TarShards.ExportTarShards(JSONPath, str(tmp_path), str(tmp_path / "Shards"), SamplesPerShard=5)
+    assert os.path.basename(IndexPath) == "Train-3D-index.json"
+    assert sorted(os.listdir(str(tmp_path / "Shards"))) == ["Train-3D-00000.tar", "Train-3D-00001.tar",
+                                                         "Train-3D-00002.tar", "Train-3D-index.json"]
+
+    Reader = TarShards.TarShardReader(IndexPath, decode=False)
+    assert len(Reader) == NumImages and Reader.Type == "3D"
+    Samples = list(Reader)
+    assert [Sample["Annotation"] for Sample in Samples] == Annotations
+    for Sample, Annotation in zip(Samples, Annotations):
+        assert Sample["CamNames"] == ["Cam1", "Cam2"]
+        assert Sample["Images"] == ReadBytes(tmp_path, Annotation)
+
+    #random access reads the same bytes as streaming
+    for i in [0, 4, 5, 11]:
+        Sample = Reader.GetSample(i)
+        assert Sample["Annotation"] == Annotations[i] and Sample["Images"] == Samples[i]["Images"]
+
+    Decoded = TarShards.TarShardReader(IndexPath).GetSample(3)["Images"][0]
+    assert Decoded.shape == (16, 24, 3)
+    assert np.abs(Decoded.astype(int) - 30).max() <= 2 #jpg
+
+def test_ShuffleAndRanks(tmp_path):
+    JSONPath, Annotations = MakeDataset(tmp_path)
+    IndexPath = TarShards.ExportTarShards(JSONPath, str(tmp_path), str(tmp_path / "Shards"), SamplesPerShard=3)
+
+    def Keys(Reader):
+        return [Sample["Key"] for Sample in Reader]
+
+    Reader = TarShards.TarShardReader(IndexPath, shuffle=True, seed=1, ShuffleBuffer=4, decode=False)
+    Epoch0 = Keys(Reader)
+    assert sorted(Epoch0) == ["%08d"%i for i in range(NumImages)]
+    assert Keys(Reader) == Epoch0
+    Reader.set_epoch(1)
+    assert sorted(Keys(Reader)) == sorted(Epoch0) and Keys(Reader) != Epoch0
+
+    #ranks read disjoint shards that cover the dataset
+    RankKeys = [Keys(TarShards.TarShardReader(IndexPath, decode=False, Rank=r, WorldSize=3)) for r in range(3)]
+    assert sorted(sum(RankKeys, [])) == sorted(Epoch0)
+    assert [len(Key) for Key in RankKeys] == [6, 3, 3]
@@ -0,0 +1,39 @@
+""" Regression tests of Trial visualization cleanup"""
+
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+
+from POP3D_Reader import Trial, CameraObject
+from Util import OverlayRenderer
+from POP3D_Reader.tests.test_VideoReader import WriteVideo
+
+
+class FakeTrial:
+    """Only what VisualizeTrainingData reads"""
+    def __init__(self, camObj):
+        self.camObjects = [camObj]
+        self.Subjects = ["Bird1"]
+
+def MakeCamera(tmp_path):
+    Path = WriteVideo(str(tmp_path / "Cam1.mp4"))
+    Cam = CameraObject.CameraObject("Cam1", Path, "Seq-Cam1-Extrinsics.p", "Seq-Cam1-Intrinsics.p", (64, 48), Cache=False)
+    Cam.Keypoint2D = pd.DataFrame({"frame": np.arange(40), "Bird1_hd_beak_x": 10.0, "Bird1_hd_beak_y": 20.0})
+    return Cam
+
+def test_VisualizeClosesReaderOnError(tmp_path, monkeypatch):
+    """Decode threads are stopped when drawing raises"""
+    def Fail(self, frame, counter):
+        raise RuntimeError("draw failed")
+    monkeypatch.setattr(OverlayRenderer.OverlayRenderer, "Draw", Fail)
+
+    Before = threading.active_count()
+    with pytest.raises(RuntimeError):
+        Trial.Trial.VisualizeTrainingData(FakeTrial(MakeCamera(tmp_path)), show=False,
+                                          save=str(tmp_path / "QA.mp4"))
+    assert threading.active_count() == Before
+
+def test_VisualizeHeadless(tmp_path):
+    Trial.Trial.VisualizeTrainingData(FakeTrial(MakeCamera(tmp_path)), show=False, save=str(tmp_path / "QA.mp4"))
+    assert (tmp_path / "QA.mp4").stat().st_size > 0
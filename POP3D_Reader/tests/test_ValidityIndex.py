@@ -0,0 +1,77 @@
+""" Regression tests of the packed bit validity index against dropna on the csvs"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from POP3D_Reader import ValidityIndex
+
+Subjects = ["Bird1", "Bird10"]
+Keypoints = ["kp%i"%i for i in range(10)] #more than 8, so bits span 2 bytes
+
+
+def WriteCSVs(tmp_path, Seed=0):
+    """2 cameras with random nans, camera 2 misses frame 0 and has no kp9 for Bird10"""
+    rng = np.random.default_rng(Seed)
+    Paths = []
+    for c, Frames in enumerate([np.arange(0, 20), np.arange(1, 22)]):
+        Data = {"frame": Frames}
+        for bird in Subjects:
+            for kp in Keypoints:
+                if c == 1 and bird == "Bird10" and kp == "kp9":
+                    continue
+                Values = rng.integers(0, 100, len(Frames)).astype(float)
+                Values[rng.random(len(Frames)) < 0.03] = np.nan
+                Data["%s_%s_x"%(bird, kp)] = Values
+                Data["%s_%s_y"%(bird, kp)] = Values + 0.5
+        Path = str(tmp_path / ("Seq-Cam%i-Keypoint2D.csv"%(c+1)))
+        pd.DataFrame(Data).to_csv(Path, index=False)
+        Paths.append(Path)
+    return Paths
+
+def DropnaFrames(Paths, Columns=None):
+    """Frames valid in all cameras, the slow way"""
+    Frames = None
+    for Path in Paths:
+        df = pd.read_csv(Path)
+        df = df.dropna(subset=Columns) if Columns is not None else df.dropna()
+        Frames = set(df["frame"]) if Frames is None else Frames & set(df["frame"])
+    return np.array(sorted(Frames))
+
+def test_MatchesDropna(tmp_path):
+    Paths = WriteCSVs(tmp_path)
+    Index = ValidityIndex.ValidityIndex(Paths, Subjects=Subjects)
+    assert Index.Keypoints == Keypoints
+    assert Index.Bits.shape == (22, 2, 2, 2)
+    assert np.array_equal(Index.frames_where(), DropnaFrames(Paths))
+
+    Columns = ["Bird10_kp8_x", "Bird10_kp8_y", "Bird1_kp8_x", "Bird1_kp8_y"]
+    assert np.array_equal(Index.frames_where(keypoints=["kp8"]), DropnaFrames(Paths, Columns))
+    assert np.array_equal(Index.frames_where(birds=["Bird10"], keypoints=["kp8"], cams=[0]),
+                          DropnaFrames(Paths[:1], Columns[:2]))
+    AnyFrames = set()
+    for Path in Paths:
+        for bird in Subjects:
+            AnyFrames |= set(DropnaFrames([Path], ["%s_kp0_x"%bird]))
+    assert Index.count_where(all_cams=False, birds="any", keypoints=["kp0"]) == len(AnyFrames)
+    with pytest.raises(ValueError):
+        Index.frames_where(keypoints=["beak"])
+
+def test_SidecarReload(tmp_path, capsys):
+    Paths = WriteCSVs(tmp_path)
+    Index = ValidityIndex.ValidityIndex(Paths, Subjects=Subjects)
+    assert os.path.exists(Paths[0] + ".valid.npz")
+    capsys.readouterr()
+    Loaded = ValidityIndex.ValidityIndex(Paths, Subjects=Subjects)
+    assert "Building" not in capsys.readouterr().out
+    assert np.array_equal(Loaded.Bits, Index.Bits) and np.array_equal(Loaded.Frames, Index.Frames)
+
+    #changed csv rebuilds the index
+    Stamp = os.stat(Paths[1]).st_mtime_ns
+    WriteCSVs(tmp_path, Seed=1)
+    for Path in Paths:
+        os.utime(Path, ns=(Stamp + 10**9, Stamp + 10**9))
+    Rebuilt = ValidityIndex.ValidityIndex(Paths, Subjects=Subjects)
+    assert "Building" in capsys.readouterr().out
+    assert np.array_equal(Rebuilt.frames_where(), DropnaFrames(Paths))
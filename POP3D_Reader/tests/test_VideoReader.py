@@ -0,0 +1,94 @@
+""" Regression tests of random frame access and the multi camera reader against plain sequential decoding"""
+
+import numpy as np
+import cv2
+import pytest
+
+from POP3D_Reader import VideoReader
+
+NumFrames = 60
+
+
+def WriteVideo(Path, NumFrames=NumFrames):
+    """Small video where every frame looks different, so a wrong frame is always noticed"""
+    writer = cv2.VideoWriter(Path, cv2.VideoWriter_fourcc(*"mp4v"), 30, (64, 48))
+    if not writer.isOpened():
+        pytest.skip("OpenCV can not write mp4v videos")
+    for i in range(NumFrames):
+        img = np.zeros((48, 64, 3), dtype=np.uint8)
+        cv2.rectangle(img, (i, 0), (i + 4, 47), (255, 255, 255), -1)
+        cv2.putText(img, str(i), (2, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 4*i), 2)
+        writer.write(img)
+    writer.release()
+    return Path
+
+def ReadSequential(Path):
+    capture = cv2.VideoCapture(Path)
+    Frames = []
+    while True:
+        ret, img = capture.read()
+        if not ret:
+            break
+        Frames.append(img)
+    capture.release()
+    return Frames
+
+@pytest.mark.parametrize("UseIndex", [True, False])
+def test_RandomAccess(tmp_path, UseIndex):
+    Path = WriteVideo(str(tmp_path / "Cam1.mp4"))
+    Expected = ReadSequential(Path)
+    assert len(Expected) == NumFrames
+
+    video = VideoReader.SeekableVideo(Path, UseIndex=UseIndex, MaxGrab=4)
+    assert video.FrameCount == NumFrames
+    #backwards, small gaps, large gaps, repeated frames
+    for frame in [37, 3, 4, 9, 55, 12, 12, 0, 59, 20, 21, 35]:
+        ret, img = video.read(frame)
+        assert ret and np.array_equal(img, Expected[frame]), frame
+    ret, img = video.read()
+    assert ret and np.array_equal(img, Expected[36])
+    assert not video.read(NumFrames)[0]
+    video.release()
+
+def test_KeyframeIndexSidecar(tmp_path):
+    Path = WriteVideo(str(tmp_path / "Cam1.mp4"))
+    Keyframes = VideoReader.LoadKeyframeIndex(Path, CacheDir=str(tmp_path / "Cache"))
+    if Keyframes is None:
+        pytest.skip("Video backend does not report keyframes")
+    assert Keyframes[0] == 0 and (np.diff(Keyframes) > 0).all()
+    assert np.array_equal(VideoReader.LoadKeyframeIndex(Path, CacheDir=str(tmp_path / "Cache"), Build=False), Keyframes)
+
+def test_MultiVideoReader(tmp_path):
+    Paths = [WriteVideo(str(tmp_path / "Cam1.mp4")), WriteVideo(str(tmp_path / "Cam2.mp4"), 50)]
+    Expected = [ReadSequential(Path) for Path in Paths]
+
+    with VideoReader.MultiVideoReader(Paths, FrameDiffs=[0, 3]) as Reader:
+        Out = list(Reader)
+    assert [frame for frame, _ in Out] == list(range(NumFrames))
+    for frame, Images in Out:
+        assert np.array_equal(Images[0], Expected[0][frame])
+        if 3 <= frame < 53:
+            assert np.array_equal(Images[1], Expected[1][frame - 3])
+        else:
+            #before start of camera 2, and after its end while camera 1 continues
+            assert Images[1] is None
+
+    Frames = [50, 2, 10, 52, 57, 30]
+    with VideoReader.MultiVideoReader(Paths, FrameDiffs=[0, 3], Frames=Frames, MaxGrab=2) as Reader:
+        Out = list(Reader)
+    assert [frame for frame, _ in Out] == sorted(Frames)
+    for frame, Images in Out:
+        assert np.array_equal(Images[0], Expected[0][frame])
+        assert Images[1] is None if frame >= 53 or frame < 3 else np.array_equal(Images[1], Expected[1][frame - 3])
+
+def test_FrameCache():
+    Cache = VideoReader.FrameCache(MaxBytes=3*100)
+    for frame in range(4):
+        Cache.put("Cam1.mp4", frame, np.full(100, frame, dtype=np.uint8))
+    assert len(Cache) == 3 and Cache.get("Cam1.mp4", 0) is None
+    img = Cache.get("Cam1.mp4", 1)
+    img[:] = 255
+    assert (Cache.get("Cam1.mp4", 1) == 1).all()
+    Cache.put("Cam1.mp4", 4, np.zeros(100, dtype=np.uint8)) #frame 2 is least recently used now
+    assert Cache.get("Cam1.mp4", 2) is None and Cache.get("Cam1.mp4", 1) is not None
+    assert Cache.GetStats()["Hits"] == 3
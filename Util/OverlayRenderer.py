@@ -0,0 +1,186 @@
+# !/usr/bin/env python3
+""" Vectorized overlay renderer for 3DPOP ground truth, draws a whole frame from frame indexed keypoint arrays"""
+import cv2
+import numpy as np
+
+from Util.VisualizeUtil import getColor, getType
+
+#custom colours for trajectory/ bbox of each bird:
+TrajColours = [(255, 0 , 0 ),(0,255,0), (0,0,255),(255,255,0),(255, 0 , 255),(0, 255, 255),(63,133,205),(128,0,128),(203,192,255),(0,165,255)]
+
+#skeleton edges (keypoint 1, keypoint 2, colour)
+SkeletonEdges = [("leftEye","nose",[0,0,255]),
+                 ("rightEye","nose",[0,0,255]),
+                 ("beak","nose",[0,0,255]),
+                 ("leftEye","rightEye",[0,0,255]),
+                 ("leftShoulder","rightShoulder",[0,255,0]),
+                 ("leftShoulder","topKeel",[0,255,0]),
+                 ("topKeel","rightShoulder",[0,255,0]),
+                 ("leftShoulder","tail",[0,255,0]),
+                 ("tail","rightShoulder",[0,255,0]),
+                 ("tail","bottomKeel",[0,255,0]),
+                 ("bottomKeel","topKeel",[0,255,0])]
+
+
+class OverlayRenderer:
+
+    def __init__(self, KeypointStore, BBoxStore, Dim, BirdList=None,
+                 points=True, Lines=False, BBox=False, Traj=False, MarkersOnly=False,
+                 TrajLength=150, Colours=TrajColours):
+        """
+        Renderer for keypoints, skeleton, bbox and trajectories of all birds in a frame.
+        Colour, type and skeleton lookup tables are built once per bird here, every frame is then
+        drawn from one (birds, keypoints, 2) array with invalid points masked out by numpy.
+        Draws the same as the old per keypoint dictionary loop in Trial.VisualizeTrainingData
+
+        Input:
+        KeypointStore [KeypointStore]: store of 2D keypoints, see CameraObject.GetKeypointStore
+        BBoxStore [KeypointStore]: store of bbox (Dim 4), only needed for BBox/ Traj
+        Dim [tuple]: (width,height) of image, points outside are not drawn
+        BirdList [list]: bird IDs to draw, default all subjects of KeypointStore
+        points, Lines, BBox, Traj, MarkersOnly [bool]: what to draw, see Trial.VisualizeTrainingData
+        TrajLength [int]: number of past frames of trajectory to draw
+        Colours [list]: colour of each bird for bbox and trajectory
+        """
+        self.Store = KeypointStore
+        self.BBoxStore = BBoxStore
+        self.Dim = Dim
+        self.BirdList = list(BirdList) if BirdList is not None else list(KeypointStore.Subjects)
+        self.points = points
+        self.Lines = Lines
+        self.BBox = BBox
+        self.Traj = Traj
+        self.MarkersOnly = MarkersOnly
+        self.TrajLength = TrajLength
+        self.Colours = Colours
+
+        if (BBox or Traj) and BBoxStore is None:
+            raise ValueError("BBox store needed to draw bbox or trajectories")
+
+        ##Birds with data, index in keypoint and bbox stores
+        self.BirdIndex = []
+        self.BBoxIndex = []
+        self.ColourIndex = []
+        for k, bird in enumerate(self.BirdList):
+            if not KeypointStore.HasBird(bird):
+                continue
+            self.BirdIndex.append(KeypointStore.BirdIndex[bird])
+            self.BBoxIndex.append(BBoxStore.BirdIndex[bird] if BBoxStore is not None and BBoxStore.HasBird(bird) else -1)
+            self.ColourIndex.append(k)
+        self.BirdIndex = np.array(self.BirdIndex, dtype=np.int64)
+        self.BBoxIndex = np.array(self.BBoxIndex, dtype=np.int64)
+
+        ##Lookup tables per bird
+        self.PointPasses = [] #per bird: list of (keypoint indexes, radius, colours), drawn in order
+        self.Edges = [] #per bird: list of (keypoint index 1, keypoint index 2, colour)
+        for b in self.BirdIndex:
+            bird = KeypointStore.Subjects[b]
+            Names = ["%s_%s"%(bird, Name) for Name in KeypointStore.Keypoints[bird]]
+            self.PointPasses.append(self.BuildPointPasses(Names))
+            self.Edges.append(self.BuildEdges(Names))
+
+        ##Trajectory ring buffers of bbox mid points
+        self.TrajPoints = np.zeros((len(self.BirdIndex), TrajLength, 2), dtype=np.int32)
+        self.TrajCount = np.zeros(len(self.BirdIndex), dtype=np.int64) #number of points pushed so far
+
+    def BuildPointPasses(self, Names):
+        """Precompute which keypoints are drawn with which radius and colour"""
+        Types = [getType(Name) for Name in Names]
+        Colours = [getColor(Name) for Name in Names]
+
+        Passes = []
+        if self.MarkersOnly:
+            #motion tracking markers only, everything else is skipped
+            Index = [i for i in range(len(Names)) if Types[i] is None]
+            Passes.append((Index, 3, [Colours[i] for i in Index]))
+            Drawable = Index
+        else:
+            Drawable = list(range(len(Names)))
+
+        if self.Lines:
+            Index = [i for i in Drawable if Types[i] in ["Head", "Backpack"]]
+            Passes.append((Index, 2, [[0,255,255]]*len(Index)))
+        else:
+            Passes.append((Drawable, 1, [Colours[i] for i in Drawable]))
+
+        return [(np.array(Index, dtype=np.int64), Radius, np.array(PassColours, dtype=np.int64).reshape(-1, 3))
+                for Index, Radius, PassColours in Passes if len(Index) > 0]
+
+    def BuildEdges(self, Names):
+        """Keypoint index pairs of skeleton edges, edges with missing keypoints are left out"""
+        Edges = []
+        for Key1Short, Key2Short, Colour in SkeletonEdges:
+            Key1 = [i for i, Name in enumerate(Names) if Key1Short in Name]
+            Key2 = [i for i, Name in enumerate(Names) if Key2Short in Name]
+            if len(Key1) > 0 and len(Key2) > 0:
+                Edges.append((Key1[0], Key2[0], Colour))
+        return Edges
+
+    def reset(self):
+        """Clear trajectories, e.g when jumping to another frame"""
+        self.TrajCount[:] = 0
+
+    def PushTrajectory(self, i, MidPoint):
+        self.TrajPoints[i, self.TrajCount[i] % self.TrajLength] = MidPoint
+        self.TrajCount[i] += 1
+
+    def GetTrajectory(self, i):
+        """Points of trajectory of bird i in time order"""
+        Count = self.TrajCount[i]
+        if Count <= self.TrajLength:
+            return self.TrajPoints[i, :Count]
+        Head = Count % self.TrajLength
+        return np.concatenate([self.TrajPoints[i, Head:], self.TrajPoints[i, :Head]])
+
+    def Draw(self, img, frame):
+        """Draw overlay of given frame onto img (in place), returns img"""
+        Row = self.Store.GetRow(frame)
+        if Row is None or len(self.BirdIndex) == 0:
+            return img
+
+        ##All keypoints of frame at once
+        Points = self.Store.Data[Row, self.BirdIndex] #(birds, keypoints, 2)
+        Finite = np.isfinite(Points).all(axis=-1)
+        Rounded = np.round(np.where(Finite[..., None], Points, 0)).astype(np.int64)
+        InImage = Finite & (Rounded[..., 0] >= 0) & (Rounded[..., 0] <= self.Dim[0]) & (Rounded[..., 1] >= 0) & (Rounded[..., 1] <= self.Dim[1])
+        Rounded = Rounded.tolist()
+
+        ##BBox corners and mid points
+        if self.BBox or self.Traj:
+            BBoxRow = self.BBoxStore.GetRow(frame)
+            Corners = np.full((len(self.BirdIndex), 4), np.nan)
+            HasBBox = self.BBoxIndex >= 0
+            if BBoxRow is not None:
+                Corners[HasBBox] = self.BBoxStore.Data[BBoxRow, self.BBoxIndex[HasBBox], 0]
+            Corners[:, 2:] += Corners[:, :2]
+            BBoxValid = np.isfinite(Corners).all(axis=-1)
+            Corners = np.round(np.where(BBoxValid[:, None], Corners, 0))
+            MidPoints = np.round(Corners[:, :2] + (Corners[:, 2:] - Corners[:, :2])/2).astype(np.int32)
+            Corners = Corners.astype(np.int64).tolist()
+
+        for i in range(len(self.BirdIndex)):
+            Colour = self.Colours[self.ColourIndex[i] % len(self.Colours)]
+
+            if self.Lines:
+                for Key1, Key2, EdgeColour in self.Edges[i]:
+                    if Finite[i, Key1] and Finite[i, Key2]:
+                        cv2.line(img, Rounded[i][Key1], Rounded[i][Key2], EdgeColour, 2)
+
+            if self.Traj:
+                if not BBoxValid[i]:
+                    continue
+                self.PushTrajectory(i, MidPoints[i])
+                cv2.polylines(img, [self.GetTrajectory(i).reshape(-1, 1, 2)], False, Colour, 2)
+
+            if self.BBox:
+                if not BBoxValid[i]:
+                    continue
+                cv2.rectangle(img, Corners[i][:2], Corners[i][2:], Colour, 3)
+
+            if self.points:
+                for Index, Radius, PassColours in self.PointPasses[i]:
+                    Valid = InImage[i, Index]
+                    for KeyIndex, PointColour in zip(Index[Valid].tolist(), PassColours[Valid].tolist()):
+                        cv2.circle(img, Rounded[i][KeyIndex], Radius, PointColour, -1)
+
+        return img